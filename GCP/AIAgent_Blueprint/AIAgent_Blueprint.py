@@ -6,78 +6,85 @@
 
 #AIAgent_Blueprint.py
 
-import os
-import json
-import threading
-import time
-from datetime import datetime, timedelta
-from typing import Any, Mapping
+import importlib
 from flask import Flask, request, jsonify
 
 from api_config import configure_external_apis
-from chat_handler import get_ai_response, handle_added_to_space_event, send_message_to_chat
-from research_handler import handle_research
-from about_handler import handle_about
-
-# Google Cloud authentication
-from google.auth import default
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
+from task_executor import submit_background, install_sigterm_handler, QUEUE_FULL_TEXT
+from event_router import EventRouter, EVENT, COMMAND, ACTION
+from idempotency import idempotency_guard
+from log_config import setup_logging, get_logger, truncate, PAYLOAD
+from tracing import start_request, recent_traces, TRACING_ENABLED, DEBUG_TRACES_ENABLED
+import metrics
 import logging
 
-# The following imports are for specific handlers for different slash commands and card actions.
-# They are named generically here (e.g., form_handler_A) and should be renamed to reflect their actual purpose.
-from form_handler_A import (
-    get_data_from_sheet,
-    open_form_A_dialog,
-    open_confirmation_dialog,
-    submit_form_A
-)
-from form_handler_B import (
-    open_form_B_dialog,
-    route_form_B_step2
-)
-from form_handler_B_sub_A import build_form_B_step3_ai as build_sub_A_step3, openConfirmation as open_sub_A_confirmation, submitForm as submit_sub_A_form
-from form_handler_B_sub_B import build_form_B_step3_ai as build_sub_B_step3, openConfirmation as open_sub_B_confirmation, submitForm as submit_sub_B_form
+# Handler modules are imported lazily, when their route is first hit, so a cold start
+# of the serverless function only pays for Flask and the modules the event actually needs.
+# The handlers are named generically here (e.g., form_handler_A) and should be renamed
+# to reflect their actual purpose.
+def lazy_handler(module_name: str, function_name: str):
+    """Returns a handler function, importing its module on first use."""
+    return getattr(importlib.import_module(module_name), function_name)
+
+# Structured (JSON) logging, written by a background listener thread.
+# Level, format and per-category sampling are configured in log_config.py.
+setup_logging()
+payload_logger = get_logger(PAYLOAD)
 
 # Configure external APIs (e.g., Gemini) on startup.
 # Keys and credentials should be handled securely, for example via environment variables.
 
 configure_external_apis()
 
+# Let queued background work (research, document generation) finish on shutdown.
+install_sigterm_handler()
+
 app = Flask(__name__)
 
-# Basic logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+def send_message_to_chat(*args, **kwargs):
+    """Forwards to chat_handler.send_message_to_chat, importing the module on first use."""
+    return lazy_handler('chat_handler', 'send_message_to_chat')(*args, **kwargs)
 
 @app.route('/', methods=['POST'])
 def post(request):
     """Main endpoint to receive and route all incoming events."""
-    logging.info("Received a request")
-    try:
-        if not request.is_json:
-            logging.error("Request is not in JSON format")
-            return jsonify({"error": "Content-Type must be application/json"}), 415
-
-        event = request.get_json()
-        event_type = event.get('type')
-        logging.info(f"Event type: {event_type}")
-
-        # Route event based on its type
-        if event_type == 'MESSAGE':
-            body = on_message(event)
-        elif event_type == 'CARD_CLICKED':
-            body = on_card_click(event)
-        elif event_type == 'ADDED_TO_SPACE':
-            body = handle_added_to_space_event(event)
-        else:
-            body = {}
-
-        logging.info(f"Responding with body: {body}")
-        return jsonify(body)
-    except Exception as e:
-        logging.error(f"Error in post handler: {e}", exc_info=True)
-        return jsonify({"error": str(e)})
+    # As a Cloud Function, every path reaches this entry point.
+    if request.method == 'GET' and request.path == '/debug/traces':
+        return debug_traces()
+    if request.method == 'GET' and request.path == '/metrics':
+        return metrics_endpoint()
+    with start_request("chat_event") as request_span:
+        logging.info("Received a request")
+        try:
+            if not request.is_json:
+                logging.error("Request is not in JSON format")
+                return jsonify({"error": "Content-Type must be application/json"}), 415
+
+            event = request.get_json()
+            event_type = event.get('type')
+            request_span.set_attribute("event_type", event_type)
+            logging.info("Event type: %s", event_type)
+
+            # Route event based on its type
+            body = router.dispatch(EVENT, event_type, event, default={})
+
+            payload_logger.info("Responding with body: %s", truncate(body))
+            return jsonify(body)
+        except Exception as e:
+            logging.error("Error in post handler: %s", e, exc_info=True)
+            return jsonify({"error": str(e)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Exposes the process metrics in the Prometheus text format."""
+    return metrics.registry.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    """Returns the most recent traces from the in-process ring buffer (DEBUG_TRACES_ENABLED=true only)."""
+    if not (DEBUG_TRACES_ENABLED and TRACING_ENABLED):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(recent_traces(request.args.get('limit', 20, type=int)))
 
 def on_message(event: dict) -> dict:
     """Handles 'MESSAGE' events, including slash commands and direct messages."""
@@ -86,31 +93,19 @@ def on_message(event: dict) -> dict:
         slash_cmd = event.get('message', {}).get('slashCommand')
         if slash_cmd:
             command_id = slash_cmd.get('commandId')
-            logging.info(f"Slash command ID: {command_id}")
-            # Route based on slash command ID
-            if command_id == "1": # /about
-                return handle_about()
-            elif command_id == "2": # /research
-                argument_text = event.get('message', {}).get('argumentText', '').strip()
-                logging.info(f"Research argument: {argument_text}")
-                if not argument_text:
-                    return {'text': "Please provide a topic for research, e.g., /research Impact of AI on the job market."}
-                space_name = event.get('space', {}).get('name')
-                thread_name = event.get('thread', {}).get('name')
-                # Run research in a separate thread to avoid blocking
-                threading.Thread(target=handle_research, args=(argument_text, space_name, thread_name)).start()
-                return {'text': "Research in progress. The results will be posted shortly..."}
-            elif command_id == "3": # /form_a
-                return open_form_A_dialog()
-            elif command_id == "4": # /form_b
-                return open_form_B_dialog()
+            logging.info("Slash command ID: %s", command_id)
+            # Route based on slash command ID; unknown commands are handled as plain text
+            body = router.dispatch(COMMAND, command_id, event)
+            if body is not None:
+                return body
 
         # Handle plain text messages
         user_message_text = event.get('message', {}).get('text', '').strip()
-        logging.info(f"User message: {user_message_text}")
+        payload_logger.info("User message: %s", truncate(user_message_text))
         if not user_message_text:
             return {'text': "Sorry, I could not understand your message. The text is empty."}
 
+        get_ai_response = lazy_handler('chat_handler', 'get_ai_response')
         # Differentiate between a standard chat and a research query
         if user_message_text.lower().startswith('/research'):
             query = user_message_text[len('/research'):].strip()
@@ -123,54 +118,77 @@ def on_message(event: dict) -> dict:
             return {'text': ai_response_text}
 
     except Exception as e:
-        logging.error(f"Error in on_message handler: {e}", exc_info=True)
+        logging.error("Error in on_message handler: %s", e, exc_info=True)
         return {'text': f"An error occurred: {e}"}
 
+def on_research_command(event: dict) -> dict:
+    """Handles the /research slash command by starting the research in the background."""
+    argument_text = event.get('message', {}).get('argumentText', '').strip()
+    payload_logger.info("Research argument: %s", truncate(argument_text))
+    if not argument_text:
+        return {'text': "Please provide a topic for research, e.g., /research Impact of AI on the job market."}
+    space_name = event.get('space', {}).get('name')
+    thread_name = event.get('thread', {}).get('name')
+    # Run research on the background pool to avoid blocking
+    handle_research = lazy_handler('research_handler', 'handle_research')
+    if not submit_background(handle_research, argument_text, space_name, thread_name):
+        return {'text': QUEUE_FULL_TEXT}
+    return {'text': "Research in progress. The results will be posted shortly..."}
+
 def on_card_click(event: dict) -> dict:
     """Handles 'CARD_CLICKED' events from interactive cards."""
     logging.info("Handling a 'CARD_CLICKED' event")
     try:
         invoked_function = event.get('common', {}).get('invokedFunction')
-        logging.info(f"Invoked function: {invoked_function}")
+        logging.info("Invoked function: %s", invoked_function)
 
         # Route based on the invoked function from the card
-        action_handlers = {
-            "openFormADialog": open_form_A_dialog,
-            "openConfirmationDialog": lambda: open_confirmation_dialog(event),
-            "submitFormA": lambda: submit_form_A(event, send_message_to_chat),
-            "routeFormBStep2": lambda: route_form_B_step2(event, send_message_to_chat),
-            "form_handler_B_sub_A.build_form_B_step3_ai": lambda: build_sub_A_step3(event, send_message_to_chat),
-            "form_handler_B_sub_A.openConfirmation": lambda: open_sub_A_confirmation(event),
-            "form_handler_B_sub_A.submitForm": lambda: submit_sub_A_form(event, send_message_to_chat),
-            "form_handler_B_sub_B.build_form_B_step3_ai": lambda: build_sub_B_step3(event, send_message_to_chat),
-            "form_handler_B_sub_B.openConfirmation": lambda: open_sub_B_confirmation(event),
-            "form_handler_B_sub_B.submitForm": lambda: submit_sub_B_form(event, send_message_to_chat),
-        }
-
-        handler = action_handlers.get(invoked_function)
-        if handler:
-            return handler()
-        else:
-            logging.warning(f"No handler found for invoked function: {invoked_function}")
-            return {}
+        return router.dispatch(ACTION, invoked_function, event, default={})
 
     except Exception as e:
-        logging.error(f"Error in on_card_click handler: {e}", exc_info=True)
+        logging.error("Error in on_card_click handler: %s", e, exc_info=True)
         return {}
 
-# Initialize Google API clients.
+# --- Route registry ---
+# Built once at import. Adding a new command or form only takes a registration here.
+# Routes that start work (research, AI extraction, document generation) are wrapped in
+# idempotency_guard, so a retried Chat event returns the original response instead of
+# starting the work again.
+router = EventRouter()
+
+# Event types
+router.register_event('MESSAGE', on_message)
+router.register_event('CARD_CLICKED', on_card_click)
+router.register_event('ADDED_TO_SPACE', lambda event: lazy_handler('chat_handler', 'handle_added_to_space_event')(event))
+
+# Slash commands
+router.register_command("1", lambda event: lazy_handler('about_handler', 'handle_about')())              # /about
+router.register_command("2", idempotency_guard.wrap("research", on_research_command))                   # /research
+router.register_command("3", lambda event: lazy_handler('form_handler_A', 'open_form_A_dialog')())       # /form_a
+router.register_command("4", lambda event: lazy_handler('form_handler_B', 'open_form_B_dialog')())       # /form_b
+
+# Card actions: Form A
+router.register_action("openFormADialog", lambda event: lazy_handler('form_handler_A', 'open_form_A_dialog')())
+router.register_action("openConfirmationDialog", lambda event: lazy_handler('form_handler_A', 'open_confirmation_dialog')(event))
+router.register_action("submitFormA", idempotency_guard.wrap("submitFormA", lambda event: lazy_handler('form_handler_A', 'submit_form_A')(event, send_message_to_chat)))
+
+# Card actions: Form B
+# 'openFormBDialog' is used by the /about card and 'route_form_B_step2' by the Form B dialog.
+router.register_action("openFormBDialog", lambda event: lazy_handler('form_handler_B', 'open_form_B_dialog')())
+route_form_B_step2 = lambda event: lazy_handler('form_handler_B', 'route_form_B_step2')(event, send_message_to_chat)
+router.register_action("routeFormBStep2", route_form_B_step2)
+router.register_action("route_form_B_step2", route_form_B_step2)
+for sub_module in ('form_handler_B_sub_A', 'form_handler_B_sub_B'):
+    router.register_action(f"{sub_module}.build_form_B_step3_ai", idempotency_guard.wrap(f"{sub_module}.build_form_B_step3_ai", lambda event, m=sub_module: lazy_handler(m, 'build_form_B_step3_ai')(event, send_message_to_chat)))
+    router.register_action(f"{sub_module}.openConfirmation", lambda event, m=sub_module: lazy_handler(m, 'openConfirmation')(event))
+    router.register_action(f"{sub_module}.submitForm", idempotency_guard.wrap(f"{sub_module}.submitForm", lambda event, m=sub_module: lazy_handler(m, 'submitForm')(event, send_message_to_chat)))
+
+# Google API clients (Gmail, Sheets, Drive, Slides) are not initialized at import time.
+# Get them from google_clients where they are needed, e.g. google_clients.get_gmail_service();
+# each client is built on first use and then shared for the lifetime of the process.
 # Ensure that the service account has the necessary permissions (e.g., Gmail API).
 # The credentials will be automatically discovered if the application is running
 # in a Google Cloud environment. For local development, set up Application Default Credentials.
-try:
-    credentials, project_id = default()
-    gmail_service = build("gmail", "v1", credentials=credentials)
-    # You can initialize other services here, e.g., Google Sheets
-    # sheets_service = build("sheets", "v4", credentials=credentials)
-except Exception as e:
-    logging.error(f"Failed to initialize Google API services: {e}", exc_info=True)
-    gmail_service = None
-    # sheets_service = None
 
 # To run this locally, you can use:
 # if __name__ == '__main__':
@@ -5,12 +5,14 @@
 
 #about_handler.py
 
+import logging
+
 def handle_about():
     """
     Returns a dialog response for the /about command in the chat.
     This card provides a brief description of the agent and its commands.
     """
-    print("(about_handler.py)[handle_about] Function called")
+    logging.info("(about_handler.py)[handle_about] Function called")
     return {
         "actionResponse": {
             "type": "DIALOG",
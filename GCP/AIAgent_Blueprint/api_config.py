@@ -5,8 +5,8 @@
 
 # api_config.py
 
+import logging
 import os
-import google.generativeai as genai
 
 # It's recommended to use environment variables for credential paths.
 # For local development, you can set GOOGLE_APPLICATION_CREDENTIALS.
@@ -14,14 +14,15 @@ import google.generativeai as genai
 
 def configure_external_apis():
     """Configures the generative AI API."""
-    print("(api_config.py)[configure_external_apis] Configuring external APIs")
+    logging.info("(api_config.py)[configure_external_apis] Configuring external APIs")
     try:
         # The genai.configure() call might not be necessary if credentials are
         # set via environment variables, but it's good practice to have an explicit setup function.
         # If an API key is used, it would be configured here, e.g., genai.configure(api_key="YOUR_API_KEY")
-        print("(api_config.py)[configure_external_apis] External APIs configured successfully.")
+        # (import google.generativeai inside this function to keep the module cheap to import).
+        logging.info("(api_config.py)[configure_external_apis] External APIs configured successfully.")
     except Exception as e:
-        print(f"(api_config.py)[configure_external_apis] Error configuring APIs: {e}")
+        logging.error("(api_config.py)[configure_external_apis] Error configuring APIs: %s", e)
 
 # Generic model names, mapping to specific versions can be done here.
 AI_MODEL_FAST = 'gemini-1.5-flash' # A fast, general-purpose model
@@ -43,3 +44,28 @@ SYSTEM_INSTRUCTION_PRO = (
     "Respond as if in a chat message, not a scientific article. "
     "Do not use bolding, headers, lists, Markdown, or HTML. Respond only with plain text."
 )
+
+# --- Shared infrastructure ---
+# Redis is used by the background task queue and, optionally, by the response cache.
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+
+# --- AI response cache ---
+# Backend: 'memory' (per-process LRU with TTL) or 'redis' (shared between instances).
+AI_CACHE_BACKEND = os.environ.get('AI_CACHE_BACKEND', 'memory')
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 512))
+AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', 3600))
+# Caching is opt-in per mode. FAST answers are short FAQ-style replies and cache well;
+# PRO (research) answers are expected to be fresh, so they are not cached by default.
+AI_CACHE_FAST_ENABLED = os.environ.get('AI_CACHE_FAST_ENABLED', 'true').lower() == 'true'
+AI_CACHE_PRO_ENABLED = os.environ.get('AI_CACHE_PRO_ENABLED', 'false').lower() == 'true'
+
+# --- Idempotency of chat events ---
+# Google Chat retries an event when the synchronous response is slow. Responses to actions
+# that start work (form submissions, research) are remembered for this long, so a retried
+# event gets the original response back instead of starting the work a second time.
+# Backend: 'memory' (per-process) or 'redis' (shared between instances).
+IDEMPOTENCY_BACKEND = os.environ.get('IDEMPOTENCY_BACKEND', 'memory')
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 600))
+# How long a duplicate waits for the original event to finish before it gets a "still processing" reply
+# (memory backend only; with Redis the reply is immediate).
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 5))
@@ -0,0 +1,152 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file contains an ASGI (FastAPI) entry point for the AI Agent, next to the Flask one
+# in AIAgent_Blueprint.py. Chat messages and /research are handled with asyncio, so one
+# process can serve many concurrent chat events while they wait on Gemini or the Chat API.
+
+# asgi_app.py
+
+import asyncio
+import contextvars
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict
+
+from AIAgent_Blueprint import router
+from event_router import EVENT
+from async_clients import get_ai_response_async, send_message_to_chat_async, close_async_client
+from tracing import start_request, recent_traces, TRACING_ENABLED, DEBUG_TRACES_ENABLED
+from task_executor import QUEUE_FULL_TEXT, BACKGROUND_WORKERS, BACKGROUND_QUEUE_DEPTH, BACKGROUND_DRAIN_TIMEOUT
+from idempotency import idempotency_guard
+import metrics
+
+RESEARCH_COMMAND_ID = "2"
+RESEARCH_PREFIX = "**Detailed Research Results:**\n\n"
+RESEARCH_HINT = "Please provide a topic for research, e.g., /research Impact of AI on the job market."
+
+# Maximum number of /research tasks running at once; further commands get QUEUE_FULL_TEXT.
+# Defaults to the capacity of the background pool the Flask entry point uses for them.
+ASGI_RESEARCH_MAX_TASKS = int(os.environ.get('ASGI_RESEARCH_MAX_TASKS', BACKGROUND_WORKERS + BACKGROUND_QUEUE_DEPTH))
+
+# References to running research tasks, so they are not garbage-collected before they finish.
+_background_tasks = set()
+_research_slots = asyncio.Semaphore(ASGI_RESEARCH_MAX_TASKS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Let research answers in flight be posted before the client is closed.
+    if _background_tasks:
+        logging.info("(asgi_app.py)[lifespan] Waiting for %s research tasks.", len(_background_tasks))
+        _, pending = await asyncio.wait(set(_background_tasks), timeout=BACKGROUND_DRAIN_TIMEOUT)
+        if pending:
+            logging.warning("(asgi_app.py)[lifespan] %s research tasks did not finish before shutdown.", len(pending))
+    await close_async_client()
+
+app = FastAPI(title="AI Agent Blueprint (ASGI)", lifespan=lifespan)
+
+#PYDANTIC (VALIDATION)
+class ChatEvent(BaseModel):
+    """An incoming Google Chat event. Only the type is required; all other fields are kept."""
+    model_config = ConfigDict(extra='allow')
+    type: str
+
+#ENDPOINT
+@app.post("/")
+async def post(chat_event: ChatEvent):
+    """
+    Main endpoint to receive and route all incoming events.
+    Plain messages and /research run natively on the event loop; all other events
+    use the synchronous route registry in a worker thread.
+    """
+    event = chat_event.model_dump()
+    with start_request("chat_event", event_type=chat_event.type):
+        logging.info("(asgi_app.py)[post] Event type: %s", chat_event.type)
+        try:
+            if chat_event.type == 'MESSAGE':
+                slash_cmd = event.get('message', {}).get('slashCommand')
+                if not slash_cmd:
+                    return await on_message_async(event)
+                if slash_cmd.get('commandId') == RESEARCH_COMMAND_ID:
+                    return await on_research_command_async(event)
+            # run_in_threadpool copies the context, so the request ID follows into the thread.
+            return await run_in_threadpool(router.dispatch, EVENT, chat_event.type, event, {})
+        except Exception as e:
+            logging.error("(asgi_app.py)[post] Error in post handler: %s", e, exc_info=True)
+            return {"error": str(e)}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Exposes the process metrics in the Prometheus text format."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20):
+    """Returns the most recent traces from the in-process ring buffer (DEBUG_TRACES_ENABLED=true only)."""
+    if not (DEBUG_TRACES_ENABLED and TRACING_ENABLED):
+        raise HTTPException(status_code=404, detail="Not found")
+    return recent_traces(limit)
+
+async def on_message_async(event: dict) -> dict:
+    """Async version of AIAgent_Blueprint.on_message for plain text messages."""
+    user_message_text = event.get('message', {}).get('text', '').strip()
+    if not user_message_text:
+        return {'text': "Sorry, I could not understand your message. The text is empty."}
+
+    if user_message_text.lower().startswith('/research'):
+        query = user_message_text[len('/research'):].strip()
+        if not query:
+            return {'text': RESEARCH_HINT}
+        ai_response_text = await get_ai_response_async(query, research_mode=True)
+        return {'text': f"{RESEARCH_PREFIX}{ai_response_text}"}
+    ai_response_text = await get_ai_response_async(user_message_text, research_mode=False)
+    return {'text': ai_response_text}
+
+async def on_research_command_async(event: dict) -> dict:
+    """
+    Handles the /research slash command like AIAgent_Blueprint.on_research_command: a retried
+    event gets the original response (idempotency_guard), and at most ASGI_RESEARCH_MAX_TASKS
+    research tasks run at once. The guard runs in a worker thread, as its store may be Redis.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+
+    def start(event):
+        return asyncio.run_coroutine_threadsafe(start_research_task(event, context), loop).result()
+
+    return await run_in_threadpool(idempotency_guard.run, event, start, "research")
+
+async def start_research_task(event: dict, context=None) -> dict:
+    """
+    Starts the /research query as an asyncio task and answers the event immediately.
+    The task is created in `context` (the request's), so its spans belong to the request trace.
+    """
+    argument_text = event.get('message', {}).get('argumentText', '').strip()
+    if not argument_text:
+        return {'text': RESEARCH_HINT}
+    if _research_slots.locked():
+        return {'text': QUEUE_FULL_TEXT}
+    await _research_slots.acquire()
+    space_name = event.get('space', {}).get('name')
+    thread_name = event.get('thread', {}).get('name')
+
+    async def research_and_send():
+        try:
+            ai_response_text = await get_ai_response_async(argument_text, research_mode=True)
+            await send_message_to_chat_async(space_name, thread_name, f"{RESEARCH_PREFIX}{ai_response_text}")
+        except Exception as e:
+            logging.error("(asgi_app.py)[research_and_send] Research task failed: %s", e, exc_info=True)
+        finally:
+            _research_slots.release()
+
+    task = (context or contextvars.copy_context()).run(asyncio.create_task, research_and_send())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {'text': "Research in progress. The results will be posted shortly..."}
+
+# Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 8080
@@ -0,0 +1,106 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file contains asyncio versions of the agent's outbound calls (Gemini, Chat REST API),
+# used by the ASGI entry point in asgi_app.py.
+
+# async_clients.py
+
+import asyncio
+import logging
+import time
+import httpx
+from chat_handler import (
+    select_model,
+    get_generative_model,
+    get_access_token_from_service_account,
+    chat_token_provider
+)
+from response_cache import response_cache, make_cache_key
+from http_client import CHAT_HTTP_POOL_SIZE, CHAT_HTTP_CONNECT_TIMEOUT, CHAT_HTTP_READ_TIMEOUT
+from tracing import span
+from metrics import record_ai_call, CHAT_API_RESPONSES
+
+_async_client = None
+
+def get_async_client():
+    """
+    Returns the shared httpx.AsyncClient. It keeps a pool of keep-alive connections,
+    so concurrent chat events reuse connections instead of each opening their own.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=CHAT_HTTP_POOL_SIZE * 10, max_keepalive_connections=CHAT_HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(CHAT_HTTP_READ_TIMEOUT, connect=CHAT_HTTP_CONNECT_TIMEOUT)
+        )
+    return _async_client
+
+async def close_async_client():
+    """Closes the shared client, e.g. when the ASGI app shuts down."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def get_ai_response_async(user_query: str, research_mode: bool = False) -> str:
+    """
+    Async version of chat_handler.get_ai_response. Uses the same model registry
+    and response cache, but awaits Gemini instead of blocking a worker thread.
+    """
+    model_name, system_instruction, cache_enabled = select_model(research_mode)
+    try:
+        if cache_enabled:
+            cache_key = make_cache_key(user_query, model_name, system_instruction)
+            # The cache calls run in a thread: with the Redis backend they would block the event loop.
+            cached_text = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached_text is not None:
+                return cached_text
+
+        model = get_generative_model(model_name, system_instruction)
+        start = time.perf_counter()
+        try:
+            with span("gemini.generate_content", model=model_name):
+                response = await model.generate_content_async(user_query)
+        except Exception:
+            record_ai_call(model_name, time.perf_counter() - start, status="error")
+            raise
+        record_ai_call(model_name, time.perf_counter() - start, response)
+        if cache_enabled:
+            await asyncio.to_thread(response_cache.set, cache_key, response.text)
+        return response.text
+    except Exception as e:
+        logging.error("(async_clients.py)[get_ai_response_async] Error during AI response generation: %s", e, exc_info=True)
+        return "Sorry, there was a problem with the AI. Please try again later."
+
+async def send_message_to_chat_async(space_name, thread_name, text, card=None):
+    """
+    Async version of chat_handler.send_message_to_chat.
+    Returns the resource name of the created message, or None if sending failed.
+    """
+    # The token is cached, so this only blocks a thread when it has to be refreshed.
+    access_token = await asyncio.to_thread(get_access_token_from_service_account)
+    if not access_token:
+        logging.error("(async_clients.py)[send_message_to_chat_async] Missing bot token to send messages.")
+        return None
+
+    body = {"text": text}
+    if thread_name:
+        body["thread"] = {"name": thread_name}
+    if card:
+        body["cardsV2"] = [{"cardId": "interactiveCard", "card": card}]
+
+    with span("chat.messages.create") as chat_span:
+        response = await get_async_client().post(
+            f"https://chat.googleapis.com/v1/{space_name}/messages",
+            headers={"Authorization": f"Bearer {access_token}"},
+            json=body
+        )
+        chat_span.set_attribute("status_code", response.status_code)
+    CHAT_API_RESPONSES.inc("create", str(response.status_code))
+    if response.status_code == 401:
+        chat_token_provider.invalidate()
+    logging.info("(async_clients.py)[send_message_to_chat_async] Message sending status: %s", response.status_code)
+    if response.is_error:
+        return None
+    return response.json().get("name")
@@ -0,0 +1,152 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This load test compares requests/sec of the Flask entry point (AIAgent_Blueprint.py)
+# and the ASGI entry point (asgi_app.py) for plain chat messages, with Gemini replaced
+# by a local stub that answers after a fixed latency.
+
+# bench_asgi_vs_flask.py
+#
+# Usage: python benchmarks/bench_asgi_vs_flask.py [--requests 400] [--concurrency 100]
+#        [--flask-workers 8] [--ai-latency 0.2]
+# --flask-workers emulates a WSGI server with a fixed number of worker threads
+# (e.g. gunicorn --threads 8); the ASGI app runs as a single uvicorn process.
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flask
+import httpx
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+# Keep the handlers' own output out of the report.
+REPORT = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+
+import AIAgent_Blueprint
+import asgi_app
+import async_clients
+import chat_handler
+
+logging.disable(logging.CRITICAL)
+
+class StubModel:
+    """Stands in for a Gemini model: answers every prompt after `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _response(self, prompt):
+        class Response:
+            text = f"Stub answer to: {prompt}"
+        return Response()
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency)
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._response(prompt)
+
+def install_stub_model(latency):
+    stub = StubModel(latency)
+    chat_handler.get_generative_model = lambda model_name, system_instruction: stub
+    async_clients.get_generative_model = lambda model_name, system_instruction: stub
+    # Every request must reach the model, so the response cache is switched off.
+    chat_handler.AI_CACHE_FAST_ENABLED = False
+
+def flask_wsgi_app(environ, start_response):
+    """Calls the Flask entry point the way Cloud Functions does: post(request)."""
+    with AIAgent_Blueprint.app.request_context(environ):
+        response = AIAgent_Blueprint.post(flask.request)
+        return response(environ, start_response)
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server that handles requests on a fixed number of worker threads."""
+
+    def __init__(self, host, port, app, workers):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+def start_flask(workers):
+    server = PooledWSGIServer("127.0.0.1", 0, flask_wsgi_app, workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/", server.shutdown
+
+def start_asgi():
+    config = uvicorn.Config(asgi_app.app, host="127.0.0.1", port=0, log_level="critical", lifespan="on")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    def stop():
+        server.should_exit = True
+    return f"http://127.0.0.1:{port}/", stop
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def load(url, total, concurrency):
+    """Sends `total` chat events with `concurrency` in flight; returns (req/s, latencies ms)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def one(index):
+            async with semaphore:
+                event = {"type": "MESSAGE", "message": {"text": f"Benchmark question {index}"}}
+                start = time.perf_counter()
+                response = await client.post(url, json=event)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Flask vs ASGI load test")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--flask-workers", type=int, default=8)
+    parser.add_argument("--ai-latency", type=float, default=0.2, help="Stub Gemini latency in seconds")
+    args = parser.parse_args()
+
+    install_stub_model(args.ai_latency)
+
+    print(f"{'entry point':<22}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}", file=REPORT)
+    for name, start in ((f"Flask ({args.flask_workers} threads)", lambda: start_flask(args.flask_workers)),
+                        ("ASGI (1 process)", start_asgi)):
+        url, stop = start()
+        rps, latencies = asyncio.run(load(url, args.requests, args.concurrency))
+        stop()
+        print(f"{name:<22}{rps:>10.1f}{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}", file=REPORT)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares posting chat messages with module-level requests.post
+# against the pooled session from http_client.py, using a local stub HTTP server.
+
+# bench_chat_http.py
+#
+# Usage: python benchmarks/bench_chat_http.py [--messages 200] [--threads 4]
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from http_client import build_session
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Answers every POST like the Chat API does and counts opened connections."""
+    protocol_version = "HTTP/1.1" # Required for keep-alive
+    disable_nagle_algorithm = True # Headers and body are written separately
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = json.dumps({"name": "spaces/AAA/messages/BBB"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run(post, url, messages, threads):
+    """Posts `messages` messages from `threads` threads and returns the latencies in ms."""
+    body = {"text": "Benchmark message", "thread": {"name": "spaces/AAA/threads/CCC"}}
+    headers = {"Authorization": "Bearer benchmark", "Content-Type": "application/json"}
+
+    def send_one(_):
+        start = time.perf_counter()
+        response = post(url, headers=headers, json=body)
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(send_one, range(messages)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat API HTTP pooling benchmark")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/spaces/AAA/messages"
+    session = build_session(pool_size=args.threads)
+
+    print(f"{'variant':<16}{'connections':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, post in (("requests.post", requests.post), ("pooled session", session.post)):
+        server.connections = 0
+        latencies = run(post, url, args.messages, args.threads)
+        print(f"{name:<16}{server.connections:>12}{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark measures the cold start of the agent: the `-X importtime` profile of
+# AIAgent_Blueprint and the time to the first response for each main event type,
+# each in a fresh interpreter.
+
+# bench_cold_start.py
+#
+# Usage: python benchmarks/bench_cold_start.py [--runs 3]
+# The events used here are answered without calling Gemini or Google APIs.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EVENTS = {
+    "MESSAGE": {
+        "type": "MESSAGE",
+        "message": {"slashCommand": {"commandId": "1"}, "text": "/about"},
+        "space": {"name": "spaces/AAA", "type": "ROOM"}
+    },
+    "CARD_CLICKED": {
+        "type": "CARD_CLICKED",
+        "common": {
+            "invokedFunction": "routeFormBStep2",
+            "formInputs": {"form_b_subtype": {"stringInputs": {"value": ["SUB_A"]}}}
+        },
+        "space": {"name": "spaces/AAA", "type": "ROOM"}
+    },
+    "ADDED_TO_SPACE": {
+        "type": "ADDED_TO_SPACE",
+        "space": {"name": "spaces/AAA", "type": "ROOM"}
+    },
+}
+
+# Runs inside the fresh interpreter: imports the app and answers one event.
+FIRST_RESPONSE_SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+import AIAgent_Blueprint
+imported = time.perf_counter()
+logging.disable(logging.CRITICAL)
+event = json.loads(sys.argv[1])
+with AIAgent_Blueprint.app.test_request_context('/', method='POST', json=event) as ctx:
+    AIAgent_Blueprint.post(ctx.request)
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_response_ms": (done - start) * 1000}))
+"""
+
+def run_python(args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+def import_profile():
+    """Returns the total self import time in ms and the slowest top-level imports."""
+    result = run_python(["-X", "importtime", "-c", "import AIAgent_Blueprint"])
+    total_us = 0
+    pending = []
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        # Modules are reported after their own imports, indented by two spaces per level.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            pending.append((int(cumulative_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == "AIAgent_Blueprint":
+                top_level = pending
+            pending = []
+    return total_us / 1000, sorted(top_level, reverse=True)[:10]
+
+def first_response(event, runs):
+    """Returns the best import and first-response times over `runs` fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        wall_start = time.perf_counter()
+        result = run_python(["-c", FIRST_RESPONSE_SCRIPT, json.dumps(event)])
+        wall_ms = (time.perf_counter() - wall_start) * 1000
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample["process_ms"] = wall_ms
+        samples.append(sample)
+    return min(samples, key=lambda s: s["first_response_ms"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    total_ms, top_level = import_profile()
+    print(f"-X importtime total (self time of all modules): {total_ms:.1f} ms")
+    print("Slowest direct imports of AIAgent_Blueprint (cumulative):")
+    for cumulative_us, name in top_level:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    print()
+    print(f"{'event':<16}{'import ms':>12}{'first response ms':>20}{'process ms':>14}")
+    for name, event in EVENTS.items():
+        sample = first_response(event, args.runs)
+        print(f"{name:<16}{sample['import_ms']:>12.1f}{sample['first_response_ms']:>20.1f}{sample['process_ms']:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares one permissions.create call per user with drive_sharing.SharingService,
+# which merges grants into Drive batch requests, using a local mock of the Drive API.
+
+# bench_drive_sharing.py
+#
+# Usage: python benchmarks/bench_drive_sharing.py [--latency-ms 200] [--users 60] [--threads 16]
+# The mock sleeps --latency-ms per HTTP call (a batch request counts as one call). Scenarios:
+#   one file, many users  - a team-wide rollout from one caller; a third of the users already have access;
+#   concurrent submissions - --threads submissions at once, each sharing its own file with one user;
+#   repeated grant        - the same grant again, answered from the permission cache.
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drive_sharing import SharingService
+
+class FakeRequest:
+    def __init__(self, api, fn):
+        self.api = api
+        self.fn = fn
+
+    def execute(self):
+        self.api.http_call()
+        return self.fn()
+
+class FakeBatch:
+    def __init__(self, api, callback):
+        self.api = api
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.api.http_call()
+        for request_id, request in self.requests:
+            self.callback(request_id, request.fn(), None)
+
+class FakeDrive:
+    """permissions().create / permissions().list and new_batch_http_request over in-memory permissions."""
+
+    def __init__(self, latency, existing=None):
+        self.latency = latency
+        self.calls = 0
+        self.permissions_by_file = existing or {}
+        self._lock = threading.Lock()
+
+    def http_call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def permissions(self):
+        return self
+
+    def create(self, fileId, body, **kwargs):
+        def apply():
+            with self._lock:
+                permissions = self.permissions_by_file.setdefault(fileId, [])
+                permissions.append({'type': 'user', 'emailAddress': body['emailAddress'], 'role': body['role']})
+                return {'id': f"perm{len(permissions)}"}
+        return FakeRequest(self, apply)
+
+    def list(self, fileId, **kwargs):
+        return FakeRequest(self, lambda: {'permissions': list(self.permissions_by_file.get(fileId, []))})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+def share_one_by_one(drive, file_id, emails, role):
+    for email in emails:
+        drive.permissions().create(
+            fileId=file_id, body={'type': 'user', 'role': role, 'emailAddress': email},
+            sendNotificationEmail=False, supportsAllDrives=True, fields='id'
+        ).execute()
+
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive permission grant benchmark")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    emails = [f"user{i}@example.com" for i in range(args.users)]
+    existing = {"team_file": [{'type': 'user', 'emailAddress': e, 'role': 'writer'} for e in emails[::3]]}
+    submissions = [(f"file{i}", f"requester{i}@example.com") for i in range(args.threads)]
+
+    def concurrent(share):
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(lambda s: share(*s), submissions))
+
+    print(f"{args.latency_ms:.0f} ms per HTTP call")
+    print(f"{'scenario':<24}{'mode':<14}{'calls':>7}{'time s':>9}")
+
+    drive = FakeDrive(latency, {k: list(v) for k, v in existing.items()})
+    elapsed = measure(lambda: share_one_by_one(drive, "team_file", emails, 'reader'))
+    print(f"{'one file, many users':<24}{'one by one':<14}{drive.calls:>7}{elapsed:>9.2f}")
+    drive = FakeDrive(latency, {k: list(v) for k, v in existing.items()})
+    service = SharingService(drive)
+    elapsed = measure(lambda: service.grant("team_file", emails, 'reader'))
+    print(f"{'':<24}{'batched':<14}{drive.calls:>7}{elapsed:>9.2f}")
+
+    drive = FakeDrive(latency)
+    elapsed = measure(lambda: concurrent(lambda f, e: share_one_by_one(drive, f, [e], 'writer')))
+    print(f"{'concurrent submissions':<24}{'one by one':<14}{drive.calls:>7}{elapsed:>9.2f}")
+    drive = FakeDrive(latency)
+    service = SharingService(drive)
+    elapsed = measure(lambda: concurrent(lambda f, e: service.grant(f, [e], 'writer')))
+    print(f"{'':<24}{'batched':<14}{drive.calls:>7}{elapsed:>9.2f}")
+
+    drive.calls = 0
+    elapsed = measure(lambda: concurrent(lambda f, e: service.grant(f, [e], 'writer')))
+    print(f"{'repeated grant':<24}{'batched':<14}{drive.calls:>7}{elapsed:>9.2f}")
+
+if __name__ == "__main__":
+    main()
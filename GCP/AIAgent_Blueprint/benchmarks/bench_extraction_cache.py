@@ -0,0 +1,76 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark measures the Form B step 3 extraction with and without extraction_cache.py,
+# using a stubbed Gemini model with a fixed latency.
+
+# bench_extraction_cache.py
+#
+# Usage: python benchmarks/bench_extraction_cache.py [--latency-ms 2500]
+# Runs Sub-type A extractions in the order a user goes through the form: the first pass,
+# a re-submit after correcting only a price, a re-submit after editing the notes, and a
+# re-submit after the prompt template was changed in code.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_handler
+import form_handler_B as utils
+import form_handler_B_sub_A as sub_A
+from extraction_cache import make_prompt_version
+
+NOTES = """Spotkanie z klientem. Firma chce uporządkować procesy sprzedaży,
+obecnie oferty przygotowuje ręcznie trzech handlowców. Budżet około 12 500 zł, rabat 10%."""
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+class FakeModel:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        fields = generation_config["response_schema"]["properties"]
+        return FakeResponse(json.dumps({key: f"generated {key}" for key in fields}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Form B extraction cache benchmark")
+    parser.add_argument("--latency-ms", type=float, default=2500)
+    args = parser.parse_args()
+
+    model = FakeModel(args.latency_ms / 1000)
+    chat_handler.get_generative_model = lambda *a: model
+    utils.client_names_snapshot.get = lambda: []
+
+    def change_prompt():
+        sub_A.PROMPT_VERSION = make_prompt_version(sub_A.EXTRACTION_PROMPT + "\nAnswer in Polish.", sub_A.EXTRACTION_FIELDS)
+
+    steps = [
+        ("first pass", NOTES, "8000", None),
+        ("price corrected", NOTES, "8500", None),
+        ("notes edited", NOTES + " Termin: marzec.", "8500", None),
+        ("prompt changed", NOTES + " Termin: marzec.", "8500", change_prompt),
+    ]
+    print(f"{args.latency_ms:.0f} ms per model call")
+    print(f"{'step':<18}{'model calls':>12}{'time ms':>10}")
+    for label, notes, price2, before in steps:
+        if before:
+            before()
+        calls = model.calls
+        start = time.perf_counter()
+        sub_A.call_ai_to_extract_data(notes, "2+4", "1 dzień", prices=("", price2), discount="")
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:<18}{model.calls - calls:>12}{elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
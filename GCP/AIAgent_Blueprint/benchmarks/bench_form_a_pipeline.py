@@ -0,0 +1,94 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares the Form A generation run step by step (the previous behaviour)
+# with the task graph in form_handler_A.generate_and_send, using stubbed steps with fixed latencies.
+
+# bench_form_a_pipeline.py
+#
+# Usage: python benchmarks/bench_form_a_pipeline.py [--scale 0.1]
+# The step latencies below are typical for Drive/Slides calls; --scale shortens them so the
+# benchmark runs quickly. Times are reported unscaled.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import form_handler_A
+from form_handler_A import PDF_MIME, PPTX_MIME
+
+# Seconds per step.
+LATENCIES = {
+    "copy_and_fill": 6.0,
+    "share": 1.0,
+    "chat": 0.5,
+    "export_presentation": 4.0,
+    "export_checklist": 2.0,
+    "email": 3.0,
+}
+
+def install_stubs(scale):
+    def sleep(step):
+        time.sleep(LATENCIES[step] * scale)
+
+    def copy_and_fill_template(template_id, new_title, folder_id, replacements):
+        sleep("copy_and_fill")
+        return "new_file_id"
+
+    def share_file(file_id, email, role):
+        sleep("share")
+
+    def download_drive_file_as(file_id, mime_type, filename, use_cache=False):
+        sleep("export_presentation" if mime_type == PPTX_MIME else "export_checklist")
+        return b"content", filename
+
+    def send_mail_with_attachments(to_email, subject, body_html, attachments):
+        sleep("email")
+
+    form_handler_A.copy_and_fill_template = copy_and_fill_template
+    form_handler_A.share_file = share_file
+    form_handler_A.download_drive_file_as = download_drive_file_as
+    form_handler_A.send_mail_with_attachments = send_mail_with_attachments
+
+def send_chat(space_name, thread_name, text):
+    time.sleep(LATENCIES["chat"] * SCALE)
+
+def generate_sequentially(params, email, name):
+    """The previous generate_and_send: every step waits for the one before it."""
+    new_file_id = form_handler_A.copy_and_fill_template("template", "title", "folder", {})
+    form_handler_A.share_file(new_file_id, email, "writer")
+    form_handler_A.get_sharable_link("checklist", email, "reader")
+    send_chat(params['space_name'], params['thread_name'], "Done")
+    checklist = form_handler_A.download_drive_file_as("checklist", PDF_MIME, "Checklist.pdf")
+    presentation = form_handler_A.download_drive_file_as(new_file_id, PPTX_MIME, "title.pptx")
+    form_handler_A.email_documents(presentation, checklist, email, name, "title")
+
+SCALE = 0.1
+
+def main():
+    global SCALE
+    parser = argparse.ArgumentParser(description="Form A generation pipeline benchmark")
+    parser.add_argument("--scale", type=float, default=0.1)
+    args = parser.parse_args()
+    SCALE = args.scale
+    install_stubs(SCALE)
+
+    params = {'field1': 'Bench', 'space_name': 'spaces/x', 'thread_name': 'spaces/x/threads/y'}
+    start = time.perf_counter()
+    generate_sequentially(params, "user@example.com", "User")
+    sequential = (time.perf_counter() - start) / SCALE
+
+    start = time.perf_counter()
+    form_handler_A.generate_and_send(params, "user@example.com", "User", send_message_to_chat_func=send_chat)
+    graph = (time.perf_counter() - start) / SCALE
+
+    print(f"{'sequential':<12}{sequential:>8.1f} s")
+    print(f"{'task graph':<12}{graph:>8.1f} s")
+    print(f"critical path: copy_and_fill -> export_presentation -> email = "
+          f"{LATENCIES['copy_and_fill'] + LATENCIES['export_presentation'] + LATENCIES['email']:.1f} s")
+
+if __name__ == "__main__":
+    main()
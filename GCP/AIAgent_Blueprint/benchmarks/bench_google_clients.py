@@ -0,0 +1,65 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares the per-call cost of building Google API clients on every use
+# (the previous behaviour) with the shared factory in google_clients.py.
+
+# bench_google_clients.py
+#
+# Usage: python benchmarks/bench_google_clients.py [--calls 50]
+# No credentials are needed: google.auth.default is replaced with anonymous credentials,
+# so only the client construction cost is measured.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.auth
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+import google_clients
+
+SERVICES = (
+    ('sheets', 'v4', google_clients.SHEETS_READONLY_SCOPES),
+    ('drive', 'v3', google_clients.DRIVE_READONLY_SCOPES),
+    ('slides', 'v1', google_clients.SLIDES_SCOPES),
+    ('gmail', 'v1', google_clients.GMAIL_SCOPES),
+)
+
+def fake_default(scopes=None, **kwargs):
+    return AnonymousCredentials(), "benchmark-project"
+
+def build_per_call(service_name, version, scopes):
+    """What every handler did before: resolve credentials and build a new client."""
+    credentials, _ = google.auth.default(scopes=list(scopes))
+    return build(service_name, version, credentials=credentials, static_discovery=True, cache_discovery=False)
+
+def measure(get_client, calls):
+    """Returns the mean milliseconds per call for each service."""
+    results = {}
+    for service_name, version, scopes in SERVICES:
+        start = time.perf_counter()
+        for _ in range(calls):
+            get_client(service_name, version, scopes)
+        results[service_name] = (time.perf_counter() - start) * 1000 / calls
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Google API client construction benchmark")
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    google.auth.default = fake_default
+
+    before = measure(build_per_call, args.calls)
+    after = measure(google_clients.get_service, args.calls)
+
+    print(f"{'service':<10}{'build per call ms':>20}{'shared factory ms':>20}")
+    for service_name, _, _ in SERVICES:
+        print(f"{service_name:<10}{before[service_name]:>20.3f}{after[service_name]:>20.4f}")
+
+if __name__ == "__main__":
+    main()
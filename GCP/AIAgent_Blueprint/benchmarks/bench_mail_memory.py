@@ -0,0 +1,165 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares the peak memory of emailing a Drive export as an attachment the
+# previous way (request.execute() + MIMEBase + message.as_string()) with the streaming path
+# of mail_handler.py (chunked download into a spooled file + streamed base64 MIME).
+
+# bench_mail_memory.py
+#
+# Usage: python benchmarks/bench_mail_memory.py [--sizes 1,50,200]
+# Requires aiosmtpd (pip install aiosmtpd). Drive is replaced by a local stub that serves
+# an export of the requested size (honouring Range headers), and the mail goes to a local
+# aiosmtpd server. Every measurement runs in a fresh interpreter; the reported value is the
+# growth of its peak RSS while downloading and sending one email (0 when the send stayed
+# below the peak already reached while importing the agent).
+
+import argparse
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USERNAME = "bench@example.com"
+PASSWORD = "secret"
+PPTX_MIME = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+BLOCK = bytes(range(256)) * 4096  # 1 MB pattern the stub export is made of
+
+def export_bytes(start, end):
+    """Returns bytes [start, end) of the stub export."""
+    parts = []
+    while start < end:
+        offset = start % len(BLOCK)
+        piece = BLOCK[offset:offset + end - start]
+        parts.append(piece)
+        start += len(piece)
+    return b"".join(parts)
+
+class FakeDriveHttp:
+    """An httplib2 stand-in that serves an export of `size` bytes, with Range support."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        import httplib2
+        range_header = (headers or {}).get("range")
+        if range_header:
+            start, end = (int(x) for x in range_header.split("=")[1].split("-"))
+            end = min(end, self.size - 1)
+            content = export_bytes(start, end + 1)
+            return httplib2.Response({
+                "status": "206", "content-range": f"bytes {start}-{end}/{self.size}", "content-length": str(len(content))
+            }), content
+        content = export_bytes(0, self.size)
+        return httplib2.Response({"status": "200", "content-length": str(len(content))}), content
+
+class FakeDriveService:
+    def __init__(self, http):
+        self.http = http
+
+    def files(self):
+        return self
+
+    def export_media(self, fileId, mimeType):
+        from googleapiclient.http import HttpRequest
+        uri = f"https://www.googleapis.com/drive/v3/files/{fileId}/export?mimeType={mimeType}&alt=media"
+        return HttpRequest(self.http, lambda resp, content: content, uri, headers={})
+
+def send_buffered(mail_handler):
+    """What mail_handler did before: the whole export in memory, encoded by the email package."""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.base import MIMEBase
+    from email import encoders
+    from google_clients import get_drive_service
+    data = get_drive_service(readonly=True).files().export_media(fileId="bench", mimeType=PPTX_MIME).execute()
+    message = MIMEMultipart()
+    message['To'] = "user@example.com"
+    message['From'] = f"AI Agent <{USERNAME}>"
+    message['Subject'] = "Benchmark"
+    message.attach(MIMEText("<p>Your documents.</p>", 'html'))
+    part = MIMEBase(*PPTX_MIME.split('/'))
+    part.set_payload(data)
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', 'attachment; filename="bench.pptx"')
+    message.attach(part)
+    mail_handler.get_smtp_pool().send(USERNAME, ["user@example.com"], message.as_string())
+
+def send_streaming(mail_handler):
+    content, filename = mail_handler.download_drive_file_as("bench", PPTX_MIME, "bench.pptx")
+    mail_handler.send_mail_with_attachments(
+        "user@example.com", "Benchmark", "<p>Your documents.</p>",
+        [{'content': content, 'filename': filename, 'mime': PPTX_MIME}]
+    )
+    content.close()
+
+def child(mode, size, port):
+    """Runs one measurement and prints the peak RSS growth in MB."""
+    os.environ.update({
+        "SMTP_SERVER": "localhost", "SMTP_PORT": str(port), "SMTP_EMAIL": USERNAME,
+        "SMTP_PASSWORD": PASSWORD, "SMTP_USE_STARTTLS": "false"
+    })
+    import google_clients
+    import mail_handler
+    import googleapiclient.http  # noqa: F401 - imported before the baseline is taken
+    service = FakeDriveService(FakeDriveHttp(size))
+    google_clients.get_drive_service = lambda readonly=False: service
+    mail_handler.get_smtp_pool().send(USERNAME, ["user@example.com"], "Subject: warm-up\r\n\r\n.\r\n")
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    (send_buffered if mode == "buffered" else send_streaming)(mail_handler)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print((peak - baseline) / 1024)
+
+def free_port():
+    # aiosmtpd's Controller cannot bind to port 0, so ask the OS for a free port first.
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+class DiscardingHandler:
+    async def handle_DATA(self, server, session, envelope):
+        return "250 OK"
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    from aiosmtpd.smtp import AuthResult
+    return AuthResult(success=auth_data.login == USERNAME.encode() and auth_data.password == PASSWORD.encode())
+
+def main():
+    parser = argparse.ArgumentParser(description="Attachment memory benchmark")
+    parser.add_argument("--sizes", default="1,50,200", help="Attachment sizes in MB, comma-separated")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "BYTES", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], int(args.child[1]), int(args.child[2]))
+        return
+
+    from aiosmtpd.controller import Controller
+    # aiosmtpd warns about its own use of Session.login_data on every AUTH.
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    port = free_port()
+    controller = Controller(
+        DiscardingHandler(), hostname="localhost", port=port, data_size_limit=None,
+        authenticator=authenticate, auth_require_tls=False
+    )
+    controller.start()
+
+    print(f"{'attachment':>12}{'buffered peak MB':>20}{'streaming peak MB':>20}")
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        results = []
+        for mode in ("buffered", "streaming"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, str(size_mb * 1024 * 1024), str(port)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(float(output.strip().splitlines()[-1]))
+        print(f"{size_mb:>9} MB{results[0]:>20.1f}{results[1]:>20.1f}")
+    controller.stop()
+
+if __name__ == "__main__":
+    main()
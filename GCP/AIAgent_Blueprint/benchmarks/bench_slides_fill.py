@@ -0,0 +1,132 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares filling a presentation with one batchUpdate call per placeholder
+# against slides_engine.fill_presentation, using a local mock of the Slides API.
+
+# bench_slides_fill.py
+#
+# Usage: python benchmarks/bench_slides_fill.py [--latency-ms 150] [--unused 40]
+# The mock applies replaceAllText/replaceAllShapesWithImage to an in-memory presentation and
+# sleeps --latency-ms per call to stand in for the API round-trip. The replacements contain
+# the template's placeholders plus --unused form parameters that appear in no placeholder.
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import slides_engine
+
+def make_template(slides=10, per_slide=3):
+    """A presentation with text placeholders (some split across text runs) and one image placeholder."""
+    pages = []
+    for s in range(slides):
+        elements = []
+        for p in range(per_slide):
+            key = f"Field{s}_{p}"
+            runs = [f"Label: {{{{{key}}}}}"] if p % 2 else ["Label: {{", key, "}}"]
+            elements.append({'objectId': f"shape{s}_{p}", 'shape': {'text': {
+                'textElements': [{'textRun': {'content': run}} for run in runs]
+            }}})
+        pages.append({'objectId': f"slide{s}", 'pageElements': elements})
+    pages[0]['pageElements'].append({'objectId': "photo", 'shape': {'text': {
+        'textElements': [{'textRun': {'content': "{{photo}}"}}]
+    }}})
+    return {'revisionId': "rev1", 'slides': pages}
+
+class FakeRequest:
+    def __init__(self, api, fn):
+        self.api = api
+        self.fn = fn
+
+    def execute(self):
+        self.api.calls += 1
+        time.sleep(self.api.latency)
+        return self.fn()
+
+class FakeSlidesApi:
+    """presentations().get / presentations().batchUpdate over in-memory presentations."""
+
+    def __init__(self, presentations, latency):
+        self.presentations_by_id = presentations
+        self.latency = latency
+        self.calls = 0
+        self.requests = 0
+
+    def presentations(self):
+        return self
+
+    def get(self, presentationId, fields=None):
+        presentation = self.presentations_by_id[presentationId]
+        if fields == 'revisionId':
+            return FakeRequest(self, lambda: {'revisionId': presentation['revisionId']})
+        return FakeRequest(self, lambda: copy.deepcopy(presentation))
+
+    def batchUpdate(self, presentationId, body):
+        return FakeRequest(self, lambda: self._apply(self.presentations_by_id[presentationId], body['requests']))
+
+    def _apply(self, presentation, requests):
+        self.requests += len(requests)
+        replies = []
+        for request in requests:
+            kind = next(iter(request))
+            text = request[kind]['containsText']['text']
+            changed = 0
+            for page in presentation['slides']:
+                for element in list(page['pageElements']):
+                    runs = element.get('shape', {}).get('text', {}).get('textElements', [])
+                    content = "".join(r['textRun']['content'] for r in runs)
+                    if text not in content:
+                        continue
+                    changed += content.count(text)
+                    if kind == 'replaceAllShapesWithImage':
+                        page['pageElements'].remove(element)
+                        page['pageElements'].append({'objectId': element['objectId'], 'image': {'contentUrl': request[kind]['imageUrl']}})
+                    else:
+                        element['shape']['text']['textElements'] = [{'textRun': {'content': content.replace(text, request[kind]['replaceText'])}}]
+            replies.append({kind: {'occurrencesChanged': changed}})
+        return {'replies': replies}
+
+def fill_per_placeholder(api, presentation_id, replacements):
+    """One batchUpdate call per replacement, without looking at the template."""
+    for request in slides_engine.build_requests(replacements):
+        api.presentations().batchUpdate(presentationId=presentation_id, body={'requests': [request]}).execute()
+
+def remaining_placeholders(presentation):
+    return slides_engine.find_placeholders(presentation)
+
+def main():
+    parser = argparse.ArgumentParser(description="Slides placeholder fill benchmark")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--unused", type=int, default=40)
+    args = parser.parse_args()
+
+    template = make_template()
+    params = {key[2:-2]: f"value of {key[2:-2]}" for key in slides_engine.find_placeholders(template)}
+    params.update({f"extra{i}": "x" for i in range(args.unused)})
+    params.update({'space_name': "spaces/x", 'thread_name': "spaces/x/threads/y"})
+    params['photo'] = {'image_url': "https://example.com/photo.png"}
+    replacements = slides_engine.make_replacements(params)
+
+    print(f"{len(replacements)} replacements, {len(slides_engine.find_placeholders(template))} placeholders in the template, "
+          f"{args.latency_ms:.0f} ms per API call")
+    print(f"{'mode':<34}{'API calls':>10}{'requests':>10}{'time s':>9}{'left':>6}")
+    runs = [
+        ("one batchUpdate per placeholder", lambda api, pid: fill_per_placeholder(api, pid, replacements)),
+        ("engine, cold template scan", lambda api, pid: slides_engine.fill_presentation(pid, replacements, "template", api)),
+        ("engine, cached template scan", lambda api, pid: slides_engine.fill_presentation(pid, replacements, "template", api)),
+    ]
+    for label, fill in runs:
+        api = FakeSlidesApi({"template": template, "copy": copy.deepcopy(template)}, args.latency_ms / 1000)
+        start = time.perf_counter()
+        fill(api, "copy")
+        elapsed = time.perf_counter() - start
+        left = len(remaining_placeholders(api.presentations_by_id["copy"]))
+        print(f"{label:<34}{api.calls:>10}{api.requests:>10}{elapsed:>9.2f}{left:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This benchmark compares messages/sec of sending every email on a new SMTP connection
+# (connect, EHLO, STARTTLS, LOGIN) with the connection pool from smtp_pool.py, against a
+# local aiosmtpd server with STARTTLS and AUTH.
+
+# bench_smtp_pool.py
+#
+# Usage: python benchmarks/bench_smtp_pool.py [--messages 200] [--threads 4] [--rtt-ms 10]
+# Requires aiosmtpd and cryptography (pip install aiosmtpd cryptography).
+# --rtt-ms delays every server reply to emulate the round-trip time to a real mail server.
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import smtplib
+import socket
+import ssl
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP, AuthResult
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from smtp_pool import SMTPConnectionPool
+
+USERNAME = "bench@example.com"
+PASSWORD = "secret"
+MESSAGE = (
+    "From: bench@example.com\r\nTo: user@example.com\r\nSubject: Benchmark\r\n\r\n"
+    + "Your generated documents are ready.\r\n" * 20
+)
+
+def make_tls_contexts():
+    """Creates a self-signed certificate; returns (server context, client context)."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    directory = tempfile.mkdtemp()
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_path, key_path)
+    client_context = ssl.create_default_context(cafile=cert_path)
+    return server_context, client_context
+
+class SlowSMTP(SMTP):
+    """An aiosmtpd session that waits `rtt` seconds before every reply."""
+    rtt = 0.0
+
+    async def push(self, status):
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        await super().push(status)
+
+class SlowController(Controller):
+    def factory(self):
+        return SlowSMTP(self.handler, **self.SMTP_kwargs)
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == USERNAME.encode() and auth_data.password == PASSWORD.encode())
+
+def free_port():
+    # aiosmtpd's Controller cannot bind to port 0, so ask the OS for a free port first.
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def send_without_pool(port, client_context):
+    """The previous mail_handler code path: a new authenticated connection per email."""
+    with smtplib.SMTP("localhost", port) as server:
+        server.starttls(context=client_context)
+        server.login(USERNAME, PASSWORD)
+        server.sendmail(USERNAME, ["user@example.com"], MESSAGE)
+
+def run(label, count, threads, send_one, messages_per_call=1):
+    start = time.perf_counter()
+    if threads == 1:
+        for _ in range(count):
+            send_one()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(send_one) for _ in range(count)]:
+                future.result()
+    elapsed = time.perf_counter() - start
+    count *= messages_per_call
+    print(f"{label:<34}{count / elapsed:>12.1f}{elapsed / count * 1000:>14.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP connection pool benchmark")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=10)
+    args = parser.parse_args()
+    # aiosmtpd warns about its own use of Session.login_data on every AUTH.
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+    SlowSMTP.rtt = args.rtt_ms / 1000
+    server_context, client_context = make_tls_contexts()
+    port = free_port()
+    handler = CountingHandler()
+    controller = SlowController(
+        handler, hostname="localhost", port=port,
+        tls_context=server_context, require_starttls=True,
+        authenticator=authenticate, auth_require_tls=True
+    )
+    controller.start()
+
+    def new_pool():
+        return SMTPConnectionPool("localhost", port, USERNAME, PASSWORD,
+                                  max_connections=args.threads, ssl_context=client_context)
+
+    print(f"{args.messages} messages, {args.rtt_ms:.0f} ms simulated round trip")
+    print(f"{'mode':<34}{'messages/s':>12}{'ms/message':>14}")
+    run("new connection per message", args.messages, 1, lambda: send_without_pool(port, client_context))
+    pool = new_pool()
+    run("pool, sequential", args.messages, 1, lambda: pool.send(USERNAME, ["user@example.com"], MESSAGE))
+    pool.close()
+    run(f"new connection, {args.threads} threads", args.messages, args.threads, lambda: send_without_pool(port, client_context))
+    pool = new_pool()
+    run(f"pool, {args.threads} threads", args.messages, args.threads, lambda: pool.send(USERNAME, ["user@example.com"], MESSAGE))
+    pool.close()
+    pool = new_pool()
+    batch = [(USERNAME, ["user@example.com"], MESSAGE)] * args.messages
+    run("pool, send_batch", 1, 1, lambda: pool.send_batch(batch), messages_per_call=args.messages)
+    pool.close()
+    controller.stop()
+
+if __name__ == "__main__":
+    main()
@@ -6,60 +6,265 @@
 # chat_handler.py
 
 import json
-import google.generativeai as genai
+import logging
 from api_config import AI_MODEL_FAST, AI_MODEL_PRO, SYSTEM_INSTRUCTION_FAST, SYSTEM_INSTRUCTION_PRO
-import requests
+from api_config import AI_CACHE_FAST_ENABLED, AI_CACHE_PRO_ENABLED
 import os
-from google.oauth2 import service_account
-import google.auth
-import google.auth.transport.requests
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from response_cache import response_cache, make_cache_key
+from log_config import get_logger, truncate, AI, PAYLOAD
+from tracing import span, traced
+from metrics import record_ai_call, CHAT_API_RESPONSES
+
+ai_logger = get_logger(AI)
+payload_logger = get_logger(PAYLOAD)
+
+# Scopes used by the bot when calling the Google Chat REST API.
+CHAT_SCOPES = ["https://www.googleapis.com/auth/chat.bot"]
+
+# The token is refreshed this many seconds before it actually expires,
+# so a request never goes out with a token that dies in flight.
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('CHAT_TOKEN_REFRESH_MARGIN', 300))
+
+# Minimum time between two updates of a streamed message. The Chat API allows
+# about one write per second per space, so chunks are coalesced to stay below that.
+STREAM_UPDATE_INTERVAL_SECONDS = float(os.environ.get('CHAT_STREAM_UPDATE_INTERVAL', 1.5))
+
+class ChatTokenProvider:
+    """
+    Process-wide provider of the bearer token for the Google Chat API.
+    The credentials object is kept between calls and refreshed only when the token
+    is missing or close to expiry. Safe to use from the background handler threads.
+    """
+
+    def __init__(self, scopes, refresh_margin_seconds=TOKEN_REFRESH_MARGIN_SECONDS):
+        self._scopes = scopes
+        self._refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self._credentials = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+
+    def _needs_refresh(self):
+        credentials = self._credentials
+        if not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        # google-auth keeps `expiry` as a naive UTC datetime.
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return now >= credentials.expiry - self._refresh_margin
+
+    def get_token(self):
+        """Returns a valid access token, refreshing the credentials only when needed."""
+        # Imported here so that loading this module does not pull in google-auth.
+        import google.auth
+        import google.auth.transport.requests
+        # The lock is held during the refresh, so concurrent callers wait for
+        # a single round-trip instead of each refreshing on their own.
+        with self._lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default(scopes=self._scopes)
+            if self._needs_refresh():
+                with span("chat.token_refresh"):
+                    self._credentials.refresh(google.auth.transport.requests.Request())
+                self.refreshes += 1
+            else:
+                self.hits += 1
+            return self._credentials.token
+
+    def invalidate(self):
+        """Forces a refresh on the next call, e.g. after the API rejected the token."""
+        with self._lock:
+            if self._credentials is not None:
+                self._credentials.token = None
+
+    def stats(self):
+        """Returns the cache hit and refresh counters."""
+        with self._lock:
+            return {"hits": self.hits, "refreshes": self.refreshes}
+
+chat_token_provider = ChatTokenProvider(CHAT_SCOPES)
 
 def get_access_token_from_service_account():
     """
     Retrieves an OAuth2 access token for the service account.
     This token is required to authenticate with Google Chat API.
+    The token is cached by `chat_token_provider` and refreshed only near expiry.
     """
     try:
-        credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/chat.bot"])
-        auth_req = google.auth.transport.requests.Request()
-        credentials.refresh(auth_req)
-        return credentials.token
+        return chat_token_provider.get_token()
     except Exception as e:
-        print(f"Error getting access token: {e}")
+        logging.error("Error getting access token: %s", e)
         return None
 
+# Registry of GenerativeModel instances, keyed by (model name, system instruction).
+_models = {}
+_models_lock = threading.Lock()
+
+def get_generative_model(model_name: str, system_instruction: str):
+    """
+    Returns a GenerativeModel for the given model and system instruction.
+    Each model is built once with a native `system_instruction` and then reused
+    by all handler threads, instead of being constructed on every request.
+    """
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                # Imported on first use: the Gemini SDK is the heaviest import of the agent.
+                import google.generativeai as genai
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                _models[key] = model
+    return model
+
+def select_model(research_mode: bool):
+    """Returns the model name, system instruction and cache setting for the given mode."""
+    if research_mode:
+        return AI_MODEL_PRO, SYSTEM_INSTRUCTION_PRO, AI_CACHE_PRO_ENABLED
+    return AI_MODEL_FAST, SYSTEM_INSTRUCTION_FAST, AI_CACHE_FAST_ENABLED
+
+@traced("chat_handler.get_ai_response")
 def get_ai_response(user_query: str, research_mode: bool = False) -> str:
     """
     Generates a response from the AI model based on the user's query.
     It selects a model and system instruction based on whether it's in research mode.
+    Answers are served from `response_cache` when caching is enabled for the mode.
     """
-    if research_mode:
-        model_name = AI_MODEL_PRO
-        system_instruction = SYSTEM_INSTRUCTION_PRO
-    else:
-        model_name = AI_MODEL_FAST
-        system_instruction = SYSTEM_INSTRUCTION_FAST
+    model_name, system_instruction, cache_enabled = select_model(research_mode)
 
     try:
-        model = genai.GenerativeModel(model_name)
-        prompt_parts = [
-            system_instruction,
-            f"\nUser Query: {user_query}\n\nResponse:",
-        ]
-        print(f"Sending prompt to AI ({model_name}): {prompt_parts}")
-        response = model.generate_content(prompt_parts)
-        print(f"Received response from AI: {response.text}")
+        if cache_enabled:
+            cache_key = make_cache_key(user_query, model_name, system_instruction)
+            cached_text = response_cache.get(cache_key)
+            if cached_text is not None:
+                logging.info("Serving cached AI response (%s)", model_name)
+                return cached_text
+
+        model = get_generative_model(model_name, system_instruction)
+        ai_logger.info("Sending prompt to AI (%s): %s", model_name, truncate(user_query))
+        start = time.perf_counter()
+        try:
+            with span("gemini.generate_content", model=model_name):
+                response = model.generate_content(user_query)
+        except Exception:
+            record_ai_call(model_name, time.perf_counter() - start, status="error")
+            raise
+        record_ai_call(model_name, time.perf_counter() - start, response)
+        ai_logger.info("Received response from AI: %s", truncate(response.text))
+        if cache_enabled:
+            response_cache.set(cache_key, response.text)
         return response.text
     except Exception as e:
-        print(f"Error during AI response generation: {e}")
+        logging.error("Error during AI response generation: %s", e)
         return "Sorry, there was a problem with the AI. Please try again later."
 
+def make_json_schema(fields: dict) -> dict:
+    """
+    Builds the response schema of a JSON object whose keys are the given fields, all
+    required strings. `fields` maps each key to the description the model sees.
+    """
+    return {
+        "type": "object",
+        "properties": {key: {"type": "string", "description": description} for key, description in fields.items()},
+        "required": list(fields)
+    }
+
+@traced("chat_handler.get_ai_json_response")
+def get_ai_json_response(prompt: str, schema: dict, research_mode: bool = False) -> dict:
+    """
+    Generates a JSON object that follows `schema` (see make_json_schema), using Gemini's
+    structured output (response_mime_type "application/json" with a response_schema),
+    so the answer is parsed as it is instead of being cut out of free text.
+    Returns an empty dict if the call fails or the answer is not a JSON object.
+    """
+    model_name, system_instruction, _ = select_model(research_mode)
+    generation_config = {"response_mime_type": "application/json", "response_schema": schema}
+    try:
+        model = get_generative_model(model_name, system_instruction)
+        ai_logger.info("Sending JSON prompt to AI (%s): %s", model_name, truncate(prompt))
+        start = time.perf_counter()
+        try:
+            with span("gemini.generate_content", model=model_name, response_mime_type="application/json"):
+                response = model.generate_content(prompt, generation_config=generation_config)
+        except Exception:
+            record_ai_call(model_name, time.perf_counter() - start, status="error")
+            raise
+        record_ai_call(model_name, time.perf_counter() - start, response)
+        ai_logger.info("Received JSON response from AI: %s", truncate(response.text))
+        data = json.loads(response.text)
+        if not isinstance(data, dict):
+            raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+        return data
+    except Exception as e:
+        logging.error("Error during AI JSON response generation: %s", e)
+        return {}
+
+@traced("chat_handler.stream_ai_response_to_chat")
+def stream_ai_response_to_chat(user_query: str, space_name, thread_name, research_mode: bool = True, prefix: str = ""):
+    """
+    Streams the AI response into the chat. A placeholder message is posted first and
+    then updated with the text generated so far, so users see the beginning of the
+    answer after about a second instead of waiting for the full generation.
+    Updates are sent at most once per STREAM_UPDATE_INTERVAL_SECONDS.
+    """
+    model_name, system_instruction, cache_enabled = select_model(research_mode)
+    cache_key = make_cache_key(user_query, model_name, system_instruction)
+    if cache_enabled:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            send_message_to_chat(space_name, thread_name, prefix + cached_text)
+            return
+
+    message_name = send_message_to_chat(space_name, thread_name, prefix + "Generating the answer...")
+    text = ""
+    sent_text = None
+    try:
+        model = get_generative_model(model_name, system_instruction)
+        ai_logger.info("Streaming prompt to AI (%s): %s", model_name, truncate(user_query))
+        last_update = time.monotonic()
+        start = time.perf_counter()
+        # Time spent updating the chat message is not counted as AI latency.
+        update_seconds = 0.0
+        try:
+            with span("gemini.generate_content_stream", model=model_name):
+                response = model.generate_content(user_query, stream=True)
+                for chunk in response:
+                    text += chunk.text
+                    if message_name and time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL_SECONDS:
+                        update_start = time.perf_counter()
+                        update_chat_message(message_name, prefix + text)
+                        update_seconds += time.perf_counter() - update_start
+                        sent_text = text
+                        last_update = time.monotonic()
+        except Exception:
+            record_ai_call(model_name, time.perf_counter() - start - update_seconds, status="error")
+            raise
+        record_ai_call(model_name, time.perf_counter() - start - update_seconds, response)
+        ai_logger.info("Received streamed response from AI: %s", truncate(text))
+        if cache_enabled:
+            response_cache.set(cache_key, text)
+    except Exception as e:
+        logging.error("Error during streamed AI response generation: %s", e)
+        text += "\n\nSorry, there was a problem with the AI. Please try again later."
+
+    # The final update carries the complete text, unless it was already sent.
+    if message_name:
+        if text != sent_text:
+            update_chat_message(message_name, prefix + text)
+    else:
+        send_message_to_chat(space_name, thread_name, prefix + text)
+
 def handle_added_to_space_event(event: dict):
     """
     Handles the event when the bot is added to a new space (room or DM).
     It sends a welcome message with a card.
     """
-    print("Bot was added to a space.")
+    logging.info("Bot was added to a space.")
     space_data = event.get('space', {})
 
     if space_data.get('type') == 'ROOM':
@@ -105,16 +310,19 @@ def handle_added_to_space_event(event: dict):
         "text": welcome_text
     }
 
-    print(f"Sending response to ADDED_TO_SPACE event: {json.dumps(response_body, indent=2)}")
+    payload_logger.info("Sending response to ADDED_TO_SPACE event: %s", truncate(response_body))
     return response_body
 
 def send_message_to_chat(space_name, thread_name, text, card=None):
     """
     Sends a message (text or card) to a Google Chat space via the REST API.
+    All handlers post through here, so they share the pooled keep-alive session.
+    Returns the resource name of the created message, or None if sending failed.
     """
+    from http_client import get_chat_session
     access_token = get_access_token_from_service_account()
     if not access_token:
-        print("Missing bot token to send messages.")
+        logging.error("Missing bot token to send messages.")
         return
 
     url = f"https://chat.googleapis.com/v1/{space_name}/messages"
@@ -133,5 +341,38 @@ def send_message_to_chat(space_name, thread_name, text, card=None):
             "card": card
         }]
 
-    response = requests.post(url, headers=headers, json=body)
-    print(f"Message sending status: {response.status_code}, {response.text}")
+    with span("chat.messages.create") as chat_span:
+        response = get_chat_session().post(url, headers=headers, json=body)
+        chat_span.set_attribute("status_code", response.status_code)
+    CHAT_API_RESPONSES.inc("create", str(response.status_code))
+    if response.status_code == 401:
+        # The cached token was rejected, make sure the next message gets a fresh one.
+        chat_token_provider.invalidate()
+    logging.info("Message sending status: %s", response.status_code)
+    payload_logger.info("Message sending response: %s", truncate(response.text))
+    if not response.ok:
+        return None
+    return response.json().get("name")
+
+def update_chat_message(message_name, text):
+    """
+    Replaces the text of an existing message via the Chat API messages.patch endpoint.
+    """
+    from http_client import get_chat_session
+    access_token = get_access_token_from_service_account()
+    if not access_token:
+        logging.error("Missing bot token to update messages.")
+        return
+
+    url = f"https://chat.googleapis.com/v1/{message_name}"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    with span("chat.messages.patch") as chat_span:
+        response = get_chat_session().patch(url, headers=headers, params={"updateMask": "text"}, json={"text": text})
+        chat_span.set_attribute("status_code", response.status_code)
+    CHAT_API_RESPONSES.inc("patch", str(response.status_code))
+    if response.status_code == 401:
+        chat_token_provider.invalidate()
+    logging.info("Message update status: %s", response.status_code)
@@ -0,0 +1,139 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements a size-bounded on-disk LRU cache for Drive exports of files that rarely
+# change (e.g. the Form A checklist PDF), keyed on the file's revision.
+
+# drive_export_cache.py
+
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from metrics import registry
+
+# --- Configuration ---
+DRIVE_EXPORT_CACHE_ENABLED = os.environ.get('DRIVE_EXPORT_CACHE_ENABLED', 'true').lower() == 'true'
+DRIVE_EXPORT_CACHE_DIR = os.environ.get('DRIVE_EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'agent-drive-exports'))
+# Total size of the cached files; the least recently used ones are deleted above it.
+DRIVE_EXPORT_CACHE_MAX_BYTES = int(os.environ.get('DRIVE_EXPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+DRIVE_EXPORT_CACHE_LOOKUPS = registry.counter(
+    "agent_drive_export_cache_lookups_total", "Drive export cache lookups, by result (hit/miss).", ("result",)
+)
+
+def make_export_key(file_id, export_mime, revision) -> str:
+    """
+    Builds the cache key of an export. `revision` is the file's headRevisionId, or its
+    modifiedTime for Google Docs/Slides files, which have no headRevisionId. Both change on
+    every edit of the content, but not when the file is shared.
+    """
+    return hashlib.sha256(f"{file_id}\n{export_mime}\n{revision}".encode('utf-8')).hexdigest()
+
+class DiskLRUCache:
+    """
+    Stores files in `directory` and keeps their total size under `max_bytes` by deleting
+    the least recently used ones. Thread-safe. Entries are written to a temporary file and
+    renamed into place, so several processes can share the directory; an entry another
+    process deleted is simply a miss.
+    """
+
+    def __init__(self, directory=DRIVE_EXPORT_CACHE_DIR, max_bytes=DRIVE_EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def _load_index(self):
+        """Picks up the entries left by earlier runs, oldest modification time first."""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bin") and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def get(self, key):
+        """Returns the cached file opened for binary reading, or None."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            cached = open(self._path(key), 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        try:
+            # The modification time keeps the LRU order across restarts.
+            os.utime(cached.fileno())
+        except OSError:
+            pass
+        return cached
+
+    def put(self, key, source):
+        """Copies the binary file object `source` (from its current position) into the cache."""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                shutil.copyfileobj(source, target)
+                size = target.tell()
+            if size > self.max_bytes:
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, self._path(key))
+        except OSError as e:
+            logging.warning("(drive_export_cache.py)[DiskLRUCache.put] Could not cache %s: %s", key, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_export_cache():
+    """Returns the process-wide export cache, or None if it is disabled or cannot be created."""
+    global _cache
+    if not DRIVE_EXPORT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = DiskLRUCache()
+                except OSError as e:
+                    logging.error("(drive_export_cache.py)[get_export_cache] Could not create cache in %s: %s", DRIVE_EXPORT_CACHE_DIR, e)
+                    return None
+    return _cache
@@ -0,0 +1,250 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements the Drive sharing service: permission grants from all threads are merged
+# into Drive HTTP batch requests, and grants that already exist are skipped.
+
+# drive_sharing.py
+
+import json
+import logging
+import os
+import threading
+import time
+from metrics import registry
+from response_cache import LRUTTLCache
+from tracing import span
+
+# --- Configuration ---
+# How long the leader of a batch waits for grants from other threads before sending it.
+DRIVE_SHARE_BATCH_WINDOW = float(os.environ.get('DRIVE_SHARE_BATCH_WINDOW', 0.05))
+# Drive accepts at most 100 calls in one batch request.
+DRIVE_SHARE_MAX_BATCH = int(os.environ.get('DRIVE_SHARE_MAX_BATCH', 100))
+# How long a granted or listed permission is remembered.
+DRIVE_PERMISSION_CACHE_TTL = float(os.environ.get('DRIVE_PERMISSION_CACHE_TTL', 300))
+# From this many uncached recipients of one file on, its permissions are listed first
+# (one call) so the users who already have access are not granted again.
+DRIVE_SHARE_LIST_THRESHOLD = int(os.environ.get('DRIVE_SHARE_LIST_THRESHOLD', 5))
+# Rounds in which grants rejected with a rate-limit or server error are sent again.
+DRIVE_SHARE_RETRIES = int(os.environ.get('DRIVE_SHARE_RETRIES', 2))
+DRIVE_SHARE_SEND_NOTIFICATION = os.environ.get('DRIVE_SHARE_SEND_NOTIFICATION', 'false').lower() == 'true'
+
+# A cached role satisfies a request for any role ranked at or below it.
+ROLE_RANKS = {'reader': 1, 'commenter': 2, 'writer': 3, 'fileOrganizer': 4, 'organizer': 5, 'owner': 6}
+RETRYABLE_STATUS = (429, 500, 503)
+# A 403 is retried only for these reasons; other 403s (e.g. insufficient permissions) are final.
+RETRYABLE_403_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
+
+DRIVE_SHARE_GRANTS = registry.counter(
+    "agent_drive_share_grants_total", "Drive permission grants, by result (granted/cached/failed).", ("result",)
+)
+DRIVE_SHARE_BATCHES = registry.counter("agent_drive_share_batches_total", "Drive batch requests sent for permission grants.")
+
+class DriveSharingError(Exception):
+    """Raised when grants failed. `failures` maps each recipient that has no access to its error."""
+
+    def __init__(self, file_id, failures):
+        self.failures = failures
+        super().__init__(f"Could not share {file_id} with {', '.join(failures)}: {next(iter(failures.values()))}")
+
+def _error_reason(exception):
+    """Returns the reason of the first error in a Google API error response, or None."""
+    try:
+        content = exception.content
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        return (json.loads(content)['error'].get('errors') or [{}])[0].get('reason')
+    except (AttributeError, ValueError, KeyError, TypeError):
+        return None
+
+def _is_retryable(exception):
+    status = getattr(getattr(exception, 'resp', None), 'status', None)
+    if status == 403:
+        return _error_reason(exception) in RETRYABLE_403_REASONS
+    return status in RETRYABLE_STATUS
+
+class _Grant:
+    __slots__ = ("file_id", "email", "role", "permission_id", "error", "done")
+
+    def __init__(self, file_id, email, role):
+        self.file_id = file_id
+        self.email = email
+        self.role = role
+        self.permission_id = None
+        self.error = None
+        self.done = threading.Event()
+
+class SharingService:
+    """
+    Shares Drive files. Grants requested at about the same time (within DRIVE_SHARE_BATCH_WINDOW),
+    from any thread, are sent together as Drive batch requests of up to DRIVE_SHARE_MAX_BATCH
+    calls: the first caller sends the batch and the others wait for their results. A caller sends
+    at most one batch; grants that arrive meanwhile are sent by one of their own callers. Sharing
+    one file with many users therefore costs one call per batch, not one per user.
+    """
+
+    def __init__(self, drive_service=None, window=DRIVE_SHARE_BATCH_WINDOW, max_batch=DRIVE_SHARE_MAX_BATCH,
+                 cache_ttl=DRIVE_PERMISSION_CACHE_TTL, list_threshold=DRIVE_SHARE_LIST_THRESHOLD,
+                 retries=DRIVE_SHARE_RETRIES, send_notification=DRIVE_SHARE_SEND_NOTIFICATION):
+        self._drive_service = drive_service
+        self.window = window
+        self.max_batch = max_batch
+        self.list_threshold = list_threshold
+        self.retries = retries
+        self.send_notification = send_notification
+        self._permissions = LRUTTLCache(max_entries=16384, ttl_seconds=cache_ttl)
+        self._pending = []
+        self._sending = False
+        self._lock = threading.Lock()
+        self._sent = threading.Condition(self._lock)
+
+    def _drive(self):
+        if self._drive_service is not None:
+            return self._drive_service
+        from google_clients import get_drive_service
+        return get_drive_service()
+
+    def _has_access(self, file_id, email, role):
+        cached_role = self._permissions.get((file_id, email))
+        return cached_role is not None and ROLE_RANKS.get(cached_role, 0) >= ROLE_RANKS.get(role, 0)
+
+    def _remember(self, file_id, email, role):
+        if not self._has_access(file_id, email, role):
+            self._permissions.set((file_id, email), role)
+
+    def _load_permissions(self, file_id):
+        """Caches the users who already have access to the file."""
+        drive = self._drive()
+        page_token = None
+        try:
+            with span("drive.permissions.list"):
+                while True:
+                    response = drive.permissions().list(
+                        fileId=file_id, pageSize=100, pageToken=page_token, supportsAllDrives=True,
+                        fields='nextPageToken,permissions(type,emailAddress,role)'
+                    ).execute()
+                    for permission in response.get('permissions', []):
+                        if permission.get('type') == 'user' and permission.get('emailAddress'):
+                            self._remember(file_id, permission['emailAddress'].lower(), permission['role'])
+                    page_token = response.get('nextPageToken')
+                    if not page_token:
+                        break
+        except Exception as e:
+            logging.warning("(drive_sharing.py)[SharingService._load_permissions] Could not list permissions of %s: %s", file_id, e)
+
+    def grant(self, file_id, emails, role):
+        """
+        Gives each user in `emails` the role on the file. Returns {email: permission ID}, with
+        None for users who already had access. Raises DriveSharingError if any grant failed.
+        """
+        emails = list(dict.fromkeys(email.strip().lower() for email in emails if email and email.strip()))
+        todo = [email for email in emails if not self._has_access(file_id, email, role)]
+        if len(todo) >= self.list_threshold:
+            self._load_permissions(file_id)
+            todo = [email for email in todo if not self._has_access(file_id, email, role)]
+        DRIVE_SHARE_GRANTS.inc("cached", amount=len(emails) - len(todo))
+        if not todo:
+            return dict.fromkeys(emails)
+
+        grants = [_Grant(file_id, email, role) for email in todo]
+        with self._lock:
+            self._pending.extend(grants)
+        while True:
+            with self._lock:
+                while self._sending and not all(grant.done.is_set() for grant in grants):
+                    self._sent.wait()
+                if all(grant.done.is_set() for grant in grants):
+                    break
+                # No batch is being sent and ours are still pending: send them (and any others).
+                self._sending = True
+            self._send_pending()
+
+        failures = {grant.email: grant.error for grant in grants if grant.error is not None}
+        if failures:
+            raise DriveSharingError(file_id, failures)
+        results = dict.fromkeys(emails)
+        results.update({grant.email: grant.permission_id for grant in grants})
+        return results
+
+    def _send_pending(self):
+        """
+        Run by the thread that leads a batch: sends the grants pending after the batch window once,
+        then wakes the waiting callers. One of those whose grants came in meanwhile leads the next.
+        """
+        time.sleep(self.window)
+        with self._lock:
+            pending, self._pending = self._pending, []
+        try:
+            try:
+                self._send(pending)
+            except Exception as e:
+                for grant in pending:
+                    if grant.permission_id is None and grant.error is None:
+                        grant.error = e
+            for grant in pending:
+                if grant.error is None:
+                    self._remember(grant.file_id, grant.email, grant.role)
+                    DRIVE_SHARE_GRANTS.inc("granted")
+                else:
+                    logging.error("(drive_sharing.py)[SharingService._send_pending] Could not share %s with %s: %s",
+                                  grant.file_id, grant.email, grant.error)
+                    DRIVE_SHARE_GRANTS.inc("failed")
+                grant.done.set()
+        finally:
+            with self._lock:
+                self._sending = False
+                self._sent.notify_all()
+
+    def _send(self, grants):
+        """Sends the grants in batches, retrying the ones rejected with a rate-limit or server error."""
+        for attempt in range(self.retries + 1):
+            retry = []
+            for start in range(0, len(grants), self.max_batch):
+                retry += self._send_batch(grants[start:start + self.max_batch])
+            if not retry:
+                return
+            if attempt < self.retries:
+                time.sleep(2 ** attempt)
+                for grant in retry:
+                    grant.error = None
+            grants = retry
+
+    def _send_batch(self, grants):
+        """Sends one batch request; returns the grants that may succeed on a retry."""
+        drive = self._drive()
+        retry = []
+
+        def callback(request_id, response, exception):
+            grant = grants[int(request_id)]
+            if exception is None:
+                grant.permission_id = response.get('id')
+                return
+            grant.error = exception
+            if _is_retryable(exception):
+                retry.append(grant)
+
+        batch = drive.new_batch_http_request(callback=callback)
+        for i, grant in enumerate(grants):
+            batch.add(drive.permissions().create(
+                fileId=grant.file_id,
+                body={'type': 'user', 'role': grant.role, 'emailAddress': grant.email},
+                sendNotificationEmail=self.send_notification,
+                supportsAllDrives=True,
+                fields='id'
+            ), request_id=str(i))
+        with span("drive.permissions.batch", grants=len(grants)):
+            batch.execute()
+        DRIVE_SHARE_BATCHES.inc()
+        return retry
+
+sharing_service = SharingService()
+
+def share_file(file_id, email, role):
+    """Shares a file with one user, batched with the grants of other threads. Returns the permission ID."""
+    if not email or not email.strip():
+        raise ValueError(f"No recipient to share {file_id} with")
+    return sharing_service.grant(file_id, [email], role)[email.strip().lower()]
+
+def share_with_many(file_id, emails, role):
+    """Shares one file with a list of users, e.g. a team-wide rollout. See SharingService.grant."""
+    return sharing_service.grant(file_id, emails, role)
@@ -0,0 +1,112 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements the route registry used to dispatch chat events, slash commands
+# and card actions to their handlers, with per-route latency histograms.
+
+# event_router.py
+
+import logging
+import threading
+import time
+from collections import Counter
+from tracing import span
+from metrics import EVENTS, SLASH_COMMANDS, CARD_ACTIONS, ROUTE_LATENCY
+
+# Route kinds
+EVENT = "event"       # keyed by the event type, e.g. 'MESSAGE'
+COMMAND = "command"   # keyed by the slash command ID, e.g. '2'
+ACTION = "action"     # keyed by the card's invokedFunction, e.g. 'submitFormA'
+
+# Counter of received keys for each route kind, exported on /metrics.
+KIND_COUNTERS = {EVENT: EVENTS, COMMAND: SLASH_COMMANDS, ACTION: CARD_ACTIONS}
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+class LatencyHistogram:
+    """A fixed-bucket latency histogram. Thread-safe."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms):
+        for index, bound in enumerate(self.buckets):
+            if elapsed_ms <= bound:
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "total_ms": self.total_ms,
+                "buckets": dict(zip(self.buckets, self.counts))
+            }
+
+class EventRouter:
+    """
+    Registry of handlers, built once at import. Each handler takes the event dict
+    and returns the response body. Dispatch is a single dictionary lookup; calls to
+    keys without a handler are counted so missing routes show up in the stats.
+    """
+
+    def __init__(self):
+        self._routes = {EVENT: {}, COMMAND: {}, ACTION: {}}
+        self._latency = {}
+        self._unknown = Counter()
+        self._lock = threading.Lock()
+
+    def register(self, kind, key, handler):
+        """Registers `handler(event)` for the given route kind and key."""
+        if key in self._routes[kind]:
+            raise ValueError(f"Route already registered: {kind} {key}")
+        self._routes[kind][key] = handler
+        self._latency[(kind, key)] = LatencyHistogram()
+
+    def register_event(self, event_type, handler):
+        self.register(EVENT, event_type, handler)
+
+    def register_command(self, command_id, handler):
+        self.register(COMMAND, command_id, handler)
+
+    def register_action(self, function_name, handler):
+        self.register(ACTION, function_name, handler)
+
+    def dispatch(self, kind, key, event, default=None):
+        """
+        Calls the handler registered for (kind, key) and records its latency.
+        Returns `default` if no handler is registered.
+        """
+        handler = self._routes[kind].get(key)
+        # Keys come from the event, so only registered ones become metric labels.
+        KIND_COUNTERS[kind].inc(str(key) if handler is not None else "unknown")
+        if handler is None:
+            with self._lock:
+                self._unknown[(kind, key)] += 1
+            logging.warning("(event_router.py)[dispatch] No handler found for %s: %s", kind, key)
+            return default
+        start = time.perf_counter()
+        try:
+            with span(f"{kind}:{key}"):
+                return handler(event)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._latency[(kind, key)].observe(elapsed * 1000)
+            ROUTE_LATENCY.observe(elapsed, kind, str(key))
+
+    def stats(self):
+        """Returns the latency histogram of every route and the counts of unknown keys."""
+        with self._lock:
+            unknown = {f"{kind}:{key}": count for (kind, key), count in self._unknown.items()}
+        return {
+            "routes": {f"{kind}:{key}": histogram.snapshot() for (kind, key), histogram in self._latency.items()},
+            "unknown": unknown
+        }
@@ -0,0 +1,79 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements the cache of Form B AI extraction results, keyed on a hash of the
+# sub-type, the notes, the time inputs and the version of the prompt.
+
+# extraction_cache.py
+
+import hashlib
+import json
+import logging
+import os
+from api_config import AI_CACHE_BACKEND, AI_MODEL_FAST
+from metrics import registry
+from response_cache import build_backend
+
+# --- Configuration ---
+EXTRACTION_CACHE_ENABLED = os.environ.get('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'
+# 'memory' (per-process LRU with TTL) or 'redis' (shared between instances and kept across restarts).
+EXTRACTION_CACHE_BACKEND = os.environ.get('EXTRACTION_CACHE_BACKEND', AI_CACHE_BACKEND)
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', 256))
+EXTRACTION_CACHE_TTL_SECONDS = int(os.environ.get('EXTRACTION_CACHE_TTL_SECONDS', 86400))
+
+EXTRACTION_CACHE_LOOKUPS = registry.counter(
+    "agent_ai_extraction_cache_lookups_total", "Form B AI extraction cache lookups, by sub-type and result (hit/miss).",
+    ("sub_type", "result")
+)
+
+def make_prompt_version(prompt_template, fields, model_name=AI_MODEL_FAST):
+    """
+    Returns a short hash of everything in the code that shapes an extraction: the prompt
+    template, the field descriptions and the model. Editing any of them changes the
+    version, so entries made with the old prompt are no longer found.
+    """
+    raw = json.dumps([prompt_template, fields, model_name], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def make_key(sub_type, prompt_version, notes, time_inputs, fields):
+    """
+    Builds the cache key of an extraction. `fields` are the fields asked from the model;
+    they depend on what the pre-extraction found (e.g. a client name from the sheet).
+    """
+    raw = json.dumps([sub_type, prompt_version, (notes or '').strip(), list(time_inputs), sorted(fields)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class ExtractionCache:
+    """
+    Stores extraction results (JSON objects) in a response_cache backend. A user who goes
+    back to step 2 to correct a price gets the step 3 data without another model call.
+    """
+
+    def __init__(self, backend, enabled=EXTRACTION_CACHE_ENABLED):
+        self.backend = backend
+        self.enabled = enabled
+
+    def get(self, sub_type, key):
+        """Returns the cached result, or None."""
+        if not self.enabled:
+            return None
+        value = self.backend.get(key)
+        EXTRACTION_CACHE_LOOKUPS.inc(sub_type, "miss" if value is None else "hit")
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            logging.warning("(extraction_cache.py)[ExtractionCache.get] Dropping unreadable entry: %s", e)
+            self.backend.delete(key)
+            return None
+
+    def set(self, key, data):
+        """Caches a result. Empty results (failed calls) are not cached."""
+        if self.enabled and data:
+            self.backend.set(key, json.dumps(data, ensure_ascii=False))
+
+extraction_cache = ExtractionCache(build_backend(
+    EXTRACTION_CACHE_BACKEND, prefix="ai_extraction:",
+    max_entries=EXTRACTION_CACHE_MAX_ENTRIES, ttl_seconds=EXTRACTION_CACHE_TTL_SECONDS
+))
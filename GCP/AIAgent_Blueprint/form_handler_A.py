@@ -6,66 +6,102 @@
 
 # form_handler_A.py
 
+import collections
 import logging
-import threading
+import os
+import statistics
 import time
-from datetime import datetime, timedelta
-import google.auth
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from googleapiclient.errors import HttpError
-# The mail handler is abstracted. In a real scenario, this would import a module
-# responsible for downloading files and sending emails.
-# from mail_handler import download_drive_file_as, send_mail_with_attachments
-
-# --- Mock/Abstracted Mail Handler Functions ---
-# These functions stand in for a real mail handler to keep this module self-contained for the blueprint.
-def download_drive_file_as(file_id, mime_type, filename):
-    print(f"Mock download: file_id={file_id}, mime_type={mime_type}, filename={filename}")
-    return (b"mock file content", filename)
-
-def send_mail_with_attachments(to_email, subject, body_html, attachments):
-    print(f"Mock email sent to {to_email} with subject '{subject}' and {len(attachments)} attachments.")
-# --- End Mock ---
+from datetime import datetime
+from google_clients import get_sheets_service
+from chat_handler import send_message_to_chat
+from mail_handler import (
+    start_generation_task, make_job_id, JobCheckpoint, download_drive_file_as, send_mail_with_attachments,
+    q as generation_queue
+)
+from task_executor import QUEUE_FULL_TEXT
+from snapshot_cache import SnapshotCache
+from log_config import get_logger, truncate, PAYLOAD
+from tracing import traced
+from task_graph import TaskGraph
+import drive_sharing
+import slides_engine
+import template_pool
 
-def get_data_from_sheet():
-    """Fetches data from a predefined Google Sheet to populate form dropdowns."""
-    print("(form_handler_A.py)[get_data_from_sheet] Fetching data from Google Sheets")
-    # ANONYMIZED: Replace with your actual Spreadsheet ID and range.
-    SPREADSHEET_ID = 'YOUR_SPREADSHEET_ID_HERE'
-    RANGE = 'Sheet1!A2:J'
+payload_logger = get_logger(PAYLOAD)
+
+# ANONYMIZED: Replace with your actual Spreadsheet ID and range.
+SPREADSHEET_ID = 'YOUR_SPREADSHEET_ID_HERE'
+SHEET_RANGE = 'Sheet1!A2:J'
+# How long the sheet snapshot is served before a background refresh is started.
+SHEET_CACHE_TTL_SECONDS = int(os.environ.get('SHEET_CACHE_TTL_SECONDS', 300))
+# Generation time announced to the user until a generation has finished.
+GENERATION_ESTIMATE_SECONDS = int(os.environ.get('GENERATION_ESTIMATE_SECONDS', 60))
+
+PDF_MIME = 'application/pdf'
+PPTX_MIME = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# Durations of the last generations, for the "ready in about ..." reply. With the RQ queue the
+# generations run in worker processes, so the durations are also kept in a Redis list.
+_recent_generation_seconds = collections.deque(maxlen=20)
+GENERATION_SECONDS_KEY = "form_A:generation_seconds"
+
+@traced("sheets.values.get")
+def fetch_sheet_rows():
+    """Fetches the raw rows of the predefined Google Sheet."""
+    result = get_sheets_service().spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_ID, range=SHEET_RANGE
+    ).execute()
+    return result.get('values', [])
+
+def parse_sheet_rows(rows):
+    """Converts raw sheet rows into the items used by the form dropdowns."""
+    # ANONYMIZED: The structure of the data is specific to the original project.
+    # This should be adapted to your data schema.
+    data_items = []
+    for row in rows:
+        item = {
+            'name': row[1] if len(row) > 1 else '',
+            'position': row[5] if len(row) > 5 else '',
+            'phone': row[6] if len(row) > 6 else '',
+            'email': row[7] if len(row) > 7 else '',
+            'description': row[8] if len(row) > 8 else '',
+            'photo_url': row[9] if len(row) > 9 else '',
+        }
+        data_items.append(item)
+    return data_items
+
+def load_sheet_data():
+    """Loader for the sheet snapshot. Records how long the fetch and the parse took."""
+    logging.info("(form_handler_A.py)[load_sheet_data] Fetching data from Google Sheets")
+    start = time.perf_counter()
+    rows = fetch_sheet_rows()
+    fetched = time.perf_counter()
+    data_items = parse_sheet_rows(rows)
+    sheet_snapshot.record_timing('fetch', fetched - start)
+    sheet_snapshot.record_timing('parse', time.perf_counter() - fetched)
+    logging.info("(form_handler_A.py)[load_sheet_data] Loaded %s data items", len(data_items))
+    return data_items
+
+sheet_snapshot = SnapshotCache(load_sheet_data, SHEET_CACHE_TTL_SECONDS, name="form_A_sheet")
 
+@traced("form_handler_A.get_data_from_sheet")
+def get_data_from_sheet():
+    """
+    Returns the data used to populate form dropdowns.
+    The data comes from a cached snapshot of the Google Sheet, so once the cache is warm
+    opening the dialog never waits on a Sheets round-trip. Call
+    `sheet_snapshot.invalidate()` after editing the sheet to pick up changes sooner.
+    """
     try:
-        credentials, _ = google.auth.default(scopes=['https://www.googleapis.com/auth/spreadsheets.readonly'])
-        sheets_service = build('sheets', 'v4', credentials=credentials)
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID, range=RANGE
-        ).execute()
-        rows = result.get('values', [])
-        
-        # ANONYMIZED: The structure of the data is specific to the original project.
-        # This should be adapted to your data schema.
-        data_items = []
-        for row in rows:
-            item = {
-                'name': row[1] if len(row) > 1 else '',
-                'position': row[5] if len(row) > 5 else '',
-                'phone': row[6] if len(row) > 6 else '',
-                'email': row[7] if len(row) > 7 else '',
-                'description': row[8] if len(row) > 8 else '',
-                'photo_url': row[9] if len(row) > 9 else '',
-            }
-            data_items.append(item)
-        print(f"(form_handler_A.py)[get_data_from_sheet] Data items: {data_items}")
-        return data_items
+        return sheet_snapshot.get() or []
     except Exception as e:
-        logging.error(f"Error fetching from sheet: {e}", exc_info=True)
+        logging.error("Error fetching from sheet: %s", e, exc_info=True)
         return []
 
 
 def open_form_A_dialog():
     """Opens the first step of Form A as a dialog in the chat."""
-    print("(form_handler_A.py)[open_form_A_dialog] Function called")
+    logging.info("(form_handler_A.py)[open_form_A_dialog] Function called")
     try:
         now_ms = int(datetime.now().timestamp() * 1000)
         sheet_data = get_data_from_sheet()
@@ -105,7 +141,7 @@ def open_form_A_dialog():
             }
         }
     except Exception as e:
-        logging.error(f"Error in open_form_A_dialog: {e}", exc_info=True)
+        logging.error("Error in open_form_A_dialog: %s", e, exc_info=True)
         return {}
 
 def open_confirmation_dialog(event):
@@ -161,84 +197,153 @@ def open_confirmation_dialog(event):
             }
         }
     except Exception as e:
-        logging.error(f"Error in open_confirmation_dialog: {e}", exc_info=True)
+        logging.error("Error in open_confirmation_dialog: %s", e, exc_info=True)
         return {}
 
+def generate_and_send(params, requester_email, requester_name, send_message_to_chat_func=send_message_to_chat):
+    """
+    Generates the Form A documents, shares them and notifies the requester.
+    This is a standalone job function: it only takes serializable arguments, so it can
+    run on the background pool or be enqueued to an RQ worker (see mail_handler).
+    """
+    # ANONYMIZED: Extract all your parameters
+    field1 = params.get('field1', '')
+    # ... and so on
+
+    try:
+        # 1. Define placeholders and their values from the form
+        replacements = {
+            "{{Placeholder1}}": field1,
+            # ... more replacements
+        }
+
+        # 2. ANONYMIZED: IDs for templates and target folders
+        template_id = "YOUR_PRESENTATION_TEMPLATE_ID"
+        target_folder_id = "YOUR_TARGET_DRIVE_FOLDER_ID"
+        checklist_file_id = "YOUR_CHECKLIST_FILE_ID"
+
+        space_name = params.get('space_name')
+        thread_name = params.get('thread_name')
+
+        def notify_chat(new_file_id, *shared):
+            presentation_url = f"https://docs.google.com/presentation/d/{new_file_id}/edit"
+            logging.info("Document URL: %s", presentation_url)
+            if space_name and thread_name:
+                send_message_to_chat_func(
+                    space_name,
+                    thread_name,
+                    f"🎉 Done! The document for {field1} has been generated.\n"
+                    f"👉 Presentation: {presentation_url}\n"
+                    f"📋 Checklist: {get_file_link(checklist_file_id)}\n"
+                )
+
+        # 3. The steps run as a task graph: the checklist is shared and exported while the
+        # template is still being filled, and the presentation is shared and exported in parallel.
+        # Steps completed before an RQ retry are not run again (see JobCheckpoint).
+        logging.info("Starting document generation...")
+        checkpoint = JobCheckpoint.current()
+        graph = TaskGraph("form_A")
+        graph.add("copy_and_fill", lambda: checkpoint.run("copy_and_fill", copy_and_fill_template,
+            template_id, f"{field1} - Generated Document", target_folder_id, replacements))
+        # 4. Share files with the relevant user (events without a user email only get the links)
+        share_steps = ()
+        if requester_email:
+            graph.add("share_presentation", lambda new_file_id: checkpoint.run(
+                "share_presentation", share_file, new_file_id, requester_email, "writer"), deps=("copy_and_fill",))
+            # The checklist is a shared master file: read access is enough.
+            graph.add("share_checklist", lambda: checkpoint.run(
+                "share_checklist", share_file, checklist_file_id, requester_email, "reader"))
+            share_steps = ("share_presentation", "share_checklist")
+        else:
+            logging.warning("No requester email in the event; the documents are not shared or emailed.")
+        # 5. Send a confirmation message back to the chat once both files are shared
+        graph.add("notify_chat", lambda *results: checkpoint.run("notify_chat", notify_chat, *results),
+                  deps=("copy_and_fill",) + share_steps)
+        # 6. (Optional) Email the documents as attachments
+        if requester_email and not checkpoint.is_done("send_email"):
+            graph.add("export_checklist", lambda: download_drive_file_as(checklist_file_id, PDF_MIME, "Checklist.pdf", use_cache=True))
+            graph.add("export_presentation", lambda new_file_id: download_drive_file_as(
+                new_file_id, PPTX_MIME, f"{field1}.pptx"), deps=("copy_and_fill",))
+            graph.add("send_email", lambda presentation, checklist: checkpoint.run("send_email", email_documents,
+                presentation, checklist, requester_email, requester_name, field1),
+                deps=("export_presentation", "export_checklist"))
+        try:
+            graph.run()
+        finally:
+            close_exports(graph)
+        record_generation_time(graph.duration)
+
+    except Exception as e:
+        logging.error("Error in generation job: %s", e, exc_info=True)
+        # Re-raise so the RQ retry policy can pick the job up again.
+        raise
+
+def close_exports(graph):
+    """Closes the downloaded files of a graph's export steps, e.g. when the email step failed or was skipped."""
+    for name in ("export_presentation", "export_checklist"):
+        content = (graph.results.get(name) or (None, None))[0]
+        if hasattr(content, 'close'):
+            content.close()
+
+def record_generation_time(seconds):
+    """Remembers the duration of a generation, in Redis as well when the RQ queue is used."""
+    _recent_generation_seconds.append(seconds)
+    if generation_queue is not None:
+        try:
+            redis_conn = generation_queue.connection
+            redis_conn.pipeline().lpush(GENERATION_SECONDS_KEY, seconds).ltrim(
+                GENERATION_SECONDS_KEY, 0, _recent_generation_seconds.maxlen - 1).execute()
+        except Exception as e:
+            logging.warning("(form_handler_A.py)[record_generation_time] Could not store the duration in Redis: %s", e)
+
+def recent_generation_times():
+    """Returns the durations of the recent generations, from Redis when the RQ queue is used."""
+    if generation_queue is not None:
+        try:
+            return [float(seconds) for seconds in generation_queue.connection.lrange(GENERATION_SECONDS_KEY, 0, -1)]
+        except Exception as e:
+            logging.warning("(form_handler_A.py)[recent_generation_times] Could not read the durations from Redis: %s", e)
+    return list(_recent_generation_seconds)
+
+def estimate_generation_time():
+    """Returns the expected generation time as text, from the median of the recent generations."""
+    recent = recent_generation_times()
+    seconds = statistics.median(recent) if recent else GENERATION_ESTIMATE_SECONDS
+    if seconds < 90:
+        return f"{max(10, round(seconds / 10) * 10)} seconds"
+    return f"{round(seconds / 60)} minutes"
+
 def submit_form_A(event, send_message_to_chat_func):
     """
     Final step: processes the confirmed data, generates documents, and sends notifications.
-    This function runs in a background thread to avoid blocking the UI.
+    The generation runs on an RQ worker or the shared background pool to avoid blocking the UI.
     """
     logging.info("Submitting Form A")
     try:
         params = event.get('common', {}).get('parameters', {})
-        logging.info(f"Form parameters: {params}")
-        
-        # ANONYMIZED: Extract all your parameters
-        field1 = params.get('field1', '')
-        # ... and so on
+        payload_logger.info("Form parameters: %s", truncate(params))
 
         requester_email = event.get('user', {}).get('email', '')
         requester_name = event.get('user', {}).get('displayName', '')
 
-        # This is a placeholder for the complex document generation logic.
-        def generate_and_send():
-            try:
-                # 1. Define placeholders and their values from the form
-                replacements = {
-                    "{{Placeholder1}}": field1,
-                    # ... more replacements
-                }
-
-                # 2. ANONYMIZED: IDs for templates and target folders
-                template_id = "YOUR_PRESENTATION_TEMPLATE_ID"
-                target_folder_id = "YOUR_TARGET_DRIVE_FOLDER_ID"
-                checklist_file_id = "YOUR_CHECKLIST_FILE_ID"
-
-                # 3. Copy and fill the template
-                logging.info("Starting document generation...")
-                new_file_id = copy_and_fill_template(template_id, f"{field1} - Generated Document", target_folder_id, replacements)
-                presentation_url = f"https://docs.google.com/presentation/d/{new_file_id}/edit"
-                logging.info(f"Document URL: {presentation_url}")
-
-                # 4. Share files with the relevant user
-                share_file(new_file_id, requester_email)
-                checklist_link = get_sharable_link(checklist_file_id, requester_email)
-
-                # 5. Send a confirmation message back to the chat
-                space_name = params.get('space_name')
-                thread_name = params.get('thread_name')
-                if space_name and thread_name:
-                    send_message_to_chat_func(
-                        space_name,
-                        thread_name,
-                        f"🎉 Done! The document for {field1} has been generated.\n"
-                        f"👉 Presentation: {presentation_url}\n"
-                        f"📋 Checklist: {checklist_link}\n"
-                    )
-                
-                # 6. (Optional) Email the documents as attachments
-                send_documents_by_email(
-                    presentation_id=new_file_id,
-                    checklist_id=checklist_file_id,
-                    recipient_email=requester_email,
-                    recipient_name=requester_name,
-                    title=field1
-                )
-
-            except Exception as e:
-                logging.error(f"Error in generation thread: {e}", exc_info=True)
-
         # Run the generation process in the background
-        threading.Thread(target=generate_and_send).start()
+        started = start_generation_task(
+            generate_and_send,
+            params,
+            requester_email,
+            requester_name,
+            job_id=make_job_id("form_a", params, requester_email)
+        )
+        if not started:
+            return {'actionResponse': {'type': "NEW_MESSAGE"}, 'text': QUEUE_FULL_TEXT}
         
         # Return an immediate response to the user
         return {
             'actionResponse': {'type': "NEW_MESSAGE"},
-            'text': "Processing your request... The document will be ready in about 2 minutes."
+            'text': f"Processing your request... The document will be ready in about {estimate_generation_time()}."
         }
     except Exception as e:
-        logging.error(f"Error in submit_form_A: {e}", exc_info=True)
+        logging.error("Error in submit_form_A: %s", e, exc_info=True)
         return {
             'actionResponse': {'type': "NEW_MESSAGE"},
             'text': f"❌ An error occurred: {e}"
@@ -247,43 +352,71 @@ def submit_form_A(event, send_message_to_chat_func):
 # --- Google Drive/Slides Helper Functions (Abstracted) ---
 # These functions contain the core logic for interacting with Google APIs.
 
+@traced("form_handler_A.copy_and_fill_template")
 def copy_and_fill_template(template_id, new_title, folder_id, replacements):
-    """Copies a Google Slides template, fills placeholders, and returns the new file ID."""
+    """
+    Copies a Google Slides template, fills placeholders, and returns the new file ID.
+    Two API calls: drive.files.copy (or moving a ready copy from the template pool),
+    then one slides batchUpdate for all text and images.
+    """
     logging.info("Copying and filling template")
-    # This would involve calls to Google Drive API to copy and Google Slides API to update text/images.
-    # This is a highly complex part of the original code and is abstracted here.
-    # Step 1: drive_service.files().copy(...)
-    # Step 2: slides_service.presentations().batchUpdate(...)
-    new_file_id = "mock_new_file_id" # Placeholder
-    print(f"Created and filled new file: {new_file_id}")
+    new_file_id = template_pool.copy_template(template_id, new_title, folder_id)
+    slides_engine.fill_presentation(new_file_id, replacements, template_id=template_id)
+    logging.info("Created and filled new file: %s", new_file_id)
     return new_file_id
 
-def share_file(file_id, email):
-    """Shares a Google Drive file with a user."""
-    logging.info(f"Sharing {file_id} with {email}")
-    # This would involve a call to drive_service.permissions().create(...)
-    print("Mock share complete.")
+@traced("form_handler_A.share_file")
+def share_file(file_id, email, role):
+    """
+    Shares a Google Drive file with a user in `role` ('reader', 'writer', ...). Grants made
+    at the same time by other submissions go out in one Drive batch request, and users who
+    already have access are skipped (see drive_sharing.py).
+    """
+    logging.info("Sharing %s with %s as %s", file_id, email, role)
+    return drive_sharing.share_file(file_id, email, role)
 
-def get_sharable_link(file_id, email):
-    """Shares a file and returns its web link."""
-    share_file(file_id, email)
+def get_file_link(file_id):
+    """Returns the web link of a file. The file has to be shared separately (share_file)."""
     return f"https://docs.google.com/file/d/{file_id}/view"
 
-def send_documents_by_email(presentation_id, checklist_id, recipient_email, recipient_name, title):
-    """Downloads documents and emails them as attachments."""
-    logging.info(f"Sending documents for '{title}' to {recipient_email}")
-    
-    # 1. Download files from Drive
-    checklist_bytes, checklist_filename = download_drive_file_as(checklist_id, 'application/pdf', "Checklist.pdf")
-    ppt_bytes, ppt_filename = download_drive_file_as(presentation_id, 'application/vnd.openxmlformats-officedocument.presentationml.presentation', f"{title}.pptx")
-
-    # 2. Prepare attachments
+def get_sharable_link(file_id, email, role):
+    """Shares a file in `role` and returns its web link."""
+    share_file(file_id, email, role)
+    return get_file_link(file_id)
+
+@traced("form_handler_A.email_documents")
+def email_documents(presentation, checklist, recipient_email, recipient_name, title):
+    """Emails downloaded documents, given as (content, filename) pairs, as attachments."""
+    logging.info("Sending documents for '%s' to %s", title, recipient_email)
+    (ppt_content, ppt_filename), (checklist_content, checklist_filename) = presentation, checklist
+
+    # 1. Prepare attachments
     attachments = []
-    if ppt_bytes: attachments.append({'content': ppt_bytes, 'filename': ppt_filename, 'mime': '...'})
-    if checklist_bytes: attachments.append({'content': checklist_bytes, 'filename': checklist_filename, 'mime': 'application/pdf'})
+    if ppt_content: attachments.append({'content': ppt_content, 'filename': ppt_filename, 'mime': PPTX_MIME})
+    if checklist_content: attachments.append({'content': checklist_content, 'filename': checklist_filename, 'mime': PDF_MIME})
 
-    # 3. Send email
+    # 2. Send email
     subject = f"Your generated documents for {title}"
     body = f"Hello {recipient_name},<br><br>Please find your documents attached."
-    send_mail_with_attachments(recipient_email, subject, body, attachments)
-    print("Email with documents sent.")
+    try:
+        send_mail_with_attachments(recipient_email, subject, body, attachments)
+    finally:
+        # Downloads are spooled to temporary files; release them right away.
+        for att in attachments:
+            if hasattr(att['content'], 'close'):
+                att['content'].close()
+    logging.info("Email with documents sent.")
+
+@traced("form_handler_A.send_documents_by_email")
+def send_documents_by_email(presentation_id, checklist_id, recipient_email, recipient_name, title):
+    """Downloads documents (both at once) and emails them as attachments."""
+    graph = TaskGraph("form_A_email")
+    graph.add("export_checklist", lambda: download_drive_file_as(checklist_id, PDF_MIME, "Checklist.pdf", use_cache=True))
+    graph.add("export_presentation", lambda: download_drive_file_as(presentation_id, PPTX_MIME, f"{title}.pptx"))
+    graph.add("send_email", lambda presentation, checklist: email_documents(
+        presentation, checklist, recipient_email, recipient_name, title),
+        deps=("export_presentation", "export_checklist"))
+    try:
+        graph.run()
+    finally:
+        close_exports(graph)
@@ -7,17 +7,26 @@
 # form_handler_B.py
 
 import logging
-import threading
+import os
 import re
-import google.auth
-from datetime import datetime
-from googleapiclient.discovery import build
-from chat_handler import get_ai_response
+from google_clients import get_sheets_service
+from snapshot_cache import SnapshotCache
+from tracing import traced
+import drive_sharing
+import slides_engine
+import template_pool
 
 # Import sub-handlers for different branches of Form B
 import form_handler_B_sub_A
 import form_handler_B_sub_B
 
+# --- Configuration ---
+# ANONYMIZED: The sheet with the known client names, one per row in the first column.
+# Names found in the notes are passed to the AI as fixed values. Leave empty to let the AI find the client.
+CLIENT_SPREADSHEET_ID = os.environ.get('CLIENT_SPREADSHEET_ID', '')
+CLIENT_SHEET_RANGE = os.environ.get('CLIENT_SHEET_RANGE', 'Clients!A2:A')
+CLIENT_CACHE_TTL_SECONDS = int(os.environ.get('CLIENT_CACHE_TTL_SECONDS', 300))
+
 # --- SHARED UTILITY FUNCTIONS ---
 
 def fetch_form_value(event, field):
@@ -57,24 +66,111 @@ def sum_time_fields(*fields):
     
     return " + ".join(parts) if parts else ""
 
+# --- Deterministic pre-extraction ---
+# Values that can be read from the form or the notes without the AI. They are passed to the
+# model as fixed inputs, and the model is asked only for the fields that need it.
+
+# An amount followed by a currency, e.g. "12 500 zł", "3.200,50 PLN".
+PRICE_RE = re.compile(r'(?<!\d)(\d{1,3}(?:[ \u00a0.]\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)\s*(?:zł|zl|pln)(?!\w)', re.I)
+# A percentage next to a discount word, in either order, e.g. "rabat 10%", "15% zniżki".
+DISCOUNT_RE = re.compile(
+    r'(?:rabat\w*|zniżk\w*|upust\w*|discount)\D{0,20}?(\d+(?:[.,]\d+)?)\s*%'
+    r'|(\d+(?:[.,]\d+)?)\s*%\s*(?:rabat\w*|zniżk\w*|upust\w*|discount)',
+    re.I
+)
+
+def normalize_price(amount):
+    """Converts an amount as written ("12 500", "3.200,50", "99.9") to the form's format ("12500", "3200,50", "99,9")."""
+    amount = re.sub(r'[ \u00a0]', '', amount)
+    if re.fullmatch(r'\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?', amount):
+        amount = amount.replace('.', '')
+    return amount.replace('.', ',')
+
+def find_prices(text):
+    """Returns the amounts with a currency found in the text, in order of appearance."""
+    return [normalize_price(match.group(1)) for match in PRICE_RE.finditer(text or '')]
+
+def find_discount(text):
+    """Returns the discount percentage mentioned in the text (e.g. "10" or "7,5"), or ""."""
+    match = DISCOUNT_RE.search(text or '')
+    return (match.group(1) or match.group(2)).replace('.', ',') if match else ""
+
+@traced("sheets.values.get")
+def load_client_names():
+    """Loader for the client list snapshot."""
+    if not CLIENT_SPREADSHEET_ID:
+        return []
+    result = get_sheets_service().spreadsheets().values().get(
+        spreadsheetId=CLIENT_SPREADSHEET_ID, range=CLIENT_SHEET_RANGE
+    ).execute()
+    return [row[0].strip() for row in result.get('values', []) if row and row[0].strip()]
+
+client_names_snapshot = SnapshotCache(load_client_names, CLIENT_CACHE_TTL_SECONDS, name="form_B_clients")
+
+def match_client_name(text, client_names=None):
+    """
+    Returns the client from the sheet list whose name occurs in the text (as whole words,
+    ignoring case), preferring the longest name, or "" if none does.
+    """
+    if client_names is None:
+        try:
+            client_names = client_names_snapshot.get() or []
+        except Exception as e:
+            logging.warning("(form_handler_B.py)[match_client_name] Could not load client names: %s", e)
+            client_names = []
+    text = (text or '').casefold()
+    for name in sorted(client_names, key=len, reverse=True):
+        if re.search(r'(?<!\w)' + re.escape(name.casefold()) + r'(?!\w)', text):
+            return name
+    return ""
+
+def pre_extract(notes, prices=(), discount="", **time_fields):
+    """
+    Reads the values that need no AI. `prices` are the form's phase prices (phase 1 first)
+    and `time_fields` the raw time inputs by output key, e.g. phase1_time="2+4".
+    Form values are used as given; empty ones are looked up in the notes. Returns only
+    the values that were found: client_name, price_phase<N>_before, discount and the
+    standardized times.
+    """
+    known = {}
+    client_name = match_client_name(notes)
+    if client_name:
+        known["client_name"] = client_name
+    notes_prices = find_prices(notes)
+    for i, price in enumerate(prices):
+        price = price or (notes_prices[i] if i < len(notes_prices) else "")
+        if price:
+            known[f"price_phase{i + 1}_before"] = price
+    discount = discount or find_discount(notes)
+    if discount:
+        known["discount"] = discount
+    for key, raw_time in time_fields.items():
+        time_value = sum_time_fields(raw_time)
+        if time_value:
+            known[key] = time_value
+    return known
+
+@traced("form_handler_B.copy_presentation")
 def copy_presentation(template_id, client_name, target_folder_id):
     """Copies a Google Slides presentation to a new file."""
-    logging.info("Copying presentation template.")
-    # This is an abstraction. The actual implementation requires Google Drive API calls.
-    print(f"Mock copy: template '{template_id}' to new file for '{client_name}' in folder '{target_folder_id}'.")
-    return "new_mock_file_id"
+    logging.info("Copying presentation template '%s' for '%s'.", template_id, client_name)
+    return template_pool.copy_template(template_id, f"{client_name} - Generated Document", target_folder_id)
 
-def fill_placeholders_in_presentation(presentation_id, replacements):
-    """Fills placeholders in a Google Slides presentation."""
-    logging.info(f"Filling placeholders for presentation {presentation_id}.")
-    # This is an abstraction. The actual implementation requires Google Slides API calls.
-    print(f"Mock fill: {len(replacements)} replacements applied.")
+@traced("form_handler_B.fill_placeholders_in_presentation")
+def fill_placeholders_in_presentation(presentation_id, replacements, template_id=None):
+    """
+    Fills placeholders in a Google Slides presentation with a single batchUpdate call.
+    Pass the `template_id` the presentation was copied from, so replacements for
+    placeholders the template does not contain are not sent (see slides_engine.py).
+    """
+    logging.info("Filling placeholders for presentation %s.", presentation_id)
+    return slides_engine.fill_presentation(presentation_id, replacements, template_id=template_id)
 
+@traced("form_handler_B.share_presentation_with_user")
 def share_presentation_with_user(file_id, user_email):
-    """Shares a Google Drive file with a specific user."""
-    logging.info(f"Sharing file {file_id} with {user_email}.")
-    # This is an abstraction. The actual implementation requires Google Drive API calls.
-    print("Mock share complete.")
+    """Shares a Google Drive file with a specific user, batched with concurrent grants (see drive_sharing.py)."""
+    logging.info("Sharing file %s with %s.", file_id, user_email)
+    return drive_sharing.share_file(file_id, user_email, 'writer')
 
 # --- FORM B: STEP 1 (Initial Dialog) ---
 
@@ -83,7 +179,7 @@ def open_form_B_dialog():
     Step 1: Displays the initial dialog for Form B, allowing the user to choose a sub-type
     and enter initial notes.
     """
-    print("(form_handler_B.py)[open_form_B_dialog] Opening dialog.")
+    logging.info("(form_handler_B.py)[open_form_B_dialog] Opening dialog.")
     try:
         widgets = [
             {"textParagraph": {"text": "<b>Choose a sub-type for Form B:</b>"}},
@@ -124,7 +220,7 @@ def open_form_B_dialog():
             }
         }
     except Exception as e:
-        logging.error(f"Error in open_form_B_dialog: {e}", exc_info=True)
+        logging.error("Error in open_form_B_dialog: %s", e, exc_info=True)
         return {}
 
 # --- FORM B: STEP 2 (Router) ---
@@ -135,7 +231,7 @@ def route_form_B_step2(event, send_message_to_chat):
     appropriate sub-handler to display the next step of the form.
     """
     subtype = fetch_form_value(event, "form_b_subtype")
-    logging.info(f"Selected Form B sub-type: {subtype}")
+    logging.info("Selected Form B sub-type: %s", subtype)
 
     if subtype == "SUB_B":
         # Delegate to the handler for Sub-type B
@@ -7,9 +7,12 @@
 # form_handler_B_sub_B.py
 
 import logging
-import threading
 import json
-from chat_handler import get_ai_response, send_message_to_chat
+from chat_handler import get_ai_json_response, make_json_schema, send_message_to_chat
+from mail_handler import start_generation_task, make_job_id, JobCheckpoint
+from task_executor import submit_background, QUEUE_FULL_TEXT
+from slides_engine import make_replacements
+from extraction_cache import extraction_cache, make_key, make_prompt_version
 # Import shared utility functions from the main Form B handler
 import form_handler_B as utils
 
@@ -18,11 +21,34 @@ import form_handler_B as utils
 TEMPLATE_ID = "YOUR_SUBTYPE_B_TEMPLATE_ID"
 TARGET_FOLDER_ID = "YOUR_SUBTYPE_B_TARGET_FOLDER_ID"
 
+# ANONYMIZED: This prompt and the fields below are highly specific to the original project.
+# They need to be completely rewritten to match your data structure and requirements.
+EXTRACTION_PROMPT = """
+You are an AI assistant. Your task is to process raw notes and fill in the fields of
+a "Sub-type B" document, as described in the response schema.
+
+RAW NOTES:
+\"\"\"{notes}\"\"\"
+
+FIXED VALUES (already known, use them as they are):
+{fixed_values}
+"""
+
+# Fields the AI fills in, with the description it is given for each.
+EXTRACTION_FIELDS = {
+    "client_name": "The name of the client.",
+    "situation_summary": "A professional summary of the client's situation in bullet points (use \\n).",
+    "project_goals": "The goals of the project in bullet points (use \\n).",
+}
+
+# Changes whenever the prompt or the fields are edited, which invalidates cached extractions.
+PROMPT_VERSION = make_prompt_version(EXTRACTION_PROMPT, EXTRACTION_FIELDS)
+
 def open_subtype_B_dialog(event, send_message_to_chat):
     """
     Step 2 (Sub-type B): Displays a form with fields specific to this sub-type.
     """
-    print("(form_handler_B_sub_B.py)[open_subtype_B_dialog] Opening dialog.")
+    logging.info("(form_handler_B_sub_B.py)[open_subtype_B_dialog] Opening dialog.")
     notes_value = utils.fetch_form_value(event, "notes")
 
     # These fields are specific to the original project's "WS" offer.
@@ -60,35 +86,23 @@ def open_subtype_B_dialog(event, send_message_to_chat):
         }
     }
 
-def call_ai_to_extract_data(notes: str) -> dict:
-    """
-    Calls the AI model with a specific prompt to extract and structure data for Sub-type B.
+def call_ai_to_extract_data(notes: str, raw_time_A: str = "", raw_time_B: str = "", prices=(), discount="") -> dict:
     """
-    # ANONYMIZED: This prompt is highly specific to the original project.
-    # It needs to be completely rewritten to match your data structure and requirements.
-    prompt = f"""
-    You are an AI assistant. Your task is to process raw notes and convert them
-    into a structured JSON object for generating a "Sub-type B" document.
-
-    RAW NOTES:
-    \"\"\"{notes}\"\"\"
-
-    EXPECTED JSON STRUCTURE:
-    - "client_name": The name of the client.
-    - "situation_summary": A professional summary of the client's situation in bullet points (use \\n).
-    - "project_goals": The goals of the project in bullet points (use \\n).
-
-    Return ONLY the JSON object.
+    Extracts the data for Sub-type B. Values that can be read without the AI (client from
+    the sheet list, times, prices, discount; see utils.pre_extract) are passed to the model
+    as fixed inputs, and the model returns only the remaining fields as structured JSON.
     """
-    try:
-        response_text = get_ai_response(prompt, research_mode=False)
-        start = response_text.find('{')
-        end = response_text.rfind('}')
-        if start == -1: return {}
-        return json.loads(response_text[start:end+1])
-    except Exception as e:
-        logging.error(f"Error processing AI response for Sub-type B: {e}", exc_info=True)
-        return {}
+    known = utils.pre_extract(notes, prices=prices, discount=discount, time_A=raw_time_A, time_B=raw_time_B)
+    fields = {key: description for key, description in EXTRACTION_FIELDS.items() if key not in known}
+    prompt = EXTRACTION_PROMPT.format(notes=notes, fixed_values=json.dumps(known, ensure_ascii=False, indent=1))
+    # Unchanged notes (e.g. when only a price was corrected in step 2) are answered from the cache.
+    cache_key = make_key("B", PROMPT_VERSION, notes, (raw_time_A, raw_time_B), fields)
+    extracted_data = extraction_cache.get("B", cache_key)
+    if extracted_data is None:
+        extracted_data = get_ai_json_response(prompt, make_json_schema(fields), research_mode=False) if fields else {}
+        extraction_cache.set(cache_key, extracted_data)
+    extracted_data.update(known)
+    return extracted_data
 
 def build_form_B_step3_ai(event, send_message_to_chat):
     """
@@ -107,15 +121,9 @@ def build_form_B_step3_ai(event, send_message_to_chat):
         thread_name = event.get('thread', {}).get('name')
 
         def process_and_display():
-            extracted = call_ai_to_extract_data(notes)
-            
-            # Add time and price data, processed by the server
-            extracted["time_A"] = utils.sum_time_fields(raw_time_A)
-            extracted["time_B"] = utils.sum_time_fields(raw_time_B)
+            # Times, prices and discount are read by the server and passed to the AI as fixed values
+            extracted = call_ai_to_extract_data(notes, raw_time_A, raw_time_B, prices=(price1, price2), discount=discount)
             extracted["total_time_phase1"] = utils.sum_time_fields(raw_time_A, raw_time_B)
-            extracted["price_phase1_before"] = price1
-            extracted["price_phase2_before"] = price2
-            extracted["discount"] = discount
             
             # ANONYMIZED: Build a card with input fields pre-filled with AI-extracted data.
             widgets = [
@@ -137,10 +145,11 @@ def build_form_B_step3_ai(event, send_message_to_chat):
             card = {'header': {'title': 'Verify Extracted Data (Sub-type B)'}, 'sections': [{'widgets': widgets}]}
             send_message_to_chat(space_name, thread_name, "Please verify the data extracted by the AI.", card)
 
-        threading.Thread(target=process_and_display).start()
+        if not submit_background(process_and_display):
+            return {'actionResponse': {'type': "NEW_MESSAGE"}, 'text': QUEUE_FULL_TEXT}
         return {'actionResponse': {'type': "NEW_MESSAGE"}, 'text': "Processing with AI..."}
     except Exception as e:
-        logging.error(f"Error in build_form_B_step3_ai (Sub-type B): {e}", exc_info=True)
+        logging.error("Error in build_form_B_step3_ai (Sub-type B): %s", e, exc_info=True)
         return {'text': f"Error: {e}"}
 
 def openConfirmation(event):
@@ -194,9 +203,46 @@ def openConfirmation(event):
         
         return {"actionResponse": {"type": "DIALOG", "dialogAction": {"dialog": {"body": card_body}}}}
     except Exception as e:
-        logging.error(f"Error in Sub-type B confirmation: {e}", exc_info=True)
+        logging.error("Error in Sub-type B confirmation: %s", e, exc_info=True)
         return {"text": f"An error occurred: {e}"}
 
+def generate_and_notify(params, user_email, send_message_to_chat=send_message_to_chat):
+    """
+    Generates the Sub-type B document and notifies the user.
+    This is a standalone job function: it only takes serializable arguments, so it can
+    run on the background pool or be enqueued to an RQ worker (see mail_handler).
+    """
+    space_name = params.get('space_name')
+    thread_name = params.get('thread_name')
+    checkpoint = JobCheckpoint.current()
+
+    try:
+        client_name = params.get('client_name', 'Unknown Client')
+        logging.info("Generating document for: %s", client_name)
+
+        replacements = make_replacements(params)
+        
+        # Steps completed before an RQ retry are not run again (see JobCheckpoint).
+        new_file_id = checkpoint.run("copy", utils.copy_presentation, TEMPLATE_ID, client_name, TARGET_FOLDER_ID)
+        checkpoint.run("fill", utils.fill_placeholders_in_presentation, new_file_id, replacements, TEMPLATE_ID)
+        
+        if user_email:
+            checkpoint.run("share", utils.share_presentation_with_user, new_file_id, user_email)
+
+        presentation_url = f"https://docs.google.com/presentation/d/{new_file_id}/edit"
+        checkpoint.run("notify_chat", send_message_to_chat,
+            space_name, 
+            thread_name,
+            f"Done! The document for **{client_name}** has been generated.\n\nEdit here: {presentation_url}"
+        )
+    except Exception as e:
+        logging.error("Error in generation job (Sub-type B): %s", e, exc_info=True)
+        # While RQ will retry the job, the user is not told about the failure.
+        if checkpoint.is_last_attempt:
+            send_message_to_chat(space_name, thread_name, f"A critical error occurred: {e}")
+        # Re-raise so the RQ retry policy can pick the job up again.
+        raise
+
 def submitForm(event, send_message_to_chat):
     """
     Step 5 (Sub-type B): Generates the document and notifies the user.
@@ -205,38 +251,20 @@ def submitForm(event, send_message_to_chat):
     try:
         params = event.get('common', {}).get('parameters', {})
         user_email = event.get('user', {}).get('email')
-        space_name = params.get('space_name')
-        thread_name = params.get('thread_name')
 
-        def generate_and_notify():
-            try:
-                client_name = params.get('client_name', 'Unknown Client')
-                logging.info(f"Generating document for: {client_name}")
-
-                replacements = {f"{{{{{key}}}}}": value for key, value in params.items()}
-                
-                new_file_id = utils.copy_presentation(TEMPLATE_ID, client_name, TARGET_FOLDER_ID)
-                utils.fill_placeholders_in_presentation(new_file_id, replacements)
-                
-                if user_email:
-                    utils.share_presentation_with_user(new_file_id, user_email)
-
-                presentation_url = f"https://docs.google.com/presentation/d/{new_file_id}/edit"
-                send_message_to_chat(
-                    space_name, 
-                    thread_name,
-                    f"Done! The document for **{client_name}** has been generated.\n\nEdit here: {presentation_url}"
-                )
-            except Exception as e:
-                logging.error(f"Error in generation thread (Sub-type B): {e}", exc_info=True)
-                send_message_to_chat(space_name, thread_name, f"A critical error occurred: {e}")
-
-        threading.Thread(target=generate_and_notify).start()
+        started = start_generation_task(
+            generate_and_notify,
+            params,
+            user_email,
+            job_id=make_job_id("form_b_sub_b", params, user_email)
+        )
+        if not started:
+            return {"actionResponse": {"type": "NEW_MESSAGE"}, "text": QUEUE_FULL_TEXT}
         
         return {
             "actionResponse": {"type": "NEW_MESSAGE"},
             "text": "Starting document generation for Sub-type B. You'll be notified when it's ready."
         }
     except Exception as e:
-        logging.error(f"Error in submitForm (Sub-type B): {e}", exc_info=True)
+        logging.error("Error in submitForm (Sub-type B): %s", e, exc_info=True)
         return {"text": f"An error occurred: {e}"}
@@ -0,0 +1,93 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file provides a shared factory for Google API clients (Sheets, Drive, Slides, Gmail).
+# Each client is built once per process and scope set, from the discovery documents
+# bundled with google-api-python-client, so no discovery fetch is needed at startup.
+
+# google_clients.py
+
+import threading
+import google.auth
+import google_auth_httplib2
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+# --- Scopes used by the agent ---
+SHEETS_READONLY_SCOPES = ('https://www.googleapis.com/auth/spreadsheets.readonly',)
+DRIVE_SCOPES = ('https://www.googleapis.com/auth/drive',)
+DRIVE_READONLY_SCOPES = ('https://www.googleapis.com/auth/drive.readonly',)
+SLIDES_SCOPES = ('https://www.googleapis.com/auth/presentations',)
+GMAIL_SCOPES = ('https://www.googleapis.com/auth/gmail.send',)
+
+_credentials = {}
+_services = {}
+_lock = threading.Lock()
+# httplib2.Http is not thread-safe, so every thread gets its own authorized transport.
+_thread_local = threading.local()
+
+def get_credentials(scopes):
+    """Returns the Application Default Credentials for a scope set, created once per process."""
+    key = frozenset(scopes)
+    credentials = _credentials.get(key)
+    if credentials is None:
+        with _lock:
+            credentials = _credentials.get(key)
+            if credentials is None:
+                credentials, _ = google.auth.default(scopes=list(scopes))
+                _credentials[key] = credentials
+    return credentials
+
+def _get_thread_http(credentials):
+    """Returns the calling thread's authorized HTTP transport for the given credentials."""
+    transports = getattr(_thread_local, 'transports', None)
+    if transports is None:
+        transports = _thread_local.transports = {}
+    http = transports.get(id(credentials))
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        transports[id(credentials)] = http
+    return http
+
+def _make_request_builder(credentials):
+    """Creates a requestBuilder that sends each request over the calling thread's transport."""
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(_get_thread_http(credentials), *args, **kwargs)
+    return build_request
+
+def get_service(service_name, version, scopes):
+    """
+    Returns the API client for a service, version and scope set.
+    The client is built once and shared by all threads; its requests always go
+    through a per-thread HTTP transport.
+    """
+    key = (service_name, version, frozenset(scopes))
+    service = _services.get(key)
+    if service is None:
+        credentials = get_credentials(scopes)
+        with _lock:
+            service = _services.get(key)
+            if service is None:
+                service = build(
+                    service_name,
+                    version,
+                    credentials=credentials,
+                    requestBuilder=_make_request_builder(credentials),
+                    static_discovery=True,
+                    cache_discovery=False
+                )
+                _services[key] = service
+    return service
+
+def get_sheets_service():
+    return get_service('sheets', 'v4', SHEETS_READONLY_SCOPES)
+
+def get_drive_service(readonly=False):
+    return get_service('drive', 'v3', DRIVE_READONLY_SCOPES if readonly else DRIVE_SCOPES)
+
+def get_slides_service():
+    return get_service('slides', 'v1', SLIDES_SCOPES)
+
+def get_gmail_service():
+    return get_service('gmail', 'v1', GMAIL_SCOPES)
@@ -0,0 +1,105 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file provides a shared, pooled HTTP session for outbound calls to the Google Chat REST API.
+
+# http_client.py
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- Configuration ---
+# All values can be overridden with environment variables.
+CHAT_HTTP_POOL_SIZE = int(os.environ.get('CHAT_HTTP_POOL_SIZE', 10))
+CHAT_HTTP_MAX_RETRIES = int(os.environ.get('CHAT_HTTP_MAX_RETRIES', 3))
+CHAT_HTTP_BACKOFF_FACTOR = float(os.environ.get('CHAT_HTTP_BACKOFF_FACTOR', 0.5))
+CHAT_HTTP_CONNECT_TIMEOUT = float(os.environ.get('CHAT_HTTP_CONNECT_TIMEOUT', 5))
+CHAT_HTTP_READ_TIMEOUT = float(os.environ.get('CHAT_HTTP_READ_TIMEOUT', 30))
+
+# Status codes that are worth retrying: rate limiting and transient server errors.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# POST (spaces.messages.create) is not idempotent: a 500/502/504 can come back after the
+# message was created, and a retry would post it twice. POSTs are only retried on the
+# codes that mean the request was not processed, and on connection errors.
+POST_RETRY_STATUS_CODES = (429, 503)
+
+class ChatRetry(Retry):
+    """
+    Retry policy that applies POST_RETRY_STATUS_CODES to POST requests, and does not
+    retry a POST whose response timed out (the request was sent, so the message may exist).
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST" and status_code not in POST_RETRY_STATUS_CODES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if error is not None and method and method.upper() == "POST" and self._is_read_error(error):
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that applies a default timeout to every request,
+    so a hanging Chat API call can never block a handler thread forever.
+    """
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+def build_session(
+    pool_size=CHAT_HTTP_POOL_SIZE,
+    max_retries=CHAT_HTTP_MAX_RETRIES,
+    backoff_factor=CHAT_HTTP_BACKOFF_FACTOR,
+    timeout=(CHAT_HTTP_CONNECT_TIMEOUT, CHAT_HTTP_READ_TIMEOUT)
+):
+    """
+    Creates a requests.Session with a keep-alive connection pool, retries with
+    exponential backoff on 429/5xx responses (only 429/503 for POST) and a default timeout.
+    """
+    retry = ChatRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        # PATCH (messages.update with the full text) is safe to repeat. POST is only
+        # retried when the request was not processed, see ChatRetry.
+        allowed_methods=frozenset({"GET", "POST", "PATCH", "PUT", "DELETE"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        timeout=timeout
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_chat_session = None
+_chat_session_lock = threading.Lock()
+
+def get_chat_session():
+    """
+    Returns the process-wide session used for all posts to Google Chat.
+    The session is created on first use; its connection pool is thread-safe,
+    so the background handler threads share the same keep-alive connections.
+    """
+    global _chat_session
+    if _chat_session is None:
+        with _chat_session_lock:
+            if _chat_session is None:
+                _chat_session = build_session()
+    return _chat_session
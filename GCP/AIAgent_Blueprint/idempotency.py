@@ -0,0 +1,204 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements duplicate-event suppression for Google Chat webhook retries.
+# The first delivery of an event runs its handler; retries get the original response back.
+
+# idempotency.py
+
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+from api_config import REDIS_URL, IDEMPOTENCY_BACKEND, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+from response_cache import LRUTTLCache
+from task_executor import QUEUE_FULL_TEXT
+
+# Stored while the first delivery of an event is still being handled.
+PENDING = "__pending__"
+# Reply to a duplicate whose original is still running (after IDEMPOTENCY_WAIT_SECONDS in memory).
+IN_PROGRESS_TEXT = "Your request is already being processed."
+
+def make_event_key(event: dict) -> str:
+    """
+    Builds the idempotency key of a chat event: the message the event belongs to (or its
+    event time when there is no message, e.g. in dialogs), the invoked action, its parameters,
+    the submitted form inputs and the user. A retried event produces the same key.
+    """
+    common = event.get('common', {})
+    message = event.get('message', {})
+    parameters = common.get('parameters', {})
+    raw = json.dumps([
+        message.get('name') or event.get('eventTime'),
+        common.get('invokedFunction') or message.get('slashCommand', {}).get('commandId'),
+        sorted(parameters.items()),
+        common.get('formInputs', {}),
+        event.get('user', {}).get('name')
+    ], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class MemoryIdempotencyStore:
+    """
+    Per-process store on top of the LRU+TTL cache. Thread-safe. A pending key has an event
+    that is set when its value is stored or deleted, so duplicates can wait without polling.
+    """
+
+    def __init__(self, ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_entries=4096):
+        self._cache = LRUTTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._finished = {}  # pending key -> threading.Event
+
+    def claim(self, key):
+        """Marks the key as pending. Returns False if it is already pending or done."""
+        with self._lock:
+            if self._cache.get(key) is not None:
+                return False
+            self._cache.set(key, PENDING)
+            self._finished[key] = threading.Event()
+            return True
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def wait(self, key, timeout):
+        """Waits up to `timeout` seconds while the key is pending and returns its value."""
+        with self._lock:
+            finished = self._finished.get(key)
+        if finished is not None:
+            finished.wait(timeout)
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+        self._finish(key)
+
+    def delete(self, key):
+        self._cache.delete(key)
+        self._finish(key)
+
+    def _finish(self, key):
+        with self._lock:
+            finished = self._finished.pop(key, None)
+        if finished is not None:
+            finished.set()
+
+class RedisIdempotencyStore:
+    """
+    Redis-backed store, so a retry is recognized even when it reaches another instance.
+    Redis errors are logged and the event is handled as new, so the agent keeps working
+    when Redis is unavailable.
+    """
+
+    def __init__(self, redis_conn, ttl_seconds=IDEMPOTENCY_TTL_SECONDS, prefix="idempotency:"):
+        self._redis = redis_conn
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def claim(self, key):
+        try:
+            return bool(self._redis.set(self.prefix + key, PENDING, nx=True, ex=int(self.ttl_seconds)))
+        except Exception as e:
+            logging.warning("(idempotency.py)[RedisIdempotencyStore.claim] Redis error: %s", e)
+            return True
+
+    def get(self, key):
+        try:
+            value = self._redis.get(self.prefix + key)
+            return value.decode('utf-8') if value is not None else None
+        except Exception as e:
+            logging.warning("(idempotency.py)[RedisIdempotencyStore.get] Redis error: %s", e)
+            return None
+
+    def wait(self, key, timeout):
+        """Returns the key's value right away: polling Redis would hold a request thread."""
+        return self.get(key)
+
+    def set(self, key, value):
+        try:
+            self._redis.setex(self.prefix + key, int(self.ttl_seconds), value)
+        except Exception as e:
+            logging.warning("(idempotency.py)[RedisIdempotencyStore.set] Redis error: %s", e)
+
+    def delete(self, key):
+        try:
+            self._redis.delete(self.prefix + key)
+        except Exception as e:
+            logging.warning("(idempotency.py)[RedisIdempotencyStore.delete] Redis error: %s", e)
+
+def is_final_response(body) -> bool:
+    """A 'queue full' reply is not remembered, so the user can try the same action again."""
+    return not (isinstance(body, dict) and body.get('text') == QUEUE_FULL_TEXT)
+
+class IdempotencyGuard:
+    """
+    Runs a handler once per idempotency key and remembers its response.
+    A duplicate that arrives while the original is still running waits up to
+    `wait_seconds` for its response with the memory store, and gets IN_PROGRESS_TEXT
+    right away with Redis. If the handler raises, the key is released so the next
+    delivery is handled again.
+    """
+
+    def __init__(self, store, wait_seconds=IDEMPOTENCY_WAIT_SECONDS):
+        self.store = store
+        self.wait_seconds = wait_seconds
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name, route):
+        with self._lock:
+            self._counts[name] += 1
+            if name != "handled":
+                self._counts[f"{name}:{route}"] += 1
+
+    def run(self, event, handler, route=""):
+        """Returns handler(event), or the remembered response if the event is a duplicate."""
+        key = make_event_key(event)
+        if self.store.claim(key):
+            self._count("handled", route)
+            try:
+                body = handler(event)
+            except Exception:
+                self.store.delete(key)
+                raise
+            if is_final_response(body):
+                self.store.set(key, json.dumps(body))
+            else:
+                self.store.delete(key)
+            return body
+
+        stored = self.store.wait(key, self.wait_seconds)
+        if stored is None:
+            # The original failed and released the key; handle this delivery as new.
+            return self.run(event, handler, route)
+        if stored != PENDING:
+            self._count("duplicates", route)
+            logging.info("(idempotency.py)[IdempotencyGuard.run] Duplicate event for %s, returning the original response.", route)
+            return json.loads(stored)
+        self._count("duplicates_in_progress", route)
+        logging.info("(idempotency.py)[IdempotencyGuard.run] Duplicate event for %s while the original is still running.", route)
+        return {'text': IN_PROGRESS_TEXT}
+
+    def wrap(self, route, handler):
+        """Returns a handler(event) that runs `handler` through this guard."""
+        return lambda event: self.run(event, handler, route)
+
+    def stats(self):
+        """Returns the number of handled events and suppressed duplicates, in total and per route."""
+        with self._lock:
+            return dict(self._counts)
+
+def build_store(backend_name=IDEMPOTENCY_BACKEND):
+    """
+    Creates the configured store ('memory' or 'redis').
+    Falls back to the in-memory store if Redis cannot be set up.
+    """
+    if backend_name == 'redis':
+        try:
+            from redis import Redis
+            return RedisIdempotencyStore(Redis.from_url(REDIS_URL))
+        except Exception as e:
+            logging.error("(idempotency.py)[build_store] Could not set up Redis store: %s. Using in-memory store.", e)
+    return MemoryIdempotencyStore()
+
+idempotency_guard = IdempotencyGuard(build_store())
@@ -6,13 +6,13 @@
 
 # json_builder.py
 
-import json
+import logging
 
 def create_text_message(text_content=None, thread_name=None):
     """
     Creates a simple text message payload for the Google Chat API.
     """
-    print("(json_builder.py)[create_text_message] Creating text message")
+    logging.info("(json_builder.py)[create_text_message] Creating text message")
     message = {}
     if text_content:
         message["text"] = text_content
@@ -24,7 +24,7 @@ def create_card_message(card_content_list=None, text_content=None, thread_name=N
     """
     Creates a message payload containing one or more cards (v2).
     """
-    print("(json_builder.py)[create_card_message] Creating card message")
+    logging.info("(json_builder.py)[create_card_message] Creating card message")
     message = {}
     if card_content_list:
         # The API expects a list of card objects
@@ -40,7 +40,7 @@ def create_dialog_action(dialog_body_sections):
     """
     Creates a response that opens a new dialog window in the chat interface.
     """
-    print("(json_builder.py)[create_dialog_action] Creating dialog action")
+    logging.info("(json_builder.py)[create_dialog_action] Creating dialog action")
     return {
         "actionResponse": {
             "type": "DIALOG",
@@ -58,7 +58,7 @@ def create_update_message_action(card_body_sections, text_content=None):
     """
     Creates a response that updates the message from which a card action was triggered.
     """
-    print("(json_builder.py)[create_update_message_action] Creating update message action")
+    logging.info("(json_builder.py)[create_update_message_action] Creating update message action")
     action = {
         "actionResponse": {
             "type": "UPDATE_MESSAGE"
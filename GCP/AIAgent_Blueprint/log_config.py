@@ -0,0 +1,201 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file sets up the agent's logging: JSON lines (one object per record, as read by
+# Cloud Logging), payload truncation, per-category sampling and a queue so that log I/O
+# runs on a listener thread instead of the request thread.
+
+# log_config.py
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from tracing import RequestIdFilter
+
+# --- Configuration ---
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 'json' for structured logs, 'text' for plain lines during local development.
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+# Longest payload (request/response body, prompt, AI answer) written by truncate().
+LOG_MAX_PAYLOAD_CHARS = int(os.environ.get('LOG_MAX_PAYLOAD_CHARS', 500))
+# Longest message written at all; longer messages are cut by the formatter.
+LOG_MAX_MESSAGE_CHARS = int(os.environ.get('LOG_MAX_MESSAGE_CHARS', 4000))
+# Share of records kept per category, e.g. "payload=0.1,ai=0.1". Categories not listed keep
+# every record; warnings and errors are always kept.
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'payload=0.1,ai=0.1')
+
+# Categories. Records logged through get_logger(category) can be sampled.
+PAYLOAD = "payload"   # event and response bodies, form parameters, Chat API responses
+AI = "ai"             # prompts sent to and answers received from Gemini
+
+CATEGORY_PREFIX = "agent."
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+# Attributes of every LogRecord; anything else on a record was passed via `extra`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_configured = False
+_listener = None
+
+def get_logger(category: str) -> logging.Logger:
+    """Returns the logger of a sampled category, e.g. get_logger(PAYLOAD)."""
+    return logging.getLogger(CATEGORY_PREFIX + category)
+
+def parse_sample_rates(spec: str) -> dict:
+    """Parses "payload=0.1,ai=0.5" into {'payload': 0.1, 'ai': 0.5}."""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            category, rate = item.split('=', 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+class Truncated:
+    """
+    Defers rendering of a payload until a record has passed the level and sampling checks,
+    and cuts it to `limit` characters. Dicts and lists are rendered as JSON.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if not isinstance(value, str):
+            try:
+                value = json.dumps(value, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                value = repr(value)
+        if len(value) <= self.limit:
+            return value
+        return f"{value[:self.limit]}...(+{len(value) - self.limit} chars)"
+
+def truncate(value, limit=None) -> Truncated:
+    """Wraps a payload for use as a lazy logging argument: logging.info("Body: %s", truncate(body))."""
+    return Truncated(value, LOG_MAX_PAYLOAD_CHARS if limit is None else limit)
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the INFO/DEBUG records of each category logger; never drops warnings."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not record.name.startswith(CATEGORY_PREFIX):
+            return True
+        rate = self.rates.get(record.name[len(CATEGORY_PREFIX):], 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, including fields passed via `extra`."""
+
+    def format(self, record):
+        message = record.getMessage()
+        if len(message) > LOG_MAX_MESSAGE_CHARS:
+            message = f"{message[:LOG_MAX_MESSAGE_CHARS]}...(+{len(message) - LOG_MAX_MESSAGE_CHARS} chars)"
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "message": message,
+            "logger": record.name,
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts records on an in-process queue for the listener thread, which formats and writes them.
+    Only the message is rendered here, on the calling thread: the arguments may be dicts or lists
+    the caller changes right after logging them. Records dropped by a filter are never rendered.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def setup_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, use_queue=True):
+    """
+    Configures the root logger once per process: records pass the sampling filter on the
+    calling thread and are written by a QueueListener thread. With use_queue=False they are
+    written directly, e.g. in the RQ worker, whose job processes exit without running atexit
+    hooks. Safe to call more than once.
+    """
+    global _configured, _listener
+    if _configured:
+        return
+    _configured = True
+    root = logging.getLogger()
+
+    output_handler = logging.StreamHandler(sys.stderr)
+    output_handler.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+    sampling_filter = SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES))
+    request_id_filter = RequestIdFilter()
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+    if not use_queue:
+        output_handler.addFilter(sampling_filter)
+        output_handler.addFilter(request_id_filter)
+        root.addHandler(output_handler)
+        return
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(sampling_filter)
+    # Runs on the calling thread, where the request ID is known.
+    queue_handler.addFilter(request_id_filter)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, output_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+def _restart_after_fork():
+    """The listener thread does not survive fork(); give the child its own queue and listener."""
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+def shutdown_logging():
+    """
+    Writes out the queued records and stops the listener thread. Records logged afterwards
+    (e.g. by exit hooks draining background tasks) are written directly on the calling thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+            for output_handler in _listener.handlers:
+                for log_filter in handler.filters:
+                    output_handler.addFilter(log_filter)
+                root.addHandler(output_handler)
+    _listener = None
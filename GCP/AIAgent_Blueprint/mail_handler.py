@@ -7,17 +7,20 @@
 # mail_handler.py
 
 import os
-import base64
+import atexit
+import hashlib
 import logging
 import json
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import tempfile
+import threading
 from chat_handler import send_message_to_chat
-from rq import Queue
-from redis import Redis
+from api_config import REDIS_URL
+from tracing import span, traced
+from metrics import SMTP_SENDS
+from task_executor import submit_background
+from smtp_pool import SMTPConnectionPool
+from mime_stream import iter_mime_message
+from drive_export_cache import get_export_cache, make_export_key, DRIVE_EXPORT_CACHE_LOOKUPS
 
 # --- Configuration ---
 # It is strongly recommended to load credentials from environment variables or a secure secret manager,
@@ -38,35 +41,113 @@ try:
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
 
 except (FileNotFoundError, KeyError) as e:
-    logging.error(f"Could not load mail configuration: {e}. Please set environment variables.")
+    logging.error("Could not load mail configuration: %s. Please set environment variables.", e)
     SMTP_EMAIL = None # Ensure the app can start but emailing will fail.
 
+# Drive downloads are fetched in chunks of this many bytes (the client library defaults to 100 MB).
+DRIVE_DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DRIVE_DOWNLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+# Downloaded attachments up to this size stay in memory; larger ones are spooled to a temporary file.
+ATTACHMENT_SPOOL_MAX_MEMORY = int(os.environ.get('ATTACHMENT_SPOOL_MAX_MEMORY', 1024 * 1024))
+
+# Authenticated SMTP connections are pooled and reused between emails (see smtp_pool.py).
+_smtp_pool = None
+_smtp_pool_lock = threading.Lock()
+
+def get_smtp_pool():
+    """Returns the process-wide SMTP connection pool, creating it on first use."""
+    global _smtp_pool
+    if _smtp_pool is None:
+        with _smtp_pool_lock:
+            if _smtp_pool is None:
+                _smtp_pool = SMTPConnectionPool(SMTP_SERVER, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD)
+                atexit.register(_smtp_pool.close)
+    return _smtp_pool
+
 # --- Background Task Queue Setup ---
-# This uses Redis and RQ to run long-running tasks (like document generation) in the background.
-try:
-    redis_conn = Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379'))
-    q = Queue(connection=redis_conn)
-    logging.info("Successfully connected to Redis for background tasks.")
-except Exception as e:
-    logging.error(f"Could not connect to Redis: {e}. Background tasks will not work.")
-    q = None
-
-def download_drive_file_as(file_id, export_mime, filename):
+# This uses Redis and RQ to run long-running tasks (like document generation) on separate
+# worker processes (see worker.py), so web instances can scale independently of Drive/Slides work.
+# When the queue is disabled, the tasks run on the in-process background pool instead.
+GENERATION_QUEUE_ENABLED = os.environ.get('GENERATION_QUEUE_ENABLED', 'false').lower() == 'true'
+GENERATION_QUEUE_NAME = os.environ.get('GENERATION_QUEUE_NAME', 'generation')
+GENERATION_JOB_TIMEOUT = int(os.environ.get('GENERATION_JOB_TIMEOUT', 600))
+GENERATION_JOB_RETRIES = int(os.environ.get('GENERATION_JOB_RETRIES', 2))
+# Seconds to wait before each retry attempt.
+GENERATION_RETRY_INTERVALS = [30, 120]
+
+q = None
+if GENERATION_QUEUE_ENABLED:
+    try:
+        # RQ and Redis are only imported when the queue is actually used.
+        from redis import Redis
+        from rq import Queue
+        redis_conn = Redis.from_url(REDIS_URL)
+        redis_conn.ping()
+        q = Queue(GENERATION_QUEUE_NAME, connection=redis_conn)
+        logging.info("Successfully connected to Redis for background tasks.")
+    except Exception as e:
+        logging.error("Could not connect to Redis: %s. Background tasks will run in-process.", e)
+        q = None
+
+@traced("drive.files.get_revision")
+def get_drive_file_revision(file_id):
+    """
+    Returns an ID that changes whenever the file's content changes: its headRevisionId, or its
+    modifiedTime for Google Docs/Slides files, which have no headRevisionId. (Their version is
+    not used: it also changes on sharing, e.g. each time the checklist is shared.) Returns None on errors.
+    """
+    from google_clients import get_drive_service
+    try:
+        metadata = get_drive_service(readonly=True).files().get(
+            fileId=file_id, fields='headRevisionId,modifiedTime', supportsAllDrives=True
+        ).execute()
+        return metadata.get('headRevisionId') or metadata.get('modifiedTime')
+    except Exception as e:
+        logging.warning("(mail_handler.py)[get_drive_file_revision] Could not get the revision of %s: %s", file_id, e)
+        return None
+
+@traced("drive.files.export")
+def download_drive_file_as(file_id, export_mime, filename, use_cache=False):
     """
     Downloads a file from Google Drive, exporting it to a specified MIME type.
-    Used for converting Google Docs/Slides to PDF/PPTX.
+    Used for converting Google Docs/Slides to PDF/PPTX. With export_mime=None the file
+    is downloaded as stored, e.g. an uploaded PDF.
+    The content is returned as a binary file object (a SpooledTemporaryFile, on disk once
+    it exceeds ATTACHMENT_SPOOL_MAX_MEMORY), downloaded in DRIVE_DOWNLOAD_CHUNK_SIZE chunks.
+    With use_cache=True, for files that rarely change, the export is kept in the on-disk
+    export cache and later calls only check the file's revision (see drive_export_cache.py).
     """
-    import google.auth
-    from googleapiclient.discovery import build
-    SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+    from google_clients import get_drive_service
+    from googleapiclient.http import MediaIoBaseDownload
+    cache = get_export_cache() if use_cache else None
+    cache_key = None
+    if cache is not None:
+        revision = get_drive_file_revision(file_id)
+        if revision is not None:
+            cache_key = make_export_key(file_id, export_mime, revision)
+            cached = cache.get(cache_key)
+            DRIVE_EXPORT_CACHE_LOOKUPS.inc("hit" if cached else "miss")
+            if cached:
+                return cached, filename
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_MAX_MEMORY)
     try:
-        credentials, _ = google.auth.default(scopes=SCOPES)
-        drive_service = build('drive', 'v3', credentials=credentials)
-        request = drive_service.files().export_media(fileId=file_id, mimeType=export_mime)
-        data = request.execute()
-        return data, filename
+        files = get_drive_service(readonly=True).files()
+        if export_mime:
+            request = files.export_media(fileId=file_id, mimeType=export_mime)
+        else:
+            request = files.get_media(fileId=file_id)
+        downloader = MediaIoBaseDownload(spooled, request, chunksize=DRIVE_DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=2)
+        if cache_key is not None:
+            spooled.seek(0)
+            cache.put(cache_key, spooled)
+        spooled.seek(0)
+        return spooled, filename
     except Exception as e:
-        logging.error(f"(mail_handler.py)[download_drive_file_as] Error downloading file: {e}", exc_info=True)
+        spooled.close()
+        logging.error("(mail_handler.py)[download_drive_file_as] Error downloading file: %s", e, exc_info=True)
         return None, filename
 
 def send_mail_with_attachments(
@@ -80,35 +161,25 @@ def send_mail_with_attachments(
 ):
     """
     Sends an email using SMTP with optional attachments and a chat notification.
+    Attachments are dicts with 'content' (bytes or a binary file object, e.g. from
+    download_drive_file_as), 'filename' and 'mime'. The message is base64-encoded
+    chunk by chunk while it is written to the SMTP connection.
     """
     if not SMTP_EMAIL or not SMTP_PASSWORD:
         logging.error("SMTP credentials are not configured. Cannot send email.")
         return
 
-    print(f"(mail_handler.py)[send_mail_with_attachments] Sending email to {to_email} with subject '{subject}'.")
+    logging.info("(mail_handler.py)[send_mail_with_attachments] Sending email to %s with subject '%s'.", to_email, subject)
     try:
-        message = MIMEMultipart()
-        message['To'] = to_email
-        message['From'] = f"AI Agent <{SMTP_EMAIL}>" # Anonymized sender
-        message['Subject'] = subject
-
-        message.attach(MIMEText(body_html, 'html'))
-
-        if attachments:
-            for att in attachments:
-                if not att.get('content') or not att.get('mime'):
-                    continue
-                part = MIMEBase(*att['mime'].split('/'))
-                part.set_payload(att['content'])
-                encoders.encode_base64(part)
-                part.add_header('Content-Disposition', f'attachment; filename="{att["filename"]}"')
-                message.attach(part)
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.sendmail(SMTP_EMAIL, to_email, message.as_string())
-        logging.info(f"(mail_handler.py)[send_mail_with_attachments] Message sent to {to_email}")
+        sender = f"AI Agent <{SMTP_EMAIL}>" # Anonymized sender
+
+        with span("smtp.send", attachments=len(attachments or [])):
+            get_smtp_pool().send_stream(
+                SMTP_EMAIL, [to_email],
+                lambda: iter_mime_message(sender, to_email, subject, body_html, attachments)
+            )
+        SMTP_SENDS.inc("ok")
+        logging.info("(mail_handler.py)[send_mail_with_attachments] Message sent to %s", to_email)
 
         # Send a notification to Google Chat if requested
         if space_name and thread_name:
@@ -116,24 +187,100 @@ def send_mail_with_attachments(
             send_message_to_chat(space_name, thread_name, notify_text)
 
     except Exception as e:
-        logging.error(f"(mail_handler.py)[send_mail_with_attachments] SMTP Error: {e}", exc_info=True)
+        SMTP_SENDS.inc("error")
+        logging.error("(mail_handler.py)[send_mail_with_attachments] SMTP Error: %s", e, exc_info=True)
+
+def make_job_id(prefix, params, user_email):
+    """
+    Builds a deterministic job ID from the form parameters, so the same submission
+    maps to the same RQ job and shows up under a recognizable name in the queue.
+    """
+    raw = json.dumps([params, user_email], sort_keys=True, default=str)
+    return f"{prefix}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+class JobCheckpoint:
+    """
+    Progress of a generation job. RQ retries a failed job from the start, so every step
+    that has an effect outside the job (copying the template, sharing, the chat message)
+    is run through run(): on an RQ worker its result is saved in the job's meta, and a
+    retry returns the saved result instead of running the step again. On the background
+    pool a job runs once and nothing is saved.
+    """
+
+    def __init__(self, job=None):
+        self._job = job
+        self._steps = dict(job.meta.get('steps', {})) if job is not None else {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def current(cls):
+        """Returns the checkpoint of the RQ job being executed, or an empty one outside RQ."""
+        try:
+            from rq import get_current_job
+            return cls(get_current_job())
+        except ImportError:
+            return cls()
+
+    @property
+    def is_last_attempt(self):
+        """False while RQ will still retry the job if it fails."""
+        return self._job is None or not self._job.retries_left
+
+    def is_done(self, step):
+        with self._lock:
+            return step in self._steps
+
+    def run(self, step, fn, *args):
+        """Runs fn(*args) unless the step completed in an earlier attempt. The result must be picklable."""
+        with self._lock:
+            if step in self._steps:
+                logging.info("(mail_handler.py)[JobCheckpoint.run] Step '%s' completed in an earlier attempt; skipping.", step)
+                return self._steps[step]
+        result = fn(*args)
+        with self._lock:
+            self._steps[step] = result
+            if self._job is not None:
+                self._job.meta['steps'] = dict(self._steps)
+                try:
+                    self._job.save_meta()
+                except Exception as e:
+                    logging.warning("(mail_handler.py)[JobCheckpoint.run] Could not save progress of step '%s': %s", step, e)
+        return result
+
+def enqueue_generation_task(func, *args, job_id=None):
+    """
+    Enqueues a long-running document generation task to be processed by an RQ worker.
+    `func` must be an importable module-level function, e.g. form_handler_A.generate_and_send.
+    Returns the RQ job, or None if the queue is not available.
+    """
+    if not q:
+        return None
+    from rq import Retry
+    try:
+        if job_id:
+            existing = q.fetch_job(job_id)
+            if existing and existing.get_status() in ('queued', 'started', 'deferred', 'scheduled'):
+                logging.info("(mail_handler.py)[enqueue_generation_task] Job %s is already pending.", job_id)
+                return existing
+        job = q.enqueue(
+            func,
+            *args,
+            job_id=job_id,
+            job_timeout=GENERATION_JOB_TIMEOUT,
+            retry=Retry(max=GENERATION_JOB_RETRIES, interval=GENERATION_RETRY_INTERVALS)
+        )
+        logging.info("(mail_handler.py)[enqueue_generation_task] Task enqueued for background processing: %s", job.id)
+        return job
+    except Exception as e:
+        logging.error("(mail_handler.py)[enqueue_generation_task] Could not enqueue task: %s", e, exc_info=True)
+        return None
 
-def enqueue_generation_task(form_data):
+def start_generation_task(func, *args, job_id=None):
     """
-    Enqueues a long-running document generation task to be processed by a background worker.
+    Starts a document generation task on the RQ queue when it is enabled,
+    otherwise on the in-process background pool.
+    Returns False if the task could not be started (the pool is full).
     """
-    if q:
-        # The function to be executed in the background and its arguments are passed here.
-        # 'generate_and_send' would be a function defined in the form handler.
-        # q.enqueue(generate_and_send, form_data)
-        logging.info("Task enqueued for background processing.")
-        return {
-            'actionResponse': {'type': "NEW_MESSAGE"},
-            'text': "Your request is being processed in the background. You will be notified upon completion."
-        }
-    else:
-        logging.error("Redis queue is not available. Cannot enqueue task.")
-        return {
-            'actionResponse': {'type': "NEW_MESSAGE"},
-            'text': "Error: Could not connect to the background task processor."
-        }
+    if enqueue_generation_task(func, *args, job_id=job_id):
+        return True
+    return submit_background(func, *args)
@@ -0,0 +1,179 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements an in-process metrics registry (counters, histograms, callback gauges)
+# rendered in the Prometheus text exposition format for the /metrics route.
+
+# metrics.py
+
+import bisect
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+AI_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    A monotonically increasing value per label set. An update holds the metric's own
+    lock for a single dictionary write, so handler threads hardly ever wait on each other.
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_number(value)}")
+        return lines
+
+class Histogram:
+    """A distribution of observed values per label set, with cumulative buckets in the output."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum.
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        with self._lock:
+            series_items = [(labelvalues, list(series)) for labelvalues, series in self._series.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, series in sorted(series_items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_number(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class CallbackMetric:
+    """
+    A gauge (or counter) read from a callback at scrape time, for values another component
+    already tracks, such as the background pool size. Keeping it current costs nothing.
+    """
+
+    def __init__(self, name, documentation, callback, metric_type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            lines.append(f"{self.name} {_format_number(self.callback())}")
+        except Exception:
+            pass
+        return lines
+
+class Registry:
+    """Holds the metrics of this process and renders them for /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, callback):
+        return self.register(CallbackMetric(name, documentation, callback))
+
+    def counter_callback(self, name, documentation, callback):
+        return self.register(CallbackMetric(name, documentation, callback, metric_type="counter"))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# --- Agent metrics ---
+# Defined here, so every module records into the same series.
+EVENTS = registry.counter("agent_events_total", "Chat events received, by event type.", ("type",))
+SLASH_COMMANDS = registry.counter("agent_slash_commands_total", "Slash commands received, by command ID.", ("command",))
+CARD_ACTIONS = registry.counter("agent_card_actions_total", "Card actions received, by invoked function.", ("action",))
+ROUTE_LATENCY = registry.histogram(
+    "agent_route_latency_seconds", "Time spent in route handlers.", ("kind", "key")
+)
+AI_CALLS = registry.counter("agent_ai_calls_total", "Gemini calls, by model and outcome.", ("model", "status"))
+AI_LATENCY = registry.histogram(
+    "agent_ai_latency_seconds", "Gemini call latency, by model.", ("model",), buckets=AI_LATENCY_BUCKETS
+)
+AI_TOKENS = registry.counter("agent_ai_tokens_total", "Gemini tokens, by model and direction (prompt/output).", ("model", "direction"))
+AI_CACHE_LOOKUPS = registry.counter("agent_ai_cache_lookups_total", "AI response cache lookups, by result (hit/miss).", ("result",))
+SMTP_SENDS = registry.counter("agent_smtp_sends_total", "Emails sent over SMTP, by outcome.", ("status",))
+CHAT_API_RESPONSES = registry.counter(
+    "agent_chat_api_responses_total", "Google Chat API responses, by method and HTTP status code.", ("method", "status_code")
+)
+
+def record_ai_call(model_name, seconds, response=None, status="ok"):
+    """Records one Gemini call: its outcome, latency and, when reported, its token counts."""
+    AI_CALLS.inc(model_name, status)
+    AI_LATENCY.observe(seconds, model_name)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        AI_TOKENS.inc(model_name, "prompt", amount=getattr(usage, 'prompt_token_count', 0) or 0)
+        AI_TOKENS.inc(model_name, "output", amount=getattr(usage, 'candidates_token_count', 0) or 0)
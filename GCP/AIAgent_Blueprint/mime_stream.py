@@ -0,0 +1,78 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file builds multipart emails as a stream of base64-encoded chunks, so attachments are
+# read from their files piece by piece and never held in memory as a whole.
+
+# mime_stream.py
+
+import base64
+import os
+import secrets
+from email import policy
+from email.message import Message
+
+# Bytes of attachment data read and encoded at once. A multiple of 57, so every chunk
+# encodes to whole 76-character base64 lines.
+MIME_STREAM_CHUNK_SIZE = int(os.environ.get('MIME_STREAM_CHUNK_SIZE', 57 * 1024))
+
+def _headers(headers, policy_=policy.SMTP):
+    """Serializes headers (a list of (name, value, params) tuples) followed by the empty line."""
+    part = Message(policy=policy_)
+    for name, value, params in headers:
+        part.add_header(name, value, **params)
+    return part.as_bytes()
+
+def _encode(data):
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+def _iter_content(content, chunk_size):
+    """Yields the raw bytes of an attachment given as bytes or as a binary file object."""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        view = memoryview(content)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+        return
+    content.seek(0)
+    while True:
+        data = content.read(chunk_size)
+        if not data:
+            return
+        yield data
+
+def iter_mime_message(from_addr, to_email, subject, body_html, attachments=None, chunk_size=MIME_STREAM_CHUNK_SIZE):
+    """
+    Yields a multipart/mixed message with an HTML body and attachments as CRLF-terminated
+    byte chunks, ready to be written to an SMTP DATA stream.
+    Attachments are dicts with 'content' (bytes or a binary file object), 'filename' and 'mime'.
+    File objects are read from the beginning, so the generator can be started again for a retry.
+    """
+    chunk_size -= chunk_size % 57
+    boundary = f"===============_{secrets.token_hex(16)}=="
+    # The multipart Content-Type is written by hand: the email package would add an
+    # empty body for a multipart header without parts.
+    yield _headers([
+        ('From', from_addr, {}),
+        ('To', to_email, {}),
+        ('Subject', subject, {}),
+        ('MIME-Version', '1.0', {})
+    ])[:-2] + f'Content-Type: multipart/mixed;\r\n boundary="{boundary}"\r\n\r\n'.encode('ascii')
+    delimiter = f"--{boundary}\r\n".encode('ascii')
+
+    yield delimiter + _headers([
+        ('Content-Type', 'text/html', {'charset': 'utf-8'}),
+        ('Content-Transfer-Encoding', 'base64', {})
+    ]) + _encode(body_html.encode('utf-8'))
+
+    for att in attachments or []:
+        if not att.get('content') or not att.get('mime'):
+            continue
+        yield delimiter + _headers([
+            ('Content-Type', att['mime'], {}),
+            ('Content-Transfer-Encoding', 'base64', {}),
+            ('Content-Disposition', 'attachment', {'filename': att['filename']})
+        ])
+        for data in _iter_content(att['content'], chunk_size):
+            yield _encode(data)
+
+    yield f"--{boundary}--\r\n".encode('ascii')
@@ -6,28 +6,22 @@
 
 # research_handler.py
 
-from chat_handler import get_ai_response, send_message_to_chat
+from chat_handler import stream_ai_response_to_chat
 
 def handle_research(argument_text, space_name, thread_name):
     """
-    Handles the /research command by running the query in a separate thread
-    and sending the detailed response back to the chat.
+    Handles the /research command and sends the detailed response back to the chat.
 
-    This function returns another function (`do_research_and_send`) which is
-    the actual target for the threading.Thread call. This pattern is useful
-    for encapsulating the logic that needs to run in the background.
+    This is the workhorse function that runs in the background: the web handler
+    submits it to the shared background pool (`task_executor.submit_background`)
+    so the chat event can be answered immediately.
     """
-    def do_research_and_send():
-        """
-        The actual workhorse function that runs in the background.
-        """
-        # Call the AI with research_mode=True to use the more powerful model
-        ai_response_text = get_ai_response(argument_text, research_mode=True)
-        
-        # Format the response for the chat
-        full_response = f"**Detailed Research Results:**\n\n{ai_response_text}"
-        
-        # Send the final response back to the original thread
-        send_message_to_chat(space_name, thread_name, full_response)
-
-    return do_research_and_send
+    # Stream the answer of the more powerful model (research_mode=True)
+    # into the original thread, so the user sees it while it is generated.
+    stream_ai_response_to_chat(
+        argument_text,
+        space_name,
+        thread_name,
+        research_mode=True,
+        prefix="**Detailed Research Results:**\n\n"
+    )
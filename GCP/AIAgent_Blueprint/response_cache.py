@@ -0,0 +1,153 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements a bounded response cache for AI answers, with an in-memory
+# LRU+TTL backend and an optional Redis backend.
+
+# response_cache.py
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from api_config import REDIS_URL, AI_CACHE_BACKEND, AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS
+from metrics import AI_CACHE_LOOKUPS
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a user query so trivially different phrasings share one cache entry.
+    Case, repeated whitespace and trailing punctuation are ignored.
+    """
+    normalized = re.sub(r'\s+', ' ', query or '').strip().lower()
+    return normalized.rstrip('?!. ')
+
+def make_cache_key(query: str, model_name: str, system_instruction: str) -> str:
+    """Builds a cache key from the normalized query, the model and the system instruction."""
+    raw = json.dumps([normalize_query(query), model_name, system_instruction])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class LRUTTLCache:
+    """
+    In-memory cache bounded by entry count, with a time-to-live per entry.
+    The least recently used entry is evicted when the cache is full. Thread-safe.
+    """
+
+    def __init__(self, max_entries=AI_CACHE_MAX_ENTRIES, ttl_seconds=AI_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class RedisCache:
+    """
+    Redis-backed cache that lets several instances share entries.
+    Redis errors are logged and treated as cache misses, so the agent keeps working
+    when Redis is unavailable.
+    """
+
+    def __init__(self, redis_conn, ttl_seconds=AI_CACHE_TTL_SECONDS, prefix="ai_response:"):
+        self._redis = redis_conn
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self._redis.get(self.prefix + key)
+            return value.decode('utf-8') if value is not None else None
+        except Exception as e:
+            logging.warning("(response_cache.py)[RedisCache.get] Redis error: %s", e)
+            return None
+
+    def set(self, key, value):
+        try:
+            self._redis.setex(self.prefix + key, int(self.ttl_seconds), value)
+        except Exception as e:
+            logging.warning("(response_cache.py)[RedisCache.set] Redis error: %s", e)
+
+    def delete(self, key):
+        try:
+            self._redis.delete(self.prefix + key)
+        except Exception as e:
+            logging.warning("(response_cache.py)[RedisCache.delete] Redis error: %s", e)
+
+class ResponseCache:
+    """Wraps a cache backend and keeps hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        AI_CACHE_LOOKUPS.inc("miss" if value is None else "hit")
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def stats(self):
+        """Returns the hit/miss counters and the hit ratio."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+def build_backend(backend_name=AI_CACHE_BACKEND, prefix="ai_response:",
+                  max_entries=AI_CACHE_MAX_ENTRIES, ttl_seconds=AI_CACHE_TTL_SECONDS):
+    """
+    Creates the configured cache backend ('memory' or 'redis').
+    Falls back to the in-memory backend if Redis cannot be set up.
+    """
+    if backend_name == 'redis':
+        try:
+            from redis import Redis
+            return RedisCache(Redis.from_url(REDIS_URL), ttl_seconds=ttl_seconds, prefix=prefix)
+        except Exception as e:
+            logging.error("(response_cache.py)[build_backend] Could not set up Redis cache: %s. Using in-memory cache.", e)
+    return LRUTTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+response_cache = ResponseCache(build_backend())
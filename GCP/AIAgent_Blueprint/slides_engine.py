@@ -0,0 +1,197 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements the Google Slides placeholder replacement engine: all text and image
+# placeholders of a presentation are replaced with one presentations.batchUpdate call.
+
+# slides_engine.py
+
+import logging
+import os
+import re
+import threading
+import time
+from tracing import span
+
+# --- Configuration ---
+# Maximum number of requests sent in one batchUpdate call; longer lists are split.
+SLIDES_BATCH_MAX_REQUESTS = int(os.environ.get('SLIDES_BATCH_MAX_REQUESTS', 500))
+# How long the placeholders found in a template are trusted before its revision is checked again.
+SLIDES_TEMPLATE_SCAN_TTL = float(os.environ.get('SLIDES_TEMPLATE_SCAN_TTL', 300))
+
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+
+# Parameters that describe the chat conversation rather than the document.
+NON_PLACEHOLDER_PARAMS = frozenset({'space_name', 'thread_name'})
+
+SCAN_FIELDS = 'revisionId,slides(pageElements,slideProperties(notesPage(pageElements)))'
+
+def make_replacements(params):
+    """
+    Builds the replacements of a form submission: each parameter `key` fills the `{{key}}`
+    placeholder. Chat routing parameters (space_name, thread_name) are left out.
+    """
+    return {f"{{{{{key}}}}}": value for key, value in params.items() if key not in NON_PLACEHOLDER_PARAMS}
+
+def _iter_texts(page_elements):
+    """Yields the full text of every shape and table cell, including those inside groups."""
+    for element in page_elements or []:
+        if 'shape' in element:
+            text = element['shape'].get('text')
+            if text:
+                yield "".join(te.get('textRun', {}).get('content', '') for te in text.get('textElements', []))
+        elif 'table' in element:
+            for row in element['table'].get('tableRows', []):
+                for cell in row.get('tableCells', []):
+                    text = cell.get('text')
+                    if text:
+                        yield "".join(te.get('textRun', {}).get('content', '') for te in text.get('textElements', []))
+        elif 'elementGroup' in element:
+            yield from _iter_texts(element['elementGroup'].get('children'))
+
+def find_placeholders(presentation):
+    """
+    Returns the set of {{...}} placeholders in a presentation resource (slides and speaker notes).
+    The text runs of a shape are joined first, so a placeholder split by formatting is found.
+    """
+    placeholders = set()
+    for slide in presentation.get('slides', []):
+        page_elements = list(slide.get('pageElements', []))
+        page_elements += slide.get('slideProperties', {}).get('notesPage', {}).get('pageElements', [])
+        for text in _iter_texts(page_elements):
+            placeholders.update(PLACEHOLDER_RE.findall(text))
+    return placeholders
+
+class TemplateScanCache:
+    """
+    Remembers the placeholders of each template with the revision they were read from.
+    Within SLIDES_TEMPLATE_SCAN_TTL the scan is trusted; after that, a call that reads only
+    the revisionId decides whether the template has to be scanned again.
+    """
+
+    def __init__(self, ttl_seconds=SLIDES_TEMPLATE_SCAN_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._scans = {}  # template_id -> (revision_id, placeholders, checked at)
+        self._lock = threading.Lock()
+
+    def get_placeholders(self, slides_service, template_id):
+        """Returns the template's placeholders, or None if the template could not be read."""
+        with self._lock:
+            cached = self._scans.get(template_id)
+        now = time.monotonic()
+        if cached and now - cached[2] < self.ttl_seconds:
+            return cached[1]
+        try:
+            if cached:
+                with span("slides.presentations.get", fields="revisionId"):
+                    revision_id = slides_service.presentations().get(
+                        presentationId=template_id, fields='revisionId'
+                    ).execute().get('revisionId')
+                if revision_id == cached[0]:
+                    with self._lock:
+                        self._scans[template_id] = (revision_id, cached[1], now)
+                    return cached[1]
+            with span("slides.presentations.get", fields="scan"):
+                presentation = slides_service.presentations().get(
+                    presentationId=template_id, fields=SCAN_FIELDS
+                ).execute()
+        except Exception as e:
+            logging.warning("(slides_engine.py)[TemplateScanCache.get_placeholders] Could not scan template %s: %s", template_id, e)
+            return None
+        placeholders = find_placeholders(presentation)
+        with self._lock:
+            self._scans[template_id] = (presentation.get('revisionId'), placeholders, now)
+        logging.info("(slides_engine.py)[TemplateScanCache.get_placeholders] Template %s has %s placeholders.", template_id, len(placeholders))
+        return placeholders
+
+    def invalidate(self, template_id=None):
+        with self._lock:
+            if template_id is None:
+                self._scans.clear()
+            else:
+                self._scans.pop(template_id, None)
+
+template_scans = TemplateScanCache()
+
+def is_image(value):
+    """Image replacements are given as {"image_url": ..., "replace_method": "CENTER_INSIDE"|"CENTER_CROP"}."""
+    return isinstance(value, dict) and 'image_url' in value
+
+def build_requests(replacements, placeholders=None):
+    """
+    Turns replacements into batchUpdate requests: replaceAllShapesWithImage for image values,
+    replaceAllText for the rest. With `placeholders` (from a template scan), keys of the
+    {{...}} form that do not occur in the template are dropped.
+    Image requests come first, so their shapes are matched before any text is replaced.
+    """
+    image_requests, text_requests = [], []
+    for key, value in replacements.items():
+        if not key:
+            continue
+        if placeholders is not None and PLACEHOLDER_RE.fullmatch(key) and key not in placeholders:
+            continue
+        contains_text = {'text': key, 'matchCase': True}
+        if is_image(value):
+            if not value['image_url']:
+                continue
+            image_requests.append({'replaceAllShapesWithImage': {
+                'imageUrl': value['image_url'],
+                'imageReplaceMethod': value.get('replace_method', 'CENTER_INSIDE'),
+                'containsText': contains_text
+            }})
+        else:
+            text_requests.append({'replaceAllText': {
+                'containsText': contains_text,
+                'replaceText': '' if value is None else str(value)
+            }})
+    return image_requests + text_requests
+
+def fill_presentation(presentation_id, replacements, template_id=None, slides_service=None):
+    """
+    Replaces the placeholders of a presentation in one batchUpdate call (more only if the
+    request list exceeds SLIDES_BATCH_MAX_REQUESTS). If `template_id` names the template the
+    presentation was copied from, replacements for placeholders it does not contain are dropped.
+    Returns {placeholder: occurrences changed}.
+    """
+    if slides_service is None:
+        from google_clients import get_slides_service
+        slides_service = get_slides_service()
+    placeholders = template_scans.get_placeholders(slides_service, template_id) if template_id else None
+    requests = build_requests(replacements, placeholders)
+    if not requests:
+        return {}
+
+    occurrences = {}
+    for start in range(0, len(requests), SLIDES_BATCH_MAX_REQUESTS):
+        chunk = requests[start:start + SLIDES_BATCH_MAX_REQUESTS]
+        with span("slides.presentations.batchUpdate", requests=len(chunk)):
+            response = slides_service.presentations().batchUpdate(
+                presentationId=presentation_id, body={'requests': chunk}
+            ).execute()
+        for request, reply in zip(chunk, response.get('replies', [])):
+            kind = next(iter(request))
+            key = request[kind]['containsText']['text']
+            occurrences[key] = reply.get(kind, {}).get('occurrencesChanged', 0)
+
+    unused = [key for key, count in occurrences.items() if not count]
+    if unused:
+        logging.info("(slides_engine.py)[fill_presentation] No occurrences in %s for: %s", presentation_id, ", ".join(unused))
+    logging.info(
+        "(slides_engine.py)[fill_presentation] Sent %s of %s replacements to %s.",
+        len(requests), len(replacements), presentation_id
+    )
+    return occurrences
+
+def copy_template(template_id, name, folder_id, drive_service=None):
+    """Copies a template into a folder and returns the new file ID."""
+    if drive_service is None:
+        from google_clients import get_drive_service
+        drive_service = get_drive_service()
+    with span("drive.files.copy"):
+        copied = drive_service.files().copy(
+            fileId=template_id,
+            body={'name': name, 'parents': [folder_id]},
+            fields='id',
+            supportsAllDrives=True
+        ).execute()
+    return copied['id']
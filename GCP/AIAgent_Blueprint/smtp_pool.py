@@ -0,0 +1,275 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements a pool of authenticated SMTP connections, so emails are sent without
+# a new connect + EHLO + STARTTLS + LOGIN handshake for every message.
+
+# smtp_pool.py
+
+import collections
+import contextlib
+import logging
+import os
+import re
+import smtplib
+import ssl
+import threading
+import time
+
+# --- Configuration ---
+# Maximum number of connections open at once; also the number of concurrent sends.
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+# Idle connections older than this are closed instead of reused (servers drop idle sessions).
+SMTP_POOL_IDLE_TIMEOUT = float(os.environ.get('SMTP_POOL_IDLE_TIMEOUT', 60))
+# Connections idle for longer than this are checked with NOOP before they are reused.
+SMTP_POOL_NOOP_AFTER = float(os.environ.get('SMTP_POOL_NOOP_AFTER', 10))
+# How long a sender waits for a free connection before giving up.
+SMTP_POOL_WAIT_TIMEOUT = float(os.environ.get('SMTP_POOL_WAIT_TIMEOUT', 30))
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+SMTP_USE_STARTTLS = os.environ.get('SMTP_USE_STARTTLS', 'true').lower() == 'true'
+
+# Errors after which a connection cannot be used any more. smtplib.SMTPException is itself
+# an OSError, so handlers that keep the connection on SMTP errors must come before OSError.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+class SMTPPoolExhausted(Exception):
+    """Raised when no connection became free within SMTP_POOL_WAIT_TIMEOUT."""
+
+_LEADING_DOT = re.compile(rb'(?m)^\.')
+
+def sendmail_stream(connection, from_addr, to_addrs, chunks):
+    """
+    Like smtplib.SMTP.sendmail(), but the message is an iterable of CRLF-terminated byte
+    chunks written to the socket as they come, so it is never held in memory as a whole.
+    Lines starting with a dot are escaped as DATA requires. Returns the refused recipients.
+    """
+    connection.ehlo_or_helo_if_needed()
+    code, response = connection.mail(from_addr)
+    if code != 250:
+        if code == 421:
+            connection.close()
+        else:
+            connection.rset()
+        raise smtplib.SMTPSenderRefused(code, response, from_addr)
+    refused = {}
+    for recipient in to_addrs:
+        code, response = connection.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+        if code == 421:
+            connection.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(to_addrs):
+        connection.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    connection.putcmd("data")
+    code, response = connection.getreply()
+    if code != 354:
+        connection.rset()
+        raise smtplib.SMTPDataError(code, response)
+    at_line_start = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        quoted = _LEADING_DOT.sub(b'..', chunk)
+        if not at_line_start and chunk[:1] == b'.':
+            quoted = quoted[1:]
+        connection.send(quoted)
+        at_line_start = chunk[-1:] == b'\n'
+    connection.send(b'.\r\n' if at_line_start else b'\r\n.\r\n')
+    code, response = connection.getreply()
+    if code != 250:
+        connection.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `max_connections` authenticated SMTP connections and hands them out to
+    one sender at a time. Thread-safe; shared by the handler and background threads.
+    A connection that fails during a send is discarded and the send is retried once on
+    a fresh connection, so a session the server closed in the meantime is not an error.
+    """
+
+    def __init__(self, host, port, username=None, password=None, max_connections=SMTP_POOL_SIZE,
+                 use_starttls=SMTP_USE_STARTTLS, idle_timeout=SMTP_POOL_IDLE_TIMEOUT,
+                 noop_after=SMTP_POOL_NOOP_AFTER, wait_timeout=SMTP_POOL_WAIT_TIMEOUT,
+                 timeout=SMTP_TIMEOUT, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_connections = max_connections
+        self.use_starttls = use_starttls
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.wait_timeout = wait_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self._idle = collections.deque()  # (connection, last used, monotonic seconds)
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.ehlo()
+            if self.use_starttls:
+                connection.starttls(context=self.ssl_context or ssl.create_default_context())
+                connection.ehlo()
+            if self.username:
+                connection.login(self.username, self.password)
+        except Exception:
+            self._close(connection)
+            raise
+        self._count("created")
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.noop()[0] == 250
+        except CONNECTION_ERRORS + (smtplib.SMTPException,):
+            return False
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _checkout(self):
+        """Returns an idle connection that is still usable, or a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            idle_seconds = time.monotonic() - last_used
+            if idle_seconds > self.idle_timeout:
+                self._count("expired")
+                self._close(connection)
+            elif idle_seconds > self.noop_after and not self._is_alive(connection):
+                self._count("replaced")
+                connection.close()
+            else:
+                self._count("reused")
+                return connection
+        return self._connect()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Yields an authenticated connection for exclusive use. It goes back to the pool
+        afterwards, unless the block failed with a connection error.
+        """
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise SMTPPoolExhausted(f"No SMTP connection free within {self.wait_timeout}s")
+        try:
+            connection = self._checkout()
+            try:
+                yield connection
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError):
+                connection.close()
+                raise
+            except smtplib.SMTPException:
+                # A refused sender/recipient or a failed DATA: the session is still open.
+                # Reset it so the next sender starts clean, and keep the connection.
+                try:
+                    connection.rset()
+                except OSError:
+                    connection.close()
+                    raise
+                self._checkin(connection)
+                raise
+            except OSError:
+                connection.close()
+                raise
+            self._checkin(connection)
+        finally:
+            self._slots.release()
+
+    def _checkin(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def send(self, from_addr, to_addrs, message):
+        """
+        Sends one message (a string or bytes) and returns smtplib's dict of refused recipients.
+        Retried once on a new connection if the pooled one turns out to be dead.
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as connection:
+                    refused = connection.sendmail(from_addr, to_addrs, message)
+                self._count("sent")
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                self._count("replaced")
+
+    def send_stream(self, from_addr, to_addrs, make_chunks):
+        """
+        Sends a message streamed from `make_chunks()`, a callable returning an iterable of
+        CRLF-terminated byte chunks (see mime_stream.iter_mime_message). It is called again
+        if the send is retried on a new connection.
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as connection:
+                    refused = sendmail_stream(connection, from_addr, to_addrs, make_chunks())
+                self._count("sent")
+                return refused
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                self._count("replaced")
+
+    def send_batch(self, messages):
+        """
+        Sends (from_addr, to_addrs, message) tuples over one connection. Returns one entry per
+        message: the refused recipients dict, or the exception that made the message fail.
+        """
+        results = []
+        pending = list(messages)
+        while pending:
+            try:
+                with self.connection() as connection:
+                    while pending:
+                        from_addr, to_addrs, message = pending[0]
+                        try:
+                            results.append(connection.sendmail(from_addr, to_addrs, message))
+                            self._count("sent")
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                            # sendmail() has already reset the session.
+                            results.append(e)
+                        pending.pop(0)
+            except CONNECTION_ERRORS + (smtplib.SMTPException,) as e:
+                # The connection broke: fail the message it broke on and continue on a new one.
+                logging.warning("(smtp_pool.py)[send_batch] Connection failed during batch: %s", e)
+                results.append(e)
+                pending.pop(0)
+        return results
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def stats(self):
+        """Returns the counts of created, reused, replaced and expired connections and sent messages."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        return stats
@@ -0,0 +1,114 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements a cached data snapshot with a TTL and stale-while-revalidate
+# background refresh, used for data that dialogs need quickly (e.g. sheet dropdowns).
+
+# snapshot_cache.py
+
+import logging
+import threading
+import time
+from task_executor import submit_background
+
+class SnapshotCache:
+    """
+    Holds the last value returned by `loader` and serves it without waiting.
+    - The first call loads the data synchronously (there is nothing to serve yet).
+    - Once the snapshot is older than `ttl_seconds`, callers still get the stale value
+      immediately while a single refresh runs on the background pool.
+    - `invalidate()` forces a refresh on the next access.
+    If a refresh fails, the previous snapshot is kept.
+    """
+
+    def __init__(self, loader, ttl_seconds, name="snapshot"):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._value = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.loads = 0
+        self.failures = 0
+        self.timings = {}
+
+    def get(self):
+        """Returns the snapshot, loading it only if none has been loaded yet."""
+        with self._lock:
+            value, loaded_at = self._value, self._loaded_at
+            if value is not None:
+                if loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds:
+                    self.hits += 1
+                    return value
+                self.stale_hits += 1
+                start_refresh = not self._refreshing
+                self._refreshing = True
+            else:
+                start_refresh = False
+
+        if value is None:
+            # Cold cache: the caller has to wait for the first load.
+            with self._load_lock:
+                if self._value is None:
+                    self.refresh()
+                return self._value
+
+        if start_refresh and not submit_background(self._background_refresh):
+            with self._lock:
+                self._refreshing = False
+        return value
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def refresh(self):
+        """Loads a fresh snapshot now. Errors are logged and the previous snapshot is kept."""
+        start = time.perf_counter()
+        try:
+            value = self._loader()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logging.error("(snapshot_cache.py)[refresh] Could not load snapshot '%s': %s", self.name, e, exc_info=True)
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+            self.timings['load'] = elapsed
+        logging.info("(snapshot_cache.py)[refresh] Snapshot '%s' loaded in %.3fs", self.name, elapsed)
+
+    def warm(self):
+        """Starts loading the snapshot in the background, e.g. right after startup."""
+        return submit_background(self.refresh)
+
+    def invalidate(self):
+        """Marks the snapshot as stale so the next access triggers a refresh."""
+        with self._lock:
+            self._loaded_at = None
+
+    def record_timing(self, stage, seconds):
+        """Lets the loader record how long each of its stages took (e.g. fetch, parse)."""
+        with self._lock:
+            self.timings[stage] = seconds
+
+    def stats(self):
+        with self._lock:
+            age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "loads": self.loads,
+                "failures": self.failures,
+                "age_seconds": age,
+                "timings": dict(self.timings)
+            }
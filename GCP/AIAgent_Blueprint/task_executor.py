@@ -0,0 +1,147 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file provides a bounded worker pool for fire-and-forget background work,
+# such as research queries and document generation started from chat events.
+
+# task_executor.py
+
+import atexit
+import contextvars
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import registry
+
+# --- Configuration ---
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 8))
+# Number of tasks allowed to wait for a free worker before new ones are rejected.
+BACKGROUND_QUEUE_DEPTH = int(os.environ.get('BACKGROUND_QUEUE_DEPTH', 32))
+# How long shutdown waits for queued and running tasks to finish.
+BACKGROUND_DRAIN_TIMEOUT = float(os.environ.get('BACKGROUND_DRAIN_TIMEOUT', 8))
+
+# Reply sent to the user when the pool cannot accept more work.
+QUEUE_FULL_TEXT = "The agent is busy right now (queue full). Please try again in a few minutes."
+
+class BoundedExecutor:
+    """
+    A thread pool with a bounded queue. `submit` never blocks: when all workers are
+    busy and the queue is full, the task is rejected so the caller can reply with
+    a backpressure message instead of piling up threads.
+    """
+
+    def __init__(self, max_workers=BACKGROUND_WORKERS, queue_depth=BACKGROUND_QUEUE_DEPTH, name="background"):
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + queue_depth)
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._active = 0
+        self._rejected = 0
+        self._accepting = True
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        """
+        Schedules `fn(*args, **kwargs)` on the pool.
+        Returns False if the task was rejected because the pool is full or shutting down.
+        """
+        with self._condition:
+            if not self._accepting or not self._slots.acquire(blocking=False):
+                self._rejected += 1
+                logging.warning("(task_executor.py)[submit] Rejected task %s: queue full.", getattr(fn, '__name__', fn))
+                return False
+            self._pending += 1
+
+        def run():
+            with self._condition:
+                self._active += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                logging.error("(task_executor.py)[run] Background task failed: %s", e, exc_info=True)
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._pending -= 1
+                    self._slots.release()
+                    self._condition.notify_all()
+
+        # The task runs in a copy of the caller's context, so it keeps the request ID
+        # and its spans belong to the trace of the request that started it.
+        try:
+            self._executor.submit(contextvars.copy_context().run, run)
+        except RuntimeError as e:
+            # The thread pool was shut down between the check above and this call.
+            with self._condition:
+                self._pending -= 1
+                self._rejected += 1
+                self._slots.release()
+                self._condition.notify_all()
+            logging.warning("(task_executor.py)[submit] Rejected task %s: %s", getattr(fn, '__name__', fn), e)
+            return False
+        return True
+
+    def queued(self) -> int:
+        """Number of accepted tasks still waiting for a worker."""
+        with self._condition:
+            return self._pending - self._active
+
+    def active(self) -> int:
+        """Number of tasks currently running."""
+        with self._condition:
+            return self._active
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "rejected": self._rejected,
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth
+            }
+
+    def shutdown(self, timeout=BACKGROUND_DRAIN_TIMEOUT) -> bool:
+        """
+        Stops accepting new tasks and waits up to `timeout` seconds for the
+        accepted ones to finish. Returns True if the pool drained completely.
+        """
+        with self._condition:
+            self._accepting = False
+            drained = self._condition.wait_for(lambda: self._pending == 0, timeout=timeout)
+        if not drained:
+            logging.warning("(task_executor.py)[shutdown] Shutdown timed out with %s unfinished tasks.", self._pending)
+        self._executor.shutdown(wait=drained, cancel_futures=True)
+        return drained
+
+background_executor = BoundedExecutor()
+atexit.register(background_executor.shutdown)
+
+registry.gauge_callback("agent_background_queue_depth", "Background tasks waiting for a worker.", background_executor.queued)
+registry.gauge_callback("agent_background_active_workers", "Background worker threads running a task.", background_executor.active)
+registry.counter_callback("agent_background_rejected_total", "Background tasks rejected because the pool was full.", lambda: background_executor.stats()["rejected"])
+
+def submit_background(fn, *args, **kwargs) -> bool:
+    """Schedules fire-and-forget work on the shared background pool."""
+    return background_executor.submit(fn, *args, **kwargs)
+
+def install_sigterm_handler():
+    """
+    Drains the background pool when the platform sends SIGTERM (e.g. Cloud Run scaling down).
+    Does nothing if a server such as gunicorn already installed its own handler.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        return
+
+    def handle_sigterm(signum, frame):
+        logging.info("(task_executor.py)[handle_sigterm] SIGTERM received, draining background tasks.")
+        background_executor.shutdown()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
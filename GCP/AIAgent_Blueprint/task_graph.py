@@ -0,0 +1,150 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements a small dependency-aware task graph: steps whose inputs are ready run
+# in parallel on a shared thread pool, and every step's timing is recorded.
+
+# task_graph.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import registry
+from tracing import span
+
+# --- Configuration ---
+# Threads shared by all graphs for running their steps (mostly waiting on Google APIs).
+TASK_GRAPH_WORKERS = int(os.environ.get('TASK_GRAPH_WORKERS', 8))
+
+STEP_LATENCY = registry.histogram(
+    "agent_task_graph_step_seconds", "Duration of task graph steps, by graph and step.", ("graph", "step"),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TASK_GRAPH_WORKERS, thread_name_prefix="graph")
+    return _executor
+
+class TaskGraphError(Exception):
+    """Raised by TaskGraph.run() when steps failed. `failures` maps step names to exceptions."""
+
+    def __init__(self, graph_name, failures):
+        self.failures = failures
+        first = next(iter(failures.items()))
+        super().__init__(f"{graph_name}: {len(failures)} step(s) failed, first {first[0]}: {first[1]}")
+
+class TaskGraph:
+    """
+    Steps are added with their dependencies and receive the dependencies' results as
+    positional arguments. run() starts every step as soon as its dependencies finished,
+    so independent steps overlap and the total time is the length of the critical path.
+    A failed step skips the steps that depend on it; the others still run.
+
+    Steps run on a shared pool, so a step must not run a TaskGraph itself.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._steps = {}  # name -> (fn, deps), in insertion order
+        self._timings = {}  # name -> (start offset, duration) in seconds
+        self.results = {}
+        self.failures = {}
+        self.skipped = []
+        self.duration = None
+
+    def add(self, name, fn, deps=()):
+        """Adds a step. Its dependencies must have been added before, so the graph has no cycles."""
+        if name in self._steps:
+            raise ValueError(f"Step already added: {name}")
+        missing = [dep for dep in deps if dep not in self._steps]
+        if missing:
+            raise ValueError(f"Unknown dependencies of {name}: {missing}")
+        self._steps[name] = (fn, tuple(deps))
+        return self
+
+    def _run_step(self, name, fn, args, started):
+        start = time.perf_counter()
+        try:
+            with span(f"{self.name}.{name}"):
+                return fn(*args)
+        finally:
+            duration = time.perf_counter() - start
+            self._timings[name] = (start - started, duration)
+            STEP_LATENCY.observe(duration, self.name, name)
+
+    def run(self):
+        """Runs all steps and returns their results by name. Raises TaskGraphError if a step failed."""
+        executor = _get_executor()
+        started = time.perf_counter()
+        waiting = dict(self._steps)
+        running = {}
+
+        def start_ready():
+            for name, (fn, deps) in list(waiting.items()):
+                if any(dep in self.failures or dep in self.skipped for dep in deps):
+                    del waiting[name]
+                    self.skipped.append(name)
+                elif all(dep in self.results for dep in deps):
+                    del waiting[name]
+                    args = [self.results[dep] for dep in deps]
+                    # Like the background pool, steps keep the request ID and trace of the caller.
+                    future = executor.submit(contextvars.copy_context().run, self._run_step, name, fn, args, started)
+                    running[future] = name
+
+        start_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    self.results[name] = future.result()
+                except Exception as e:
+                    logging.error("(task_graph.py)[TaskGraph.run] %s step %s failed: %s", self.name, name, e, exc_info=True)
+                    self.failures[name] = e
+            start_ready()
+
+        self.duration = time.perf_counter() - started
+        path, _ = self.critical_path()
+        logging.info(
+            "(task_graph.py)[TaskGraph.run] %s finished in %.2fs, critical path %s; steps: %s",
+            self.name, self.duration, " -> ".join(path),
+            ", ".join(f"{name}={duration:.2f}s" for name, (_, duration) in self._timings.items())
+        )
+        if self.failures:
+            raise TaskGraphError(self.name, self.failures)
+        return self.results
+
+    def timings(self):
+        """Returns {step: (start offset, duration)} in seconds for the steps that ran."""
+        return dict(self._timings)
+
+    def critical_path(self):
+        """
+        Returns (steps, seconds) of the chain that determined the total time: from the step
+        that finished last, back through the dependency that finished last at each step.
+        """
+        def end(name):
+            offset, duration = self._timings[name]
+            return offset + duration
+
+        finished = [name for name in self._steps if name in self._timings]
+        if not finished:
+            return [], 0.0
+        path = [max(finished, key=end)]
+        while True:
+            deps = [dep for dep in self._steps[path[-1]][1] if dep in self._timings]
+            if not deps:
+                break
+            path.append(max(deps, key=end))
+        path.reverse()
+        return path, end(path[-1]) - self._timings[path[0]][0]
@@ -0,0 +1,321 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements an optional warm pool of pre-copied presentation templates, so a
+# submission moves and renames a ready copy instead of waiting for a Drive files.copy.
+
+# template_pool.py
+
+import atexit
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from api_config import REDIS_URL
+from mail_handler import GENERATION_QUEUE_ENABLED, start_generation_task, get_drive_file_revision
+from metrics import registry
+from task_executor import submit_background
+import slides_engine
+
+# --- Configuration ---
+TEMPLATE_POOL_ENABLED = os.environ.get('TEMPLATE_POOL_ENABLED', 'false').lower() == 'true'
+# Number of ready copies kept per template.
+TEMPLATE_POOL_SIZE = int(os.environ.get('TEMPLATE_POOL_SIZE', 2))
+# Drive folder the ready copies wait in. Required when the pool is enabled.
+TEMPLATE_POOL_STAGING_FOLDER_ID = os.environ.get('TEMPLATE_POOL_STAGING_FOLDER_ID', '')
+# 'memory' keeps the pool per process; 'redis' shares it between processes, which RQ workers
+# need because every job runs in a new forked process. A memory pool loses the IDs of its copies
+# when the process stops, so on start it deletes the copies other processes left in the staging
+# folder: with several instances, use 'redis'.
+TEMPLATE_POOL_BACKEND = os.environ.get('TEMPLATE_POOL_BACKEND', 'redis' if GENERATION_QUEUE_ENABLED else 'memory')
+# How long a template's revision is trusted before it is read again.
+TEMPLATE_POOL_REVISION_TTL = float(os.environ.get('TEMPLATE_POOL_REVISION_TTL', 60))
+
+POOL_COPY_NAME = "[template pool] {template_id}"
+
+TEMPLATE_POOL_TAKES = registry.counter(
+    "agent_template_pool_takes_total", "Template copies requested, by result (hit/miss/stale).", ("result",)
+)
+
+class MemoryPoolStore:
+    """Per-process store of ready copies. Thread-safe."""
+
+    def __init__(self):
+        self._entries = collections.defaultdict(collections.deque)
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def pop(self, template_id):
+        with self._lock:
+            entries = self._entries[template_id]
+            return entries.popleft() if entries else None
+
+    def push(self, template_id, entry):
+        with self._lock:
+            self._entries[template_id].append(entry)
+
+    def size(self, template_id):
+        with self._lock:
+            return len(self._entries[template_id])
+
+    def start_refill(self, template_id):
+        """Returns False if a refill of the template is already running."""
+        with self._lock:
+            if template_id in self._refilling:
+                return False
+            self._refilling.add(template_id)
+            return True
+
+    def end_refill(self, template_id):
+        with self._lock:
+            self._refilling.discard(template_id)
+
+    def template_ids(self):
+        with self._lock:
+            return [template_id for template_id, entries in self._entries.items() if entries]
+
+class RedisPoolStore:
+    """
+    Store shared by all processes: a Redis list of ready copies per template. LPOP hands
+    every copy to exactly one submission. Redis errors are logged and treated as an empty
+    pool, so submissions fall back to a normal copy.
+    """
+
+    def __init__(self, redis_conn, prefix="template_pool:", refill_lock_seconds=600):
+        self._redis = redis_conn
+        self.prefix = prefix
+        self.refill_lock_seconds = refill_lock_seconds
+
+    def pop(self, template_id):
+        try:
+            value = self._redis.lpop(self.prefix + template_id)
+            return json.loads(value) if value is not None else None
+        except Exception as e:
+            logging.warning("(template_pool.py)[RedisPoolStore.pop] Redis error: %s", e)
+            return None
+
+    def push(self, template_id, entry):
+        try:
+            self._redis.rpush(self.prefix + template_id, json.dumps(entry))
+        except Exception as e:
+            logging.warning("(template_pool.py)[RedisPoolStore.push] Redis error: %s", e)
+
+    def size(self, template_id):
+        try:
+            return self._redis.llen(self.prefix + template_id)
+        except Exception as e:
+            logging.warning("(template_pool.py)[RedisPoolStore.size] Redis error: %s", e)
+            return TEMPLATE_POOL_SIZE
+
+    def start_refill(self, template_id):
+        try:
+            return bool(self._redis.set(f"{self.prefix}refill:{template_id}", "1", nx=True, ex=self.refill_lock_seconds))
+        except Exception as e:
+            logging.warning("(template_pool.py)[RedisPoolStore.start_refill] Redis error: %s", e)
+            return False
+
+    def end_refill(self, template_id):
+        try:
+            self._redis.delete(f"{self.prefix}refill:{template_id}")
+        except Exception as e:
+            logging.warning("(template_pool.py)[RedisPoolStore.end_refill] Redis error: %s", e)
+
+class TemplatePool:
+    """
+    Keeps `size` copies of each template in a staging folder. take() moves one copy into
+    the target folder under its final name (one files.update call) and schedules a refill.
+    Copies made from an older revision of the template are deleted instead of used.
+    Every copy is marked with the pool's `owner` ID (see reclaim_orphans).
+    """
+
+    def __init__(self, store, size=TEMPLATE_POOL_SIZE, staging_folder_id=TEMPLATE_POOL_STAGING_FOLDER_ID,
+                 revision_ttl=TEMPLATE_POOL_REVISION_TTL, drive_service=None, owner=None):
+        self.store = store
+        self.owner = owner or uuid.uuid4().hex
+        self.size = size
+        self.staging_folder_id = staging_folder_id
+        self.revision_ttl = revision_ttl
+        self._drive_service = drive_service
+        self._revisions = {}  # template_id -> (revision, checked at)
+        self._lock = threading.Lock()
+
+    def _drive(self):
+        if self._drive_service is not None:
+            return self._drive_service
+        from google_clients import get_drive_service
+        return get_drive_service()
+
+    def revision(self, template_id):
+        """Returns the template's current revision, read at most once per revision_ttl."""
+        with self._lock:
+            cached = self._revisions.get(template_id)
+        if cached and time.monotonic() - cached[1] < self.revision_ttl:
+            return cached[0]
+        revision = get_drive_file_revision(template_id)
+        if revision is not None:
+            with self._lock:
+                self._revisions[template_id] = (revision, time.monotonic())
+        return revision
+
+    def _delete(self, file_id):
+        try:
+            self._drive().files().delete(fileId=file_id, supportsAllDrives=True).execute()
+        except Exception as e:
+            logging.warning("(template_pool.py)[TemplatePool._delete] Could not delete pooled copy %s: %s", file_id, e)
+
+    def take(self, template_id, name, folder_id):
+        """Moves a ready copy into `folder_id` as `name` and returns its ID, or None if the pool is empty."""
+        revision = self.revision(template_id)
+        if revision is None:
+            # Without the revision the copies cannot be checked; leave them for later.
+            return None
+        file_id = None
+        while True:
+            entry = self.store.pop(template_id)
+            if entry is None:
+                TEMPLATE_POOL_TAKES.inc("miss")
+                break
+            if entry['revision'] != revision:
+                # The template was edited after this copy was made.
+                TEMPLATE_POOL_TAKES.inc("stale")
+                self._delete(entry['id'])
+                continue
+            try:
+                self._drive().files().update(
+                    fileId=entry['id'],
+                    addParents=folder_id,
+                    removeParents=self.staging_folder_id,
+                    body={'name': name, 'appProperties': {'templatePool': None, 'templatePoolOwner': None}},
+                    fields='id',
+                    supportsAllDrives=True
+                ).execute()
+            except Exception as e:
+                logging.warning("(template_pool.py)[TemplatePool.take] Could not move pooled copy %s: %s", entry['id'], e)
+                # The copy is no longer in the store; delete it so it is not left in the staging folder.
+                self._delete(entry['id'])
+                continue
+            TEMPLATE_POOL_TAKES.inc("hit")
+            file_id = entry['id']
+            break
+        self.schedule_refill(template_id)
+        return file_id
+
+    def schedule_refill(self, template_id):
+        """Refills the template's pool on an RQ worker or the background pool."""
+        if self.store.size(template_id) < self.size:
+            start_generation_task(refill_template_pool, template_id, job_id=f"template-pool-refill-{template_id}")
+
+    def refill(self, template_id):
+        """Copies the template into the staging folder until the pool is full."""
+        if not self.store.start_refill(template_id):
+            return
+        try:
+            revision = self.revision(template_id)
+            if revision is None:
+                return
+            while self.store.size(template_id) < self.size:
+                copied = self._drive().files().copy(
+                    fileId=template_id,
+                    body={
+                        'name': POOL_COPY_NAME.format(template_id=template_id),
+                        'parents': [self.staging_folder_id],
+                        'appProperties': {'templatePool': template_id, 'templatePoolOwner': self.owner}
+                    },
+                    fields='id',
+                    supportsAllDrives=True
+                ).execute()
+                self.store.push(template_id, {'id': copied['id'], 'revision': revision})
+            logging.info("(template_pool.py)[TemplatePool.refill] Pool of %s is full (%s copies).", template_id, self.size)
+        except Exception as e:
+            logging.error("(template_pool.py)[TemplatePool.refill] Could not refill pool of %s: %s", template_id, e, exc_info=True)
+        finally:
+            self.store.end_refill(template_id)
+
+    def clear(self, template_id):
+        """Deletes all ready copies of a template."""
+        while True:
+            entry = self.store.pop(template_id)
+            if entry is None:
+                return
+            self._delete(entry['id'])
+
+    def clear_all(self):
+        """Deletes the ready copies of all templates in a memory store, e.g. when the process exits."""
+        for template_id in self.store.template_ids():
+            self.clear(template_id)
+
+    def reclaim_orphans(self):
+        """
+        Deletes the pool copies in the staging folder that another owner left behind, e.g. a
+        memory pool of a process that was stopped. Returns the number of deleted copies.
+        """
+        orphans = []
+        page_token = None
+        try:
+            drive = self._drive()
+            while True:
+                response = drive.files().list(
+                    q=f"'{self.staging_folder_id}' in parents and trashed = false",
+                    fields='nextPageToken,files(id,appProperties)', pageSize=100, pageToken=page_token,
+                    supportsAllDrives=True, includeItemsFromAllDrives=True
+                ).execute()
+                for file in response.get('files', []):
+                    properties = file.get('appProperties') or {}
+                    if properties.get('templatePool') and properties.get('templatePoolOwner') != self.owner:
+                        orphans.append(file['id'])
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+        except Exception as e:
+            logging.warning("(template_pool.py)[TemplatePool.reclaim_orphans] Could not list the staging folder: %s", e)
+        for file_id in orphans:
+            self._delete(file_id)
+        if orphans:
+            logging.info("(template_pool.py)[TemplatePool.reclaim_orphans] Deleted %s orphaned pool copies.", len(orphans))
+        return len(orphans)
+
+def build_store(backend_name=TEMPLATE_POOL_BACKEND):
+    """Creates the configured store ('memory' or 'redis'). Falls back to memory if Redis cannot be set up."""
+    if backend_name == 'redis':
+        try:
+            from redis import Redis
+            return RedisPoolStore(Redis.from_url(REDIS_URL))
+        except Exception as e:
+            logging.error("(template_pool.py)[build_store] Could not set up Redis store: %s. Using in-memory store.", e)
+    return MemoryPoolStore()
+
+template_pool = None
+if TEMPLATE_POOL_ENABLED:
+    if not TEMPLATE_POOL_STAGING_FOLDER_ID:
+        logging.error("(template_pool.py) TEMPLATE_POOL_ENABLED is set without TEMPLATE_POOL_STAGING_FOLDER_ID; the pool is disabled.")
+    else:
+        store = build_store()
+        if not isinstance(store, MemoryPoolStore):
+            template_pool = TemplatePool(store)
+        elif GENERATION_QUEUE_ENABLED:
+            # Refills would run in RQ job processes, whose memory pools are lost when the job ends.
+            logging.error("(template_pool.py) The template pool needs the Redis store with the RQ queue; the pool is disabled.")
+        else:
+            template_pool = TemplatePool(store)
+            submit_background(template_pool.reclaim_orphans)
+            # Best effort: a process killed without running exit hooks is cleaned up on the next start.
+            atexit.register(template_pool.clear_all)
+
+def refill_template_pool(template_id):
+    """Job function that refills the pool of one template (see TemplatePool.refill)."""
+    if template_pool is not None:
+        template_pool.refill(template_id)
+
+def copy_template(template_id, name, folder_id):
+    """
+    Returns the ID of a new copy of the template named `name` in `folder_id`: a ready copy
+    from the pool when there is one, otherwise a copy made now with files.copy.
+    """
+    if template_pool is not None:
+        file_id = template_pool.take(template_id, name, folder_id)
+        if file_id:
+            return file_id
+    return slides_engine.copy_template(template_id, name, folder_id)
@@ -0,0 +1,92 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file tests the placeholder scan, the request building and the batching of
+# slides_engine.py, using a fake Slides service.
+
+# test_slides_engine.py
+
+import slides_engine
+from slides_engine import TemplateScanCache, build_requests, fill_presentation, find_placeholders
+
+def shape(*runs):
+    return {'shape': {'text': {'textElements': [{'textRun': {'content': run}} for run in runs]}}}
+
+def presentation(revision_id, *page_elements):
+    return {'revisionId': revision_id, 'slides': [{'pageElements': list(page_elements)}]}
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+class FakePresentations:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, presentationId, fields):
+        self.service.gets.append(fields)
+        if fields == 'revisionId':
+            return FakeRequest({'revisionId': self.service.template['revisionId']})
+        return FakeRequest(self.service.template)
+
+    def batchUpdate(self, presentationId, body):
+        self.service.batches.append(body['requests'])
+        replies = [{next(iter(request)): {'occurrencesChanged': 1}} for request in body['requests']]
+        return FakeRequest({'replies': replies})
+
+class FakeSlidesService:
+    """Serves one template presentation and records every get and batchUpdate call."""
+
+    def __init__(self, template=None):
+        self.template = template or presentation("r1")
+        self.gets = []
+        self.batches = []
+
+    def presentations(self):
+        return FakePresentations(self)
+
+def test_find_placeholders_joins_split_text_runs():
+    template = presentation("r1", shape("Client: {{cli", "ent}}", " and {{date}}"))
+    template['slides'][0]['slideProperties'] = {'notesPage': {'pageElements': [shape("{{note}}")]}}
+
+    assert find_placeholders(template) == {"{{client}}", "{{date}}", "{{note}}"}
+
+def test_build_requests_drops_missing_placeholders_and_puts_images_first():
+    replacements = {
+        "{{client}}": "ACME",
+        "{{missing}}": "dropped",
+        "{{logo}}": {"image_url": "https://example.com/logo.png"},
+        "plain text": None,
+    }
+
+    requests = build_requests(replacements, placeholders={"{{client}}", "{{logo}}"})
+
+    assert [next(iter(request)) for request in requests] == ['replaceAllShapesWithImage', 'replaceAllText', 'replaceAllText']
+    assert requests[0]['replaceAllShapesWithImage']['imageUrl'] == "https://example.com/logo.png"
+    assert [r['replaceAllText']['containsText']['text'] for r in requests[1:]] == ["{{client}}", "plain text"]
+    assert requests[2]['replaceAllText']['replaceText'] == ''
+
+def test_fill_presentation_splits_at_max_requests(monkeypatch):
+    monkeypatch.setattr(slides_engine, 'SLIDES_BATCH_MAX_REQUESTS', 2)
+    service = FakeSlidesService()
+    replacements = {f"{{{{field{i}}}}}": str(i) for i in range(5)}
+
+    occurrences = fill_presentation("presentation", replacements, slides_service=service)
+
+    assert [len(batch) for batch in service.batches] == [2, 2, 1]
+    assert occurrences == dict.fromkeys(replacements, 1)
+
+def test_template_scan_is_repeated_only_when_the_revision_changes():
+    service = FakeSlidesService(presentation("r1", shape("{{client}}")))
+    scans = TemplateScanCache(ttl_seconds=0)
+
+    assert scans.get_placeholders(service, "template") == {"{{client}}"}
+    assert scans.get_placeholders(service, "template") == {"{{client}}"}
+    assert service.gets == [slides_engine.SCAN_FIELDS, 'revisionId']
+
+    service.template = presentation("r2", shape("{{client}} {{date}}"))
+    assert scans.get_placeholders(service, "template") == {"{{client}}", "{{date}}"}
+    assert service.gets[2:] == ['revisionId', slides_engine.SCAN_FIELDS]
@@ -0,0 +1,88 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file tests which errors make smtp_pool.SMTPConnectionPool discard a connection,
+# using a fake SMTP connection.
+
+# test_smtp_pool.py
+
+import smtplib
+import pytest
+from smtp_pool import SMTPConnectionPool
+
+class FakeSMTP:
+    """Answers like an SMTP server that refuses the recipients in `refused`."""
+
+    def __init__(self, refused=(), disconnect_on_mail=False):
+        self.refused = set(refused)
+        self.disconnect_on_mail = disconnect_on_mail
+        self.closed = False
+        self.resets = 0
+        self.data = b""
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, from_addr):
+        if self.disconnect_on_mail:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return 250, b"OK"
+
+    def rcpt(self, recipient):
+        return (550, b"No such user") if recipient in self.refused else (250, b"OK")
+
+    def rset(self):
+        self.resets += 1
+        return 250, b"OK"
+
+    def putcmd(self, cmd):
+        pass
+
+    def getreply(self):
+        return (354, b"Go ahead") if not self.data else (250, b"Queued")
+
+    def send(self, data):
+        self.data += data
+
+    def noop(self):
+        return 250, b"OK"
+
+    def close(self):
+        self.closed = True
+
+    def quit(self):
+        self.closed = True
+
+def make_pool(*connections):
+    pool = SMTPConnectionPool("localhost", 25, max_connections=1)
+    connections = list(connections)
+    pool._connect = lambda: connections.pop(0)
+    return pool
+
+def chunks():
+    return [b"Subject: test\r\n", b"\r\n", b"body\r\n"]
+
+def test_refused_recipient_keeps_connection_in_pool():
+    connection = FakeSMTP(refused={"nobody@example.com"})
+    pool = make_pool(connection)
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send_stream("bot@example.com", ["nobody@example.com"], chunks)
+
+    assert not connection.closed
+    assert connection.resets >= 1
+    assert [c for c, _ in pool._idle] == [connection]
+
+    # The next message goes over the same connection.
+    pool.send_stream("bot@example.com", ["user@example.com"], chunks)
+    assert pool.stats()["reused"] == 1
+
+def test_disconnected_connection_is_replaced():
+    broken = FakeSMTP(disconnect_on_mail=True)
+    fresh = FakeSMTP()
+    pool = make_pool(broken, fresh)
+
+    pool.send_stream("bot@example.com", ["user@example.com"], chunks)
+
+    assert broken.closed
+    assert [c for c, _ in pool._idle] == [fresh]
@@ -0,0 +1,271 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file implements lightweight request tracing: a request ID propagated with contextvars,
+# timed spans around slow calls (Gemini, Sheets, Drive, Slides, Chat, SMTP), an in-process
+# ring buffer of finished spans and an optional OTLP/HTTP exporter.
+
+# tracing.py
+
+import collections
+import contextvars
+import functools
+import logging
+import os
+import random
+import threading
+import time
+
+# --- Configuration ---
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+# Serves the ring buffer at /debug/traces. Spans contain event details and the endpoint has no
+# authentication, so it stays off unless the service is only reachable internally.
+DEBUG_TRACES_ENABLED = os.environ.get('DEBUG_TRACES_ENABLED', 'false').lower() == 'true'
+# Number of finished spans kept in memory for /debug/traces.
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', 2000))
+# OTLP/HTTP traces endpoint of a collector, e.g. http://localhost:4318/v1/traces. Empty disables export.
+TRACING_OTLP_ENDPOINT = os.environ.get('TRACING_OTLP_ENDPOINT', '')
+TRACING_OTLP_FLUSH_SECONDS = float(os.environ.get('TRACING_OTLP_FLUSH_SECONDS', 5))
+TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'ai-agent-blueprint')
+
+# ID of the request being handled; also the trace ID of its spans.
+_request_id = contextvars.ContextVar('request_id', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_finished_spans = collections.deque(maxlen=TRACE_BUFFER_SIZE)
+_exporter = None
+
+def _new_id(bits):
+    """Returns a random hex ID. Cheaper than uuid4, which reads from os.urandom."""
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+def current_request_id():
+    """Returns the ID of the request being handled in this context, or None."""
+    return _request_id.get()
+
+class Span:
+    """A timed operation within a request. Created by span(); finished when the block exits."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class _NoopSpan:
+    """Returned by span() when tracing is disabled; every operation does nothing."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class _SpanScope:
+    """Context manager that makes a span current for the duration of a block."""
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.end_ns = time.time_ns()
+        if exc is not None:
+            span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        _finished_spans.append(span)
+        if _exporter is not None:
+            _exporter.add(span)
+        return False
+
+def span(name, **attributes):
+    """
+    Times a block as a span of the current request: `with span("sheets.fetch"): ...`.
+    Outside a request, the span starts a trace of its own.
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = _request_id.get() or _new_id(128), None
+    return _SpanScope(Span(name, trace_id, parent_id, attributes))
+
+def traced(name=None):
+    """Decorator that runs the function inside a span named `name` (default: its qualified name)."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class _RequestScope:
+    """Sets a new request ID for a block and, with tracing enabled, opens its root span."""
+    __slots__ = ("name", "attributes", "_token", "_scope")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        request_id = _new_id(128)
+        self._token = _request_id.set(request_id)
+        self._scope = None
+        if not TRACING_ENABLED:
+            return _NOOP_SPAN
+        self._scope = _SpanScope(Span(self.name, request_id, None, self.attributes))
+        return self._scope.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._scope is not None:
+            self._scope.__exit__(exc_type, exc, tb)
+        _request_id.reset(self._token)
+        return False
+
+def start_request(name, **attributes):
+    """
+    Marks the handling of one incoming event: `with start_request("chat_event", type=...)`.
+    Work submitted to the background pool from inside the block keeps the request ID and
+    its spans are added to the same trace.
+    """
+    return _RequestScope(name, attributes)
+
+def recent_traces(limit=20):
+    """Returns the spans of the `limit` most recent traces in the ring buffer, newest first."""
+    traces = {}
+    # deque.copy() is atomic, so spans finishing meanwhile cannot break the iteration.
+    for finished in reversed(_finished_spans.copy()):
+        traces.setdefault(finished.trace_id, []).append(finished)
+    result = []
+    for trace_id in list(traces)[:limit]:
+        spans = sorted(traces[trace_id], key=lambda s: s.start_ns)
+        start_ns = spans[0].start_ns
+        end_ns = max(s.end_ns for s in spans)
+        result.append({
+            "trace_id": trace_id,
+            "duration_ms": (end_ns - start_ns) / 1e6,
+            "spans": [s.to_dict() for s in spans]
+        })
+    return result
+
+class OtlpExporter:
+    """
+    Sends finished spans to an OpenTelemetry collector with OTLP/HTTP (JSON encoding).
+    Spans are batched and posted by a daemon thread every TRACING_OTLP_FLUSH_SECONDS,
+    so exporting never blocks a request.
+    """
+
+    def __init__(self, endpoint, flush_seconds=TRACING_OTLP_FLUSH_SECONDS, max_batch=512):
+        self.endpoint = endpoint
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self._pending = collections.deque(maxlen=max_batch * 8)
+        self._wake = threading.Event()
+        self._session = None
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def add(self, finished):
+        self._pending.append(finished)
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                self._post(batch)
+
+    def _post(self, batch):
+        try:
+            if self._session is None:
+                from http_client import build_session
+                self._session = build_session(pool_size=1, max_retries=1)
+            response = self._session.post(self.endpoint, json=self._encode(batch))
+            if not response.ok:
+                logging.warning("(tracing.py)[OtlpExporter._post] Collector answered %s", response.status_code)
+        except Exception as e:
+            logging.warning("(tracing.py)[OtlpExporter._post] Could not export %s spans: %s", len(batch), e)
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        return {"key": key, "value": encoded}
+
+    def _encode(self, batch):
+        spans = []
+        for finished in batch:
+            encoded = {
+                "traceId": finished.trace_id,
+                "spanId": finished.span_id,
+                "name": finished.name,
+                "kind": 1,
+                "startTimeUnixNano": str(finished.start_ns),
+                "endTimeUnixNano": str(finished.end_ns),
+                "attributes": [self._attribute(k, v) for k, v in finished.attributes.items()],
+                "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1}
+            }
+            if finished.parent_id:
+                encoded["parentSpanId"] = finished.parent_id
+            spans.append(encoded)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [self._attribute("service.name", TRACING_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}]
+        }]}
+
+if TRACING_ENABLED and TRACING_OTLP_ENDPOINT:
+    _exporter = OtlpExporter(TRACING_OTLP_ENDPOINT)
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID to log records, so log lines can be matched to traces."""
+
+    def filter(self, record):
+        request_id = _request_id.get()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
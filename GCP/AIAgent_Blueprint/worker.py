@@ -0,0 +1,38 @@
+﻿# author: Olivier "Walgierd" Trela
+# version 1.0
+# Last edited: 18.10.2026 r.
+# This file is the entry point for the RQ worker that processes document generation jobs
+# (Form A and Form B) enqueued by the web instances through mail_handler.
+
+# worker.py
+#
+# Usage: GENERATION_QUEUE_ENABLED=true python worker.py
+
+import logging
+from redis import Redis
+from rq import Queue, Worker
+from api_config import configure_external_apis, REDIS_URL
+from mail_handler import GENERATION_QUEUE_NAME
+from log_config import setup_logging
+
+# The job functions live in these modules. Importing them up front means each job
+# does not pay the import cost in the worker.
+import form_handler_A  # noqa: F401
+import form_handler_B_sub_A  # noqa: F401
+import form_handler_B_sub_B  # noqa: F401
+
+# Records are written directly: jobs run in forked processes that exit without atexit hooks,
+# so a background log listener could lose their last records.
+setup_logging(use_queue=False)
+
+def main():
+    """Starts a worker listening on the generation queue."""
+    configure_external_apis()
+    redis_conn = Redis.from_url(REDIS_URL)
+    queue = Queue(GENERATION_QUEUE_NAME, connection=redis_conn)
+    logging.info("(worker.py)[main] Listening on queue '%s'", GENERATION_QUEUE_NAME)
+    # The scheduler is required for the delayed retries configured in mail_handler.
+    Worker([queue], connection=redis_conn).work(with_scheduler=True)
+
+if __name__ == '__main__':
+    main()